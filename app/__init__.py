@@ -4,9 +4,11 @@ Swimming Pool Receipt System - Flask Application (Demo Mode - No Login Required)
 from flask import Flask, g
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
+from app.replica import RoutingSession
 import os
 
-db = SQLAlchemy()
+# Sessions route report reads to the read replica when one is configured
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
 
 
@@ -16,6 +18,7 @@ class DemoUser:
     username = 'demo'
     full_name = '展示用戶'
     role = 'admin'
+    site_id = 1
     is_active = True
     is_authenticated = True
     is_anonymous = False
@@ -54,10 +57,42 @@ def create_app(config_name='default'):
     from app.config import config
     app.config.from_object(config[config_name])
 
+    # Shared template bytecode cache (before jinja_env is created)
+    from app.templating import configure_templates
+    configure_templates(app)
+
     # Initialize extensions
     db.init_app(app)
     login_manager.init_app(app)
 
+    # Apply database engine profiles (SQLite PRAGMAs etc.)
+    from app.database import configure_engines
+    configure_engines(app, db)
+
+    # Read replica routing (SQLALCHEMY_BINDS['replica'])
+    from app.replica import init_replica
+    init_replica(app, db)
+
+    # gzip/br/zstd response compression
+    from app.compression import init_compression
+    init_compression(app)
+
+    # Per-process report snapshot cache
+    from app.services.report_cache import init_report_cache
+    init_report_cache(app)
+
+    # Dashboard KPI counters shared by the workers of a host
+    from app.services.kpi_counters import init_kpi_counters
+    init_kpi_counters(app)
+
+    # Void queue push (SSE) across workers
+    from app.services.void_events import init_void_events
+    init_void_events(app)
+
+    # Logged-in user identities cached per worker (Flask-Login user loader)
+    from app.services.identity_cache import init_identity_cache
+    init_identity_cache(app)
+
     # Demo mode: always return demo user
     @login_manager.user_loader
     def load_user(user_id):
@@ -73,6 +108,10 @@ def create_app(config_name='default'):
     def inject_user():
         return dict(current_user=DemoUser())
 
+    # Multi-pool deployments: ORM queries limited to the site of the request's user
+    from app.sites import init_sites
+    init_sites(app)
+
     # Register blueprints
     from app.routes.auth import auth_bp
     from app.routes.receipt import receipt_bp
@@ -81,6 +120,8 @@ def create_app(config_name='default'):
     from app.routes.void import void_bp
     from app.routes.admin import admin_bp
     from app.routes.main import main_bp
+    from app.routes.job import job_bp
+    from app.routes.api import api_bp
 
     app.register_blueprint(main_bp)
     app.register_blueprint(auth_bp, url_prefix='/auth')
@@ -89,18 +130,27 @@ def create_app(config_name='default'):
     app.register_blueprint(verify_bp, url_prefix='/verify')
     app.register_blueprint(void_bp, url_prefix='/void')
     app.register_blueprint(admin_bp, url_prefix='/admin')
+    app.register_blueprint(job_bp, url_prefix='/jobs')
+    app.register_blueprint(api_bp, url_prefix='/api')
+
+    if app.config.get('PRELOAD_OPTIONAL_MODULES'):
+        from app.services import preload_optional_modules
+        preload_optional_modules(app.config.get('PDF_FONT_PATH'))
 
-    # Create database tables
-    with app.app_context():
-        db.create_all()
-        # Initialize default data
-        from app.services.init_service import init_default_data
-        init_default_data()
+    # CLI commands (flask bootstrap, ...)
+    from app.commands import register_commands
+    register_commands(app)
 
+    # No DDL or seeding here: workers must boot without touching the database.
+    # Run `flask --app run:app bootstrap` once per deploy instead.
     return app
 
 
-# Create app instance for gunicorn (Zeabur default: gunicorn app:app)
-# Use FLASK_ENV environment variable, default to 'production' for cloud deployment
-env = os.environ.get('FLASK_ENV', 'production')
-app = create_app(env)
+def __getattr__(name):
+    """Create the app instance on first access for `gunicorn app:app` (Zeabur default)"""
+    if name == 'app':
+        # Use FLASK_ENV environment variable, default to 'production' for cloud deployment
+        global app
+        app = create_app(os.environ.get('FLASK_ENV', 'production'))
+        return app
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,418 @@
+"""
+CLI Commands - One-shot maintenance tasks (flask --app run:app <command>)
+"""
+import os
+import click
+from app import db
+
+
+def upgrade_schema():
+    """
+    Bring tables created by an earlier release in line with the models
+
+    create_all skips existing tables, so this
+        - adds missing nullable columns, and columns that have a server
+          default (e.g. site_id,
+          which assigns existing rows to the default site; PostgreSQL
+          checks its foreign key, so that site must already exist),
+        - drops and recreates derived tables (info 'rebuildable') whose
+          columns or primary key changed,
+        - recreates indexes whose uniqueness changed.
+    Anything else needs a manual migration.
+
+    Returns:
+        set of (table name, column name) of the added columns
+    """
+    from sqlalchemy import inspect
+
+    dialect = db.engine.dialect
+    preparer = dialect.identifier_preparer
+    translate = db.engine.get_execution_options().get('schema_translate_map') or {}
+    added = set()
+
+    with db.engine.begin() as connection:
+        inspector = inspect(connection)
+        for table in db.metadata.sorted_tables:
+            schema = translate.get(table.schema, table.schema)
+            if not inspector.has_table(table.name, schema=schema):
+                continue
+            name = preparer.quote(table.name)
+            if schema:
+                name = f'{preparer.quote_schema(schema)}.{name}'
+
+            existing = {column['name'] for column in inspector.get_columns(table.name, schema=schema)}
+            primary_key = inspector.get_pk_constraint(table.name, schema=schema)['constrained_columns']
+            if table.info.get('rebuildable') and (
+                    existing != set(table.columns.keys())
+                    or set(primary_key) != set(table.primary_key.columns.keys())):
+                table.drop(connection)
+                table.create(connection)
+                continue
+
+            for column in table.columns:
+                if column.name in existing or (column.server_default is None and not column.nullable):
+                    continue
+                ddl = (f'ALTER TABLE {name} ADD COLUMN {preparer.quote(column.name)} '
+                       f'{column.type.compile(dialect)}')
+                if column.server_default is not None:
+                    ddl += f' DEFAULT {column.server_default.arg}'
+                if not column.nullable:
+                    ddl += ' NOT NULL'
+                # SQLite only adds REFERENCES columns whose default is NULL
+                foreign_key = next(iter(column.foreign_keys), None)
+                if foreign_key is not None and dialect.name != 'sqlite':
+                    ddl += (f' REFERENCES {preparer.quote(foreign_key.column.table.name)} '
+                            f'({preparer.quote(foreign_key.column.name)})')
+                connection.exec_driver_sql(ddl)
+                added.add((table.name, column.name))
+
+            unique = {index['name']: bool(index['unique'])
+                      for index in inspector.get_indexes(table.name, schema=schema)}
+            for index in table.indexes:
+                if index.name in unique and unique[index.name] != bool(index.unique):
+                    index.drop(connection)
+                    index.create(connection)
+    return added
+
+
+def bootstrap_database():
+    """Create missing tables, indexes and default data (idempotent)"""
+    from flask import current_app
+    from sqlalchemy.exc import IntegrityError
+    from app.models import ReceiptEvent, SalesCube, Site
+    from app.services.init_service import init_default_data
+    from app.services.sales_cube_service import SalesCubeService
+    db.create_all()
+    # Owner of rows created before sites existed (referenced by the site_id
+    # columns upgrade_schema adds); counters pull the others
+    Site.ensure_default(current_app.config.get('RECEIPT_PREFIX', 'SWIM'))
+    added = upgrade_schema()
+    if ('receipt_events', 'site_id') in added:
+        # Events written before they had a site: take their receipt's
+        ReceiptEvent.backfill_sites()
+    # create_all skips existing tables: add indexes declared after they were created
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(db.engine, checkfirst=True)
+            except IntegrityError:
+                # Unique index over rows written before it existed: leave it to the operator
+                current_app.logger.warning('Index %s not created: %s has duplicate rows',
+                                           index.name, table.name)
+    # A counter gets users and fee items from the central database on its first sync
+    if not current_app.config.get('COUNTER_MODE'):
+        init_default_data()
+    # New (or recreated) sales cube: fill it from the existing receipts
+    if SalesCube.query.first() is None:
+        SalesCubeService.rebuild()
+
+
+def register_commands(app):
+    """Register CLI commands on the application"""
+
+    @app.cli.command('bootstrap')
+    @click.option('--skip-templates', is_flag=True,
+                  help='Do not precompile templates into the bytecode cache')
+    def bootstrap_command(skip_templates):
+        """Create missing tables and default data. Run once per deploy."""
+        bootstrap_database()
+        click.echo('Database bootstrap complete.')
+
+        counters = app.extensions.get('kpi_counters')
+        if counters is not None:
+            # Seed the dashboard counters shared by the workers about to start
+            counters.reseed()
+
+        if not skip_templates and app.jinja_env.bytecode_cache is not None:
+            from app.templating import precompile_templates
+            count = precompile_templates(app)
+            click.echo(f'Precompiled {count} templates.')
+
+    @app.cli.command('jobs-worker')
+    @click.option('--threads', default=2, show_default=True, help='Concurrent jobs')
+    @click.option('--nice', default=10, show_default=True,
+                  help='CPU niceness so counter traffic keeps priority')
+    def jobs_worker_command(threads, nice):
+        """Run background jobs (exports, report PDFs) until interrupted."""
+        from app.services.job_service import start_worker_threads
+
+        if nice and hasattr(os, 'nice'):
+            os.nice(nice)
+
+        stop_event = start_worker_threads(app, threads)
+        click.echo(f'Job worker running with {threads} thread(s).')
+        try:
+            while not stop_event.wait(1):
+                pass
+        except KeyboardInterrupt:
+            stop_event.set()
+
+    @app.cli.command('replica-refresh')
+    def replica_refresh_command():
+        """Copy the SQLite database into the SQLite read replica (stand-in for replication)."""
+        import sqlite3
+        from app.replica import REPLICA_BIND
+
+        replica = db.engines.get(REPLICA_BIND)
+        if replica is None:
+            raise click.ClickException('REPLICA_DATABASE_URL is not set.')
+        if db.engine.dialect.name != 'sqlite' or replica.dialect.name != 'sqlite':
+            raise click.ClickException('replica-refresh only copies SQLite to SQLite; '
+                                       'use PostgreSQL streaming replication instead.')
+
+        # Online backup into the existing file: open replica connections see the new data
+        source = sqlite3.connect(db.engine.url.database)
+        target = sqlite3.connect(replica.url.database)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        click.echo(f'Replica refreshed: {replica.url.database}')
+
+    @app.cli.command('archive-receipts')
+    @click.option('--before', 'before', default=None,
+                  help='Archive months before YYYY-MM (default: keep ARCHIVE_HOT_MONTHS hot)')
+    @click.option('--dry-run', is_flag=True, help='List closed months without moving data')
+    def archive_receipts_command(before, dry_run):
+        """Move receipts of closed, settled months to the archive tables."""
+        from datetime import date
+        from app.services.archive_service import ArchiveService, shift_month
+        from app.timezone import today_tw
+
+        if before:
+            try:
+                year, month = (int(part) for part in before.split('-'))
+                cutoff = date(year, month, 1)
+            except ValueError:
+                raise click.BadParameter('expected YYYY-MM', param_hint='--before')
+        else:
+            today = today_tw()
+            year, month = shift_month(today.year, today.month,
+                                      -app.config.get('ARCHIVE_HOT_MONTHS', 3))
+            cutoff = date(year, month, 1)
+
+        periods = ArchiveService.closed_periods(cutoff)
+        if not periods:
+            click.echo('No closed months to archive.')
+            return
+
+        for year, month in periods:
+            if dry_run:
+                click.echo(f'{year:04d}-{month:02d}: closed')
+                continue
+            moved = ArchiveService.archive_period(year, month)
+            click.echo(f'{year:04d}-{month:02d}: archived {moved} receipt(s)')
+
+    @app.cli.command('counter-sync')
+    @click.option('--once', is_flag=True, help='Run a single sync round and exit')
+    @click.option('--conflicts', 'show_conflicts', is_flag=True,
+                  help='List receipts that conflict with the central database')
+    def counter_sync_command(once, show_conflicts):
+        """Push receipts issued offline by this counter to the central database."""
+        import time
+        from sqlalchemy.exc import SQLAlchemyError
+        from app.models import CounterOutbox
+        from app.services.counter_sync_service import CounterSyncService
+
+        if not app.config.get('COUNTER_MODE'):
+            raise click.ClickException('COUNTER_MODE is not enabled.')
+        if not app.config.get('COUNTER_CENTRAL_DATABASE_URL'):
+            raise click.ClickException('COUNTER_CENTRAL_DATABASE_URL is not set.')
+
+        if show_conflicts:
+            entries = CounterOutbox.query.filter_by(
+                status=CounterOutbox.STATUS_CONFLICT
+            ).order_by(CounterOutbox.id).all()
+            for entry in entries:
+                click.echo(f'{entry.receipt_no}: {entry.detail}')
+            click.echo(f'{len(entries)} conflict(s).')
+            return
+
+        service = CounterSyncService.from_app(app)
+        if once:
+            stats = service.sync_once()
+            click.echo(f"Synced {stats['synced']} receipt(s), {stats['conflicts']} conflict(s), "
+                       f"{stats['blocks']} new number block(s).")
+            return
+
+        interval = app.config.get('COUNTER_SYNC_INTERVAL', 5.0)
+        click.echo(f"Counter {app.config['COUNTER_ID']} syncing every {interval:g}s.")
+        try:
+            while True:
+                try:
+                    stats = service.sync_once()
+                    if stats['synced'] or stats['conflicts'] or stats['blocks']:
+                        app.logger.info('Counter sync: %s', stats)
+                except (SQLAlchemyError, OSError) as e:
+                    # Central database unreachable: receipts stay pending locally
+                    db.session.rollback()
+                    app.logger.warning('Counter sync failed, retrying in %gs: %s', interval, e)
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+
+    @app.cli.command('import-receipts')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--chunk-size', default=None, type=int,
+                  help='Rows per transaction (default IMPORT_CHUNK_SIZE)')
+    @click.option('--unverified', is_flag=True,
+                  help='Import receipts as unverified unless the file has a verified column')
+    @click.option('--checkpoint', default=None, help='Progress file (default PATH.checkpoint.json)')
+    @click.option('--rejects', default=None, help='Invalid rows (default PATH.rejects.csv)')
+    def import_receipts_command(path, chunk_size, unverified, checkpoint, rejects):
+        """Bulk load historical receipts from a CSV/XLSX file (resumable)."""
+        from app.services.import_service import ReceiptImporter
+
+        if app.config.get('COUNTER_MODE'):
+            raise click.ClickException('Import into the central database, not a counter.')
+
+        importer = ReceiptImporter(
+            path, chunk_size=chunk_size or app.config.get('IMPORT_CHUNK_SIZE', 5000),
+            verified=not unverified, checkpoint_path=checkpoint, rejects_path=rejects
+        )
+        resumed = importer.load_checkpoint()
+        if resumed:
+            click.echo(f'Resuming after row {resumed.rows}.')
+
+        def progress(stats):
+            click.echo(f'{stats.rows:>9,} rows  imported {stats.imported:,}  '
+                       f'duplicates {stats.duplicates:,}  rejected {stats.rejected:,}  '
+                       f'{stats.rows_per_second:,.0f} rows/s')
+
+        try:
+            stats = importer.run(progress)
+        except RuntimeError as e:
+            raise click.ClickException(str(e))
+
+        counters = app.extensions.get('kpi_counters')
+        if counters is not None:
+            counters.reseed()
+
+        click.echo(f'Done in {stats.elapsed:.1f}s: {stats.imported:,} imported, '
+                   f'{stats.duplicates:,} duplicate(s), {stats.rejected:,} rejected '
+                   f'({stats.rows_per_second:,.0f} rows/s).')
+        if stats.rejected:
+            click.echo(f'Rejected rows: {importer.rejects_path}')
+
+    def sqlite_database_path():
+        """File of the primary SQLite database (backups work on the file)"""
+        from app.database import is_sqlite_memory
+
+        if db.engine.dialect.name != 'sqlite':
+            raise click.ClickException('SQLite only; back up PostgreSQL with pg_basebackup '
+                                       'and WAL archiving.')
+        if is_sqlite_memory(db.engine.url):
+            raise click.ClickException('An in-memory database cannot be backed up.')
+        return db.engine.url.database
+
+    @app.cli.command('backup-database')
+    @click.option('--dir', 'backup_dir', default=None, help='Backup directory (default BACKUP_DIR)')
+    @click.option('--pages', default=None, type=int,
+                  help='Pages per step (default BACKUP_STEP_PAGES; -1 copies in one step)')
+    def backup_database_command(backup_dir, pages):
+        """Online backup of the SQLite database; receipts keep being issued meanwhile."""
+        from app.services.backup_service import backup_snapshot
+
+        path, stats = backup_snapshot(
+            sqlite_database_path(), backup_dir or app.config['BACKUP_DIR'],
+            pages=pages or app.config.get('BACKUP_STEP_PAGES', 256),
+            sleep=app.config.get('BACKUP_STEP_SLEEP', 0.005),
+            keep=app.config.get('BACKUP_KEEP', 7),
+            archive_path=app.config.get('ARCHIVE_SQLITE_PATH')
+        )
+        click.echo(f"Backup written: {path} ({stats['pages']:,} pages, {stats['steps']} steps, "
+                   f"{stats['restarts']} restart(s), {stats['seconds']:.2f}s)")
+
+    @app.cli.command('wal-ship')
+    @click.option('--dir', 'backup_dir', default=None, help='Backup directory (default BACKUP_DIR)')
+    def wal_ship_command(backup_dir):
+        """Continuously copy committed WAL frames into the backup directory."""
+        import time
+        from app.services.backup_service import BackupError, WalShipper
+
+        shipper = WalShipper(
+            sqlite_database_path(), backup_dir or app.config['BACKUP_DIR'],
+            pages=app.config.get('BACKUP_STEP_PAGES', 256),
+            sleep=app.config.get('BACKUP_STEP_SLEEP', 0.005),
+            rotate_bytes=app.config.get('WAL_SHIP_ROTATE_BYTES', 16 * 1024 * 1024),
+            keep_generations=app.config.get('WAL_SHIP_KEEP_GENERATIONS', 3)
+        )
+        interval = app.config.get('WAL_SHIP_INTERVAL', 5.0)
+        try:
+            generation = shipper.start_generation()
+        except BackupError as e:
+            raise click.ClickException(str(e))
+        click.echo(f'Shipping WAL every {interval:g}s into generation {generation}.')
+        try:
+            while True:
+                time.sleep(interval)
+                try:
+                    shipped = shipper.ship()
+                    if shipped:
+                        app.logger.info('WAL shipped: %d bytes (segment %d)', shipped, shipper.segments)
+                except BackupError as e:
+                    app.logger.warning('WAL shipping broken, new generation: %s', e)
+                    shipper.close()
+                    shipper.start_generation()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            shipper.close()
+
+    @app.cli.command('restore-database')
+    @click.argument('output', required=False)
+    @click.option('--to', 'target', default=None,
+                  help="Point in time 'YYYY-MM-DD HH:MM[:SS]' (Taiwan time; default latest)")
+    @click.option('--dir', 'backup_dir', default=None, help='Backup directory (default BACKUP_DIR)')
+    @click.option('--list', 'list_points', is_flag=True, help='List the available restore points')
+    def restore_database_command(output, target, backup_dir, list_points):
+        """Rebuild the database as of a point in time into a new file OUTPUT."""
+        from datetime import datetime
+        from app.services.backup_service import BackupError, restore_database, restore_points
+
+        backup_dir = backup_dir or app.config['BACKUP_DIR']
+        if list_points:
+            for point, description in restore_points(backup_dir):
+                click.echo(f'{point:%Y-%m-%d %H:%M:%S}  {description}')
+            return
+        if not output:
+            raise click.UsageError('Missing argument OUTPUT.')
+
+        when = None
+        if target:
+            for pattern in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M'):
+                try:
+                    when = datetime.strptime(target, pattern)
+                    break
+                except ValueError:
+                    continue
+            else:
+                raise click.BadParameter("expected 'YYYY-MM-DD HH:MM[:SS]'", param_hint='--to')
+
+        try:
+            result = restore_database(backup_dir, output, when)
+        except BackupError as e:
+            raise click.ClickException(str(e))
+        click.echo(f"Restored {output} as of {result['restored_at']:%Y-%m-%d %H:%M:%S} "
+                   f"from {result['source']} + {result['segments']} WAL segment(s).")
+        click.echo('Stop the app, then move it over the database file (remove its -wal/-shm).')
+
+    @app.cli.command('rebuild-sales-cube')
+    @click.option('--month', 'period', default=None, help='Rebuild only YYYY-MM (default: all)')
+    def rebuild_sales_cube_command(period):
+        """Recompute the hourly/weekday sales cube from the receipts."""
+        import time
+        from app.services.sales_cube_service import SalesCubeService
+
+        year = month = None
+        if period:
+            try:
+                year, month = (int(part) for part in period.split('-'))
+            except ValueError:
+                raise click.BadParameter('expected YYYY-MM', param_hint='--month')
+
+        start = time.perf_counter()
+        cells, receipts = SalesCubeService.rebuild(year, month)
+        click.echo(f'Sales cube: {receipts:,} receipt(s) in {cells:,} cell(s) '
+                   f'({time.perf_counter() - start:.2f}s).')
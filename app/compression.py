@@ -0,0 +1,146 @@
+"""
+Response Compression - gzip/br/zstd negotiated by Accept-Encoding
+
+Brotli and zstd are used only when their optional packages (Brotli,
+zstandard) are installed; gzip is always available.
+"""
+import zlib
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # Optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # Optional dependency
+    zstandard = None
+
+
+class GzipEncoder:
+    """Incremental gzip stream (flushes after every chunk)"""
+    name = 'gzip'
+
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class BrotliEncoder:
+    """Incremental Brotli stream"""
+    name = 'br'
+
+    def __init__(self, level):
+        self._compressor = brotli.Compressor(quality=min(level, 11))
+
+    def compress(self, data):
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class ZstdEncoder:
+    """Incremental zstd stream"""
+    name = 'zstd'
+
+    def __init__(self, level):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data) + \
+            self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+def available_encoders():
+    """Encoders usable in this process, in server preference order"""
+    encoders = []
+    if brotli is not None:
+        encoders.append(BrotliEncoder)
+    if zstandard is not None:
+        encoders.append(ZstdEncoder)
+    encoders.append(GzipEncoder)
+    return encoders
+
+
+def _compress_stream(chunks, encoder):
+    """Compress a streamed body chunk by chunk, closing the source at the end"""
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = encoder.compress(chunk)
+            if data:
+                yield data
+        yield encoder.finish()
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+def init_compression(app):
+    """
+    Compress responses of the application
+
+    Settings:
+        COMPRESS_ENABLED            turn the layer on/off
+        COMPRESS_MIMETYPES          compressible mimetypes (PDF/XLSX are not)
+        COMPRESS_MIN_SIZE           smallest body (bytes) worth compressing;
+                                    streamed bodies are always compressed
+        COMPRESS_LEVEL              level per encoding name
+        COMPRESS_EXCLUDE_BLUEPRINTS blueprints whose responses are never compressed
+    """
+    encoders = available_encoders()
+
+    @app.after_request
+    def compress_response(response):
+        config = app.config
+        if not config.get('COMPRESS_ENABLED', True):
+            return response
+        if request.blueprint in config.get('COMPRESS_EXCLUDE_BLUEPRINTS', ()):
+            return response
+        if response.mimetype not in config.get('COMPRESS_MIMETYPES', ()):
+            return response
+        # File responses (send_file) and already-encoded bodies are sent as-is
+        if response.direct_passthrough or 'Content-Encoding' in response.headers:
+            return response
+        if response.status_code < 200 or response.status_code in (204, 206, 304):
+            return response
+
+        # The representation depends on Accept-Encoding whether or not we compress
+        response.vary.add('Accept-Encoding')
+
+        names = [encoder.name for encoder in encoders]
+        best = request.accept_encodings.best_match(names)
+        if best is None:
+            return response
+        encoder_class = encoders[names.index(best)]
+        encoder = encoder_class(config.get('COMPRESS_LEVEL', {}).get(best, 6))
+
+        if response.is_streamed:
+            response.response = _compress_stream(response.response, encoder)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < config.get('COMPRESS_MIN_SIZE', 500):
+                return response
+            response.set_data(encoder.compress(data) + encoder.finish())
+
+        response.headers['Content-Encoding'] = best
+
+        # A strong ETag names one exact byte sequence: make it per encoding
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(f'{etag}-{best}', weak=weak)
+
+        return response
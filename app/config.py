@@ -2,11 +2,56 @@
 Application Configuration
 """
 import os
+import platform
+import tempfile
 from datetime import timedelta
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 
 
+def postgres_engine_options():
+    """
+    SQLAlchemy engine options for PostgreSQL (psycopg2)
+
+    Each gunicorn worker holds its own pool, so the server sees up to
+    workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections.
+    """
+    return {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 5)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),  # Seconds
+        'pool_pre_ping': True,  # Drop connections closed by the server or a proxy
+        'query_cache_size': int(os.environ.get('DB_QUERY_CACHE_SIZE', 1200)),  # Compiled statements
+        'executemany_mode': 'values_plus_batch',  # Batched INSERT/UPDATE for bulk writes
+        'insertmanyvalues_page_size': 1000,
+    }
+
+
+def normalize_database_url(url):
+    """
+    Make a DATABASE_URL usable by SQLAlchemy
+
+    Zeabur uses postgres:// but SQLAlchemy requires postgresql://, and the
+    psycopg2 driver shipped in requirements.txt is pinned (newer SQLAlchemy
+    defaults to psycopg 3).
+    """
+    if url and url.startswith('postgres://'):
+        url = url.replace('postgres://', 'postgresql://', 1)
+    if url and url.startswith('postgresql://'):
+        url = url.replace('postgresql://', 'postgresql+psycopg2://', 1)
+    return url
+
+
+def replica_binds():
+    """SQLALCHEMY_BINDS entry for REPLICA_DATABASE_URL (empty if unset)"""
+    url = normalize_database_url(os.environ.get('REPLICA_DATABASE_URL'))
+    if not url:
+        return {}
+    options = postgres_engine_options() if url.startswith('postgresql') else {}
+    return {'replica': dict(options, url=url)}
+
+
 class Config:
     """Base configuration"""
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'swim-receipt-secret-key-2026'
@@ -14,13 +59,132 @@ class Config:
     # SQLAlchemy settings
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Read replica for report/verification reads (see app/replica.py):
+    # a streaming replica, or a SQLite copy refreshed by `flask replica-refresh`
+    SQLALCHEMY_BINDS = replica_binds()
+    REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', 30))  # Seconds; staler replica is skipped
+    REPLICA_CHECK_INTERVAL = 5  # Seconds between lag checks
+    REPLICA_ENDPOINTS = {
+        'report.daily', 'report.monthly', 'report.monthly_print',
+        'verify.index', 'verify.operator_detail', 'verify.payment_list',
+        'receipt.search', 'api.changes', 'report.heatmap', 'api.sales_cube',
+    }
+
+    # SQLite engine profile (see app/database.py): 'wal' or 'default'
+    SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE', 'wal')
+    SQLITE_PRAGMAS = {}  # Per-deployment PRAGMA overrides
+    SQLITE_CHECKPOINT_INTERVAL = int(os.environ.get('SQLITE_CHECKPOINT_INTERVAL', 300))  # Seconds
+
     # Session settings
     PERMANENT_SESSION_LIFETIME = timedelta(hours=8)
 
     # Application settings
-    RECEIPT_PREFIX = 'SWIM'
+    RECEIPT_PREFIX = os.environ.get('RECEIPT_PREFIX', 'SWIM')  # Default site; a counter: its site's prefix
     ITEMS_PER_PAGE = 20
 
+    # Import ReportLab/openpyxl at app creation instead of on first use
+    PRELOAD_OPTIONAL_MODULES = os.environ.get('PRELOAD_OPTIONAL_MODULES', '') == '1'
+
+    # Chinese TTF/TTC font for receipt PDFs, tried before the built-in list
+    PDF_FONT_PATH = os.environ.get('PDF_FONT_PATH')
+
+    # Thermal receipt printers (ESC/POS, see app/services/escpos_service.py):
+    # each site's printer is set in the site admin page; PRINTER_URL
+    # (tcp://host:9100 or a device/file path) serves the default site
+    # when it has none. The app host sends to the printer itself.
+    PRINTER_URL = os.environ.get('PRINTER_URL')
+    PRINTER_WIDTH = int(os.environ.get('PRINTER_WIDTH', 576))  # Dots: 576 for 80 mm paper, 384 for 58 mm
+    PRINTER_CODE = os.environ.get('PRINTER_CODE', 'qr')  # Receipt number as 'qr', 'barcode' or ''
+    PRINTER_AUTO_PRINT = os.environ.get('PRINTER_AUTO_PRINT', '') == '1'  # Print on issue
+    PRINTER_TIMEOUT = 5.0  # Seconds to reach a network printer
+
+    # Rows fetched per round trip when streaming large report/export queries
+    REPORT_YIELD_PER = 1000
+
+    # Report snapshot cache: in-process LRU, plus a disk tier shared by
+    # workers when REPORT_CACHE_DIR is set
+    REPORT_CACHE_SIZE = 64
+    REPORT_CACHE_DIR = os.environ.get('REPORT_CACHE_DIR')
+    REPORT_CACHE_DISK_ENTRIES = 256
+
+    # Compiled Jinja templates shared by all workers on the host ('' disables)
+    TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR',
+                                        os.path.join(tempfile.gettempdir(), 'swim-templates'))
+
+    # Response compression (gzip; br/zstd when Brotli/zstandard are installed)
+    COMPRESS_ENABLED = os.environ.get('COMPRESS_ENABLED', '1') == '1'
+    COMPRESS_MIMETYPES = {'text/html', 'text/css', 'text/plain', 'text/csv',
+                          'text/javascript', 'application/json', 'image/svg+xml'}
+    COMPRESS_MIN_SIZE = 500  # Bytes; smaller bodies are sent as-is
+    COMPRESS_LEVEL = {'gzip': 6, 'br': 4, 'zstd': 3}
+    COMPRESS_EXCLUDE_BLUEPRINTS = {'job'}  # Job downloads are XLSX/PDF (already compressed)
+
+    # Receipt change feed (/api/changes): events per response
+    CHANGES_PAGE_SIZE = 1000
+    CHANGES_MAX_PAGE_SIZE = 10000
+
+    # Dashboard KPIs (/api/kpi): counters in a memory-mapped file shared by
+    # the workers of a host (default: one file per database in the temp dir),
+    # re-seeded from the database periodically
+    KPI_COUNTERS_PATH = os.environ.get('KPI_COUNTERS_PATH')
+    KPI_RESEED_INTERVAL = 300  # Seconds
+    KPI_POLL_SECONDS = 5  # Dashboard refresh
+
+    # Void queue push (/void/events, Server-Sent Events). Streams stay open
+    # only on threaded workers (gthread, dev server), each holding a thread;
+    # otherwise the page reconnects every VOID_EVENTS_POLL_SECONDS.
+    VOID_EVENTS_SOCKET_DIR = os.environ.get('VOID_EVENTS_SOCKET_DIR')  # Default: per database in the temp dir
+    VOID_EVENTS_STREAM_SECONDS = 300  # Longest stream before the browser reconnects
+    VOID_EVENTS_HEARTBEAT = 15  # Seconds between keep-alive comments
+    VOID_EVENTS_MAX_STREAMS = int(os.environ.get('VOID_EVENTS_MAX_STREAMS', 2))  # Per worker process
+    VOID_EVENTS_POLL_SECONDS = 15
+
+    # Seconds a worker reuses a logged-in user's identity (role, name,
+    # active flag) before reloading it; edits in the admin pages apply at once
+    IDENTITY_CACHE_TTL = 60
+
+    # Seconds a worker reuses a site's name and receipt prefix; edits in
+    # the site admin page apply at once on this host
+    SITE_CACHE_TTL = 60
+
+    # Characters per chunk of streamed report pages
+    STREAM_BUFFER_SIZE = 8192
+
+    # Receipt archival (flask archive-receipts)
+    ARCHIVE_HOT_MONTHS = 3  # Months before the current one that always stay hot
+    ARCHIVE_SQLITE_PATH = os.environ.get('ARCHIVE_SQLITE_PATH')  # SQLite: separate archive file
+
+    # Historical receipt import (flask import-receipts): rows per transaction
+    IMPORT_CHUNK_SIZE = 5000
+
+    # Offline counter mode: receipts are committed to this app's local
+    # database with pre-allocated numbers and pushed to the central
+    # database by `flask counter-sync` (see app/services/counter_sync_service.py)
+    COUNTER_MODE = os.environ.get('COUNTER_MODE', '') == '1'
+    COUNTER_ID = os.environ.get('COUNTER_ID') or platform.node() or 'counter'
+    COUNTER_CENTRAL_DATABASE_URL = os.environ.get('COUNTER_CENTRAL_DATABASE_URL')
+    COUNTER_BLOCK_SIZE = int(os.environ.get('COUNTER_BLOCK_SIZE', 200))  # Numbers per block
+    COUNTER_BLOCK_DAYS = 2  # Keep blocks for today and the following days
+    COUNTER_SYNC_BATCH = 200  # Receipts per central transaction
+    COUNTER_SYNC_INTERVAL = 5.0  # Seconds between sync rounds
+
+    # Background jobs (exports, report PDFs); results are stored in the database
+    JOB_POLL_INTERVAL = 1.0  # Seconds between queue polls when idle
+    JOB_HEARTBEAT_INTERVAL = 30  # Seconds between heartbeats of a running job
+    JOB_TIMEOUT = 300  # Seconds without a heartbeat before a running job is considered abandoned
+    JOB_MAX_ATTEMPTS = 3  # Claims before a job that keeps losing its worker is marked failed
+    JOB_RESULT_TTL = 86400  # Seconds to keep finished jobs and their results
+
+    # SQLite backups: flask backup-database / wal-ship / restore-database
+    # (see app/services/backup_service.py); keep BACKUP_DIR on a durable disk
+    BACKUP_DIR = os.environ.get('BACKUP_DIR') or os.path.join(basedir, '..', 'data', 'backups')
+    BACKUP_STEP_PAGES = 256  # Pages copied per backup step
+    BACKUP_STEP_SLEEP = 0.005  # Seconds between steps
+    BACKUP_KEEP = int(os.environ.get('BACKUP_KEEP', 7))  # Snapshots kept
+    WAL_SHIP_INTERVAL = float(os.environ.get('WAL_SHIP_INTERVAL', 5.0))  # Seconds between segments
+    WAL_SHIP_ROTATE_BYTES = 16 * 1024 * 1024  # WAL size at which the shipper lets SQLite restart it
+    WAL_SHIP_KEEP_GENERATIONS = 3
+
 
 class DevelopmentConfig(Config):
     """Development configuration"""
@@ -34,19 +198,21 @@ class ProductionConfig(Config):
     DEBUG = False
 
     # Get DATABASE_URL from environment (Zeabur PostgreSQL)
-    # Zeabur uses postgres:// but SQLAlchemy requires postgresql://
-    _database_url = os.environ.get('DATABASE_URL')
-    if _database_url and _database_url.startswith('postgres://'):
-        _database_url = _database_url.replace('postgres://', 'postgresql://', 1)
+    _database_url = normalize_database_url(os.environ.get('DATABASE_URL'))
 
     # Use PostgreSQL if DATABASE_URL is set, otherwise fallback to SQLite
     SQLALCHEMY_DATABASE_URI = _database_url or 'sqlite:////tmp/swim.db'
 
+    if SQLALCHEMY_DATABASE_URI.startswith('postgresql'):
+        SQLALCHEMY_ENGINE_OPTIONS = postgres_engine_options()
+
 
 class TestingConfig(Config):
     """Testing configuration"""
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    SQLALCHEMY_BINDS = {}
+    TEMPLATE_CACHE_DIR = None
 
 
 config = {
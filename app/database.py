@@ -0,0 +1,135 @@
+"""
+Database Engine Profiles - Connection-level tuning per backend
+"""
+import hashlib
+import os
+import tempfile
+import time
+from sqlalchemy import event
+
+
+# SQLite PRAGMA profiles, applied to every new DBAPI connection.
+# 'default' leaves SQLite's own settings untouched (rollback journal, full sync).
+SQLITE_PROFILES = {
+    'default': {},
+    'wal': {
+        'journal_mode': 'WAL',          # Readers no longer block the writer
+        'synchronous': 'NORMAL',        # fsync only at checkpoints in WAL mode
+        'busy_timeout': 5000,           # Wait (ms) for the write lock instead of failing
+        'mmap_size': 268435456,         # 256 MB memory-mapped reads
+        'cache_size': -20000,           # ~20 MB page cache (negative = KiB)
+        'temp_store': 'MEMORY',         # Sort/temp tables for reports in memory
+        'wal_autocheckpoint': 1000,     # Pages before SQLite checkpoints on commit
+    },
+}
+
+
+def is_sqlite_memory(url):
+    """Check if a SQLAlchemy URL points at an in-memory SQLite database"""
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def shared_state_path(app, name):
+    """
+    Temp-dir path for state shared by the workers of this host
+
+    The path includes a hash of the database URL, so apps on different
+    databases (tests, benchmarks, counters) never share state.
+    """
+    uri = str(app.config.get('SQLALCHEMY_DATABASE_URI'))
+    digest = hashlib.sha1(uri.encode('utf-8')).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), f'swim-{name}-{digest}')
+
+
+def configure_sqlite(app, engine):
+    """
+    Apply the configured SQLite profile to an engine
+
+    Args:
+        app: Flask application (reads SQLITE_PROFILE, SQLITE_PRAGMAS,
+             SQLITE_CHECKPOINT_INTERVAL)
+        engine: SQLAlchemy engine bound to a SQLite database
+    """
+    profile_name = app.config.get('SQLITE_PROFILE', 'default')
+    if profile_name not in SQLITE_PROFILES:
+        raise ValueError(f'Unknown SQLITE_PROFILE: {profile_name}')
+
+    pragmas = dict(SQLITE_PROFILES[profile_name])
+    pragmas.update(app.config.get('SQLITE_PRAGMAS') or {})
+
+    # WAL needs a shared file; in-memory databases keep their journal
+    if is_sqlite_memory(engine.url):
+        pragmas.pop('journal_mode', None)
+        pragmas.pop('mmap_size', None)
+        pragmas.pop('wal_autocheckpoint', None)
+
+    if not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
+
+    interval = app.config.get('SQLITE_CHECKPOINT_INTERVAL') or 0
+    if interval > 0 and pragmas.get('journal_mode', '').upper() == 'WAL':
+        state = {'last': time.monotonic()}
+
+        @event.listens_for(engine, 'checkin')
+        def checkpoint_wal(dbapi_connection, connection_record):
+            # Passive checkpoint: copies what it can without waiting on readers or writers
+            now = time.monotonic()
+            if dbapi_connection is None or now - state['last'] < interval:
+                return
+            state['last'] = now
+            cursor = dbapi_connection.cursor()
+            try:
+                cursor.execute('PRAGMA wal_checkpoint(PASSIVE)')
+            finally:
+                cursor.close()
+
+
+def configure_archive(app, engine):
+    """
+    Map the archive schema placeholder of cold-storage tables
+
+    By default archive tables live in the main database. On SQLite,
+    ARCHIVE_SQLITE_PATH keeps them in a separate file ATTACHed to every
+    connection, so the hot database file stays small.
+    """
+    from app.models.archive import ARCHIVE_SCHEMA
+
+    archive_path = app.config.get('ARCHIVE_SQLITE_PATH')
+    if archive_path and engine.url.get_backend_name() == 'sqlite':
+        journal_mode = SQLITE_PROFILES.get(
+            app.config.get('SQLITE_PROFILE', 'default'), {}
+        ).get('journal_mode')
+
+        @event.listens_for(engine, 'connect')
+        def attach_archive(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            try:
+                cursor.execute(f'ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}', (archive_path,))
+                if journal_mode:
+                    cursor.execute(f'PRAGMA {ARCHIVE_SCHEMA}.journal_mode={journal_mode}')
+            finally:
+                cursor.close()
+
+        translate = {ARCHIVE_SCHEMA: ARCHIVE_SCHEMA}
+    else:
+        translate = {ARCHIVE_SCHEMA: None}
+
+    engine.update_execution_options(schema_translate_map=translate)
+
+
+def configure_engines(app, db):
+    """Apply backend-specific engine profiles for all engines of the app"""
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.url.get_backend_name() == 'sqlite':
+                configure_sqlite(app, engine)
+            configure_archive(app, engine)
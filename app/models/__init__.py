@@ -1,10 +1,20 @@
 """
 Database Models
 """
+from app.models.site import Site
 from app.models.user import User
 from app.models.fee_item import FeeItem
 from app.models.receipt import Receipt
 from app.models.void_request import VoidRequest
 from app.models.payment_record import PaymentRecord
+from app.models.job import Job
+from app.models.report_version import ReportVersion
+from app.models.archive import ArchivedReceipt, ArchivedPeriod
+from app.models.receipt_sequence import ReceiptSequence, ReceiptNumberBlock
+from app.models.counter_outbox import CounterOutbox
+from app.models.receipt_event import ReceiptEvent
+from app.models.sales_cube import SalesCube
 
-__all__ = ['User', 'FeeItem', 'Receipt', 'VoidRequest', 'PaymentRecord']
+__all__ = ['Site', 'User', 'FeeItem', 'Receipt', 'VoidRequest', 'PaymentRecord', 'Job',
+           'ReportVersion', 'ArchivedReceipt', 'ArchivedPeriod', 'ReceiptSequence',
+           'ReceiptNumberBlock', 'CounterOutbox', 'ReceiptEvent', 'SalesCube']
@@ -0,0 +1,98 @@
+"""
+Archive Models - Cold storage for receipts of closed periods
+"""
+from app import db
+from app.models.receipt import Receipt
+from app.models.site import SiteScoped
+from app.sites import DEFAULT_SITE_ID
+from app.timezone import now_tw
+
+
+# Placeholder schema of archive tables. Mapped by app.database to the main
+# database, or to an ATTACHed SQLite file when ARCHIVE_SQLITE_PATH is set.
+ARCHIVE_SCHEMA = 'archive'
+
+
+class ArchivedReceipt(SiteScoped, db.Model):
+    """Receipt moved out of the hot receipts table (same columns and ids)"""
+    __tablename__ = 'receipts_archive'
+    __table_args__ = (
+        db.Index('ix_receipts_archive_receipt_no', 'receipt_no'),
+        db.Index('ix_receipts_archive_operator_created', 'operator_id', 'created_at'),
+        db.Index('ix_receipts_archive_site_created', 'site_id', 'created_at'),
+        # PostgreSQL: one partition per month, created by the archive command
+        {'schema': ARCHIVE_SCHEMA, 'postgresql_partition_by': 'RANGE (created_at)'},
+    )
+
+    # Partitioned tables need the partition key in the primary key
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    created_at = db.Column(db.DateTime, primary_key=True)
+
+    # No foreign key: the archive may live in another database file
+    site_id = db.Column(db.Integer, nullable=False, default=DEFAULT_SITE_ID,
+                        server_default=str(DEFAULT_SITE_ID))
+    receipt_no = db.Column(db.String(30), nullable=False)
+    item_id = db.Column(db.Integer, nullable=False)
+    item_name = db.Column(db.String(100), nullable=False)
+    amount = db.Column(db.Numeric(10, 2), nullable=False)
+    amount_chinese = db.Column(db.String(50))
+    remark = db.Column(db.String(200))
+
+    operator_id = db.Column(db.Integer, nullable=False)
+    operator_name = db.Column(db.String(50), nullable=False)
+
+    status = db.Column(db.String(20), default='active')
+
+    is_verified = db.Column(db.Boolean, default=False)
+    verified_by = db.Column(db.Integer)
+    verified_at = db.Column(db.DateTime)
+
+    void_reason = db.Column(db.String(200))
+    voided_by = db.Column(db.Integer)
+    voided_at = db.Column(db.DateTime)
+
+    # Same status constants and display as hot receipts
+    STATUS_ACTIVE = Receipt.STATUS_ACTIVE
+    STATUS_VOID_PENDING = Receipt.STATUS_VOID_PENDING
+    STATUS_VOIDED = Receipt.STATUS_VOIDED
+
+    status_display = Receipt.status_display
+
+    # Columns copied between receipts and receipts_archive
+    COPY_COLUMNS = [
+        'id', 'created_at', 'receipt_no', 'item_id', 'item_name', 'amount',
+        'amount_chinese', 'remark', 'operator_id', 'operator_name', 'status',
+        'is_verified', 'verified_by', 'verified_at', 'void_reason', 'voided_by',
+        'voided_at', 'site_id'
+    ]
+
+    is_archived = True
+
+    @property
+    def can_void(self):
+        """Archived receipts belong to settled periods"""
+        return False
+
+    def __repr__(self):
+        return f'<ArchivedReceipt {self.receipt_no}>'
+
+
+class ArchivedPeriod(db.Model):
+    """Month whose settled receipts have been moved to the archive"""
+    __tablename__ = 'archived_periods'
+
+    period = db.Column(db.String(7), primary_key=True)  # YYYY-MM
+    receipt_count = db.Column(db.Integer, nullable=False, default=0)
+    archived_at = db.Column(db.DateTime, default=now_tw)
+
+    @classmethod
+    def overlaps(cls, start_date, end_date):
+        """Check if any archived month falls in [start_date, end_date]"""
+        first = start_date.strftime('%Y-%m')
+        last = end_date.strftime('%Y-%m')
+        return db.session.query(
+            cls.query.filter(cls.period >= first, cls.period <= last).exists()
+        ).scalar()
+
+    def __repr__(self):
+        return f'<ArchivedPeriod {self.period}>'
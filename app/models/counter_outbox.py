@@ -0,0 +1,28 @@
+"""
+Counter Outbox Model - Receipts waiting to be synced to the central database
+"""
+from app import db
+from app.timezone import now_tw
+
+
+class CounterOutbox(db.Model):
+    """Receipt issued in counter mode and its sync state (counter's local database)"""
+    __tablename__ = 'counter_outbox'
+
+    STATUS_PENDING = 'pending'
+    STATUS_SYNCED = 'synced'
+    STATUS_CONFLICT = 'conflict'
+
+    id = db.Column(db.Integer, primary_key=True)
+    receipt_id = db.Column(db.Integer, db.ForeignKey('receipts.id'), nullable=False, unique=True)
+    receipt_no = db.Column(db.String(30), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default=STATUS_PENDING, index=True)
+    central_receipt_id = db.Column(db.Integer)
+    detail = db.Column(db.String(500))  # Conflict description
+    created_at = db.Column(db.DateTime, default=now_tw)
+    synced_at = db.Column(db.DateTime)
+
+    receipt = db.relationship('Receipt')
+
+    def __repr__(self):
+        return f'<CounterOutbox {self.receipt_no} {self.status}>'
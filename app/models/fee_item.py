@@ -3,14 +3,20 @@ Fee Item Model - Swimming pool fee items
 """
 from app import db
 from datetime import datetime
+from app.models.site import SiteScoped
 
 
-class FeeItem(db.Model):
-    """Fee item model for swimming pool charges"""
+class FeeItem(SiteScoped, db.Model):
+    """Fee item model for swimming pool charges (catalog of one site)"""
     __tablename__ = 'fee_items'
+    __table_args__ = (
+        # Item codes are unique per site; also serves the active catalog listing
+        db.Index('ix_fee_items_site_code', 'site_id', 'item_code', unique=True),
+        db.Index('ix_fee_items_site_active', 'site_id', 'is_active', 'category', 'sort_order'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    item_code = db.Column(db.String(20), unique=True, nullable=False, index=True)
+    item_code = db.Column(db.String(20), nullable=False, index=True)
     item_name = db.Column(db.String(100), nullable=False)
     category = db.Column(db.String(50))  # Category: admission, pass, course, rental
     identity_type = db.Column(db.String(50))  # Identity: student, staff, external, discount
@@ -0,0 +1,80 @@
+"""
+Job Model - Background jobs (exports, report PDFs)
+"""
+import json
+from app import db
+from app.timezone import now_tw
+
+
+class Job(db.Model):
+    """Background job queued by a request and run by a job worker"""
+    __tablename__ = 'jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_type = db.Column(db.String(50), nullable=False)
+    params = db.Column(db.Text)  # JSON-encoded handler arguments
+
+    status = db.Column(db.String(20), default='pending', nullable=False, index=True)
+    progress = db.Column(db.Integer, default=0)  # Percent complete
+    error = db.Column(db.String(500))
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Claims so far
+    heartbeat_at = db.Column(db.DateTime)  # Last sign of life from the worker running it
+
+    # Finished artifact, kept in the database so any web process can serve it
+    # (job workers may run in another container); loaded only for downloads
+    result_data = db.deferred(db.Column(db.LargeBinary))
+    result_filename = db.Column(db.String(200))
+    result_mimetype = db.Column(db.String(100))
+
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'))
+    created_at = db.Column(db.DateTime, default=now_tw)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    # Relationships
+    creator = db.relationship('User', foreign_keys=[created_by])
+
+    # Status constants
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+
+    # Job type constants
+    TYPE_EXPORT_EXCEL = 'export_excel'
+    TYPE_REPORT_PDF = 'report_pdf'
+
+    @property
+    def status_display(self):
+        """Get status display name in Chinese"""
+        status_names = {
+            self.STATUS_PENDING: '\u6392\u968a\u4e2d',
+            self.STATUS_RUNNING: '\u8655\u7406\u4e2d',
+            self.STATUS_DONE: '\u5df2\u5b8c\u6210',
+            self.STATUS_FAILED: '\u5931\u6557'
+        }
+        return status_names.get(self.status, self.status)
+
+    @property
+    def is_finished(self):
+        """Check if the job will not change any more"""
+        return self.status in (self.STATUS_DONE, self.STATUS_FAILED)
+
+    def get_params(self):
+        """Decode handler arguments"""
+        return json.loads(self.params) if self.params else {}
+
+    def to_dict(self):
+        """Status representation for polling"""
+        return {
+            'id': self.id,
+            'job_type': self.job_type,
+            'status': self.status,
+            'status_display': self.status_display,
+            'progress': self.progress or 0,
+            'error': self.error,
+            'filename': self.result_filename,
+        }
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.job_type} {self.status}>'
@@ -3,12 +3,21 @@ Payment Record Model - Monthly payment records
 """
 from app import db
 from datetime import datetime
+from app.models.site import SiteScoped
 from app.timezone import now_tw
 
 
-class PaymentRecord(db.Model):
+class PaymentRecord(SiteScoped, db.Model):
     """Payment record for monthly settlements"""
     __tablename__ = 'payment_records'
+    __table_args__ = (
+        # Ledger: keyset pages by (received_at, id) within a site, running totals per operator
+        db.Index('ix_payment_records_site_received', 'site_id', 'received_at', 'id'),
+        db.Index('ix_payment_records_operator_received', 'operator_id', 'received_at', 'id'),
+        # One payment per operator and period (SettlementService.settle)
+        db.Index('ix_payment_records_site_operator_period',
+                 'site_id', 'operator_id', 'period_start', 'period_end', unique=True),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     operator_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -1,14 +1,22 @@
 """
 Receipt Model - Swimming pool receipts
 """
+from flask import current_app
 from app import db
 from datetime import datetime, date
-from app.timezone import now_tw, today_tw
+from app.models.site import SiteScoped
+from app.timezone import day_range, now_tw, today_tw
 
 
-class Receipt(db.Model):
+class Receipt(SiteScoped, db.Model):
     """Receipt model for swimming pool charges"""
     __tablename__ = 'receipts'
+    __table_args__ = (
+        # Site-leading: a site's day/month lists and totals never touch other sites' rows
+        db.Index('ix_receipts_site_created', 'site_id', 'created_at'),
+        db.Index('ix_receipts_site_status_created', 'site_id', 'status', 'created_at'),
+        db.Index('ix_receipts_site_operator_created', 'site_id', 'operator_id', 'created_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     receipt_no = db.Column(db.String(30), unique=True, nullable=False, index=True)
@@ -44,26 +52,40 @@ class Receipt(db.Model):
     STATUS_VOID_PENDING = 'void_pending'
     STATUS_VOIDED = 'voided'
 
+    is_archived = False
+
+    @staticmethod
+    def format_receipt_no(prefix, day, seq):
+        """Format a receipt number: PREFIX-YYYYMMDD-XXXX"""
+        return f'{prefix}-{day}-{seq:04d}'
+
     @classmethod
-    def generate_receipt_no(cls, prefix='SWIM'):
-        """Generate unique receipt number: SWIM-YYYYMMDD-XXXX"""
-        today = today_tw()
-        date_str = today.strftime('%Y%m%d')
-        prefix_pattern = f'{prefix}-{date_str}-'
-
-        # Find the last receipt number for today
-        last_receipt = cls.query.filter(
-            cls.receipt_no.like(f'{prefix_pattern}%')
-        ).order_by(cls.receipt_no.desc()).first()
-
-        if last_receipt:
-            # Extract sequence number and increment
-            last_seq = int(last_receipt.receipt_no.split('-')[-1])
-            new_seq = last_seq + 1
+    def generate_receipt_no(cls, prefix=None):
+        """
+        Generate unique receipt number: PREFIX-YYYYMMDD-XXXX
+
+        Numbers come from the central allocator (ReceiptSequence), one
+        sequence per prefix and day, so every site (own prefix) numbers
+        independently. In counter mode they come from the blocks
+        pre-allocated to this counter under RECEIPT_PREFIX, so no central
+        round trip is needed.
+
+        Args:
+            prefix: Receipt number prefix (default: RECEIPT_PREFIX)
+        """
+        from app.models.receipt_sequence import ReceiptSequence, ReceiptNumberBlock
+
+        day = today_tw().strftime('%Y%m%d')
+        if current_app.config.get('COUNTER_MODE'):
+            prefix = current_app.config.get('RECEIPT_PREFIX', 'SWIM')
+            seq = ReceiptNumberBlock.take(current_app.config['COUNTER_ID'], prefix, day)
+            if seq is None:
+                raise ValueError('本櫃台今日收據號碼已用完，請待連線同步後再開立')
         else:
-            new_seq = 1
+            prefix = prefix or current_app.config.get('RECEIPT_PREFIX', 'SWIM')
+            seq = ReceiptSequence.allocate(prefix, day)
 
-        return f'{prefix_pattern}{new_seq:04d}'
+        return cls.format_receipt_no(prefix, day, seq)
 
     @property
     def can_void(self):
@@ -86,9 +108,8 @@ class Receipt(db.Model):
         if target_date is None:
             target_date = today_tw()
 
-        query = cls.query.filter(
-            db.func.date(cls.created_at) == target_date
-        )
+        start, end = day_range(target_date, target_date)
+        query = cls.query.filter(cls.created_at >= start, cls.created_at < end)
 
         if operator_id:
             query = query.filter_by(operator_id=operator_id)
@@ -98,19 +119,14 @@ class Receipt(db.Model):
     @classmethod
     def get_monthly_summary(cls, year, month, operator_id=None):
         """Get monthly summary statistics"""
-        from sqlalchemy import func, and_
         from calendar import monthrange
 
         start_date = date(year, month, 1)
         _, last_day = monthrange(year, month)
         end_date = date(year, month, last_day)
 
-        query = cls.query.filter(
-            and_(
-                func.date(cls.created_at) >= start_date,
-                func.date(cls.created_at) <= end_date
-            )
-        )
+        start, end = day_range(start_date, end_date)
+        query = cls.query.filter(cls.created_at >= start, cls.created_at < end)
 
         if operator_id:
             query = query.filter_by(operator_id=operator_id)
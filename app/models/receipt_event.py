@@ -0,0 +1,140 @@
+"""
+Receipt Event Model - Append-only log of receipt changes (change feed)
+"""
+from sqlalchemy import text
+from app import db
+from app.models.site import SiteScoped
+from app.timezone import now_tw
+
+# Advisory lock key serializing a site's event writers on PostgreSQL
+# (two-key form: EVENT_LOCK_KEY, site_id)
+EVENT_LOCK_KEY = 7301
+
+
+def lock_event_order(session, site_ids):
+    """
+    Take the event order locks of sites until the transaction ends
+
+    PostgreSQL only (SQLite serializes writers already). Sites are locked
+    in id order so writers of several sites cannot deadlock.
+    """
+    if session.get_bind().dialect.name != 'postgresql':
+        return
+    for site_id in sorted(set(site_ids)):
+        session.execute(text('SELECT pg_advisory_xact_lock(:key, :site_id)'),
+                        {'key': EVENT_LOCK_KEY, 'site_id': site_id})
+
+
+class ReceiptEvent(SiteScoped, db.Model):
+    """
+    One change of a receipt, in commit order within its site
+
+    The id is the change feed cursor (/api/changes?since=<id>); like every
+    site-scoped model, a site's feed only holds its own receipts' events.
+    Rows are never updated or deleted; receipt_id has no foreign key so
+    events survive archival of their receipt.
+    """
+    __tablename__ = 'receipt_events'
+    __table_args__ = (
+        # A site's feed after a cursor
+        db.Index('ix_receipt_events_site_cursor', 'site_id', 'id'),
+    )
+
+    TYPE_CREATED = 'created'
+    TYPE_VOID_REQUESTED = 'void_requested'
+    TYPE_VOIDED = 'voided'
+    TYPE_VOID_REJECTED = 'void_rejected'
+    TYPE_VERIFIED = 'verified'
+
+    id = db.Column(db.Integer, primary_key=True)
+    event_type = db.Column(db.String(20), nullable=False)
+    receipt_id = db.Column(db.Integer, nullable=False, index=True)
+    receipt_no = db.Column(db.String(30), nullable=False)
+
+    # Receipt state after the change, so consumers need no extra lookups
+    status = db.Column(db.String(20), nullable=False)
+    item_id = db.Column(db.Integer)
+    item_name = db.Column(db.String(100))
+    amount = db.Column(db.Numeric(10, 2))
+    receipt_created_at = db.Column(db.DateTime)
+
+    actor_id = db.Column(db.Integer)  # User who made the change
+    detail = db.Column(db.String(200))  # Void reason / review note
+    created_at = db.Column(db.DateTime, default=now_tw)
+
+    @classmethod
+    def record(cls, receipt, event_type, actor_id=None, detail=None, session=None):
+        """
+        Add an event for a receipt to the current transaction
+
+        Call it last, right before the commit. On PostgreSQL it takes the
+        transaction-level advisory lock of the receipt's site, so a site's
+        ids are assigned in commit order: its consumers never see id N+1
+        before id N is committed. Other sites' writers are not held up.
+        SQLite serializes writers already.
+
+        Args:
+            receipt: Receipt (flushed or pending) the event is about
+            event_type: One of the TYPE_* constants
+            actor_id: User ID of whoever made the change
+            detail: Optional reason or note
+            session: Session to use (default: db.session)
+
+        Returns:
+            The pending ReceiptEvent
+        """
+        session = session or db.session
+        if receipt.id is None:
+            session.flush()
+        lock_event_order(session, [receipt.site_id])
+
+        event = cls(
+            site_id=receipt.site_id,
+            event_type=event_type,
+            receipt_id=receipt.id,
+            receipt_no=receipt.receipt_no,
+            status=receipt.status,
+            item_id=receipt.item_id,
+            item_name=receipt.item_name,
+            amount=receipt.amount,
+            receipt_created_at=receipt.created_at,
+            actor_id=actor_id,
+            detail=detail[:200] if detail else None
+        )
+        session.add(event)
+        return event
+
+    @classmethod
+    def backfill_sites(cls):
+        """Give events their receipt's site (hot or archived); upgrade only"""
+        from sqlalchemy import select, update
+        from app.models import ArchivedReceipt, Receipt
+
+        events = cls.__table__
+        for model in (Receipt, ArchivedReceipt):
+            receipts = model.__table__
+            site_of = select(receipts.c.site_id).where(receipts.c.id == events.c.receipt_id)
+            db.session.execute(update(events).where(site_of.exists()).values(
+                site_id=site_of.scalar_subquery()
+            ))
+        db.session.commit()
+
+    def to_dict(self):
+        """Change feed representation"""
+        return {
+            'cursor': self.id,
+            'event': self.event_type,
+            'receipt_id': self.receipt_id,
+            'receipt_no': self.receipt_no,
+            'status': self.status,
+            'item_id': self.item_id,
+            'item_name': self.item_name,
+            'amount': str(self.amount) if self.amount is not None else None,
+            'receipt_created_at': self.receipt_created_at.isoformat() if self.receipt_created_at else None,
+            'actor_id': self.actor_id,
+            'detail': self.detail,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+        }
+
+    def __repr__(self):
+        return f'<ReceiptEvent {self.id} {self.event_type} {self.receipt_no}>'
@@ -0,0 +1,119 @@
+"""
+Receipt Number Models - Central sequence allocator and counter number blocks
+"""
+from app import db
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from app.timezone import now_tw
+
+
+class ReceiptSequence(db.Model):
+    """Next receipt sequence number per prefix and day (central database)"""
+    __tablename__ = 'receipt_sequences'
+
+    prefix = db.Column(db.String(10), primary_key=True)
+    day = db.Column(db.String(8), primary_key=True)  # YYYYMMDD
+    next_seq = db.Column(db.Integer, nullable=False)
+
+    @classmethod
+    def _last_issued(cls, prefix, day, session):
+        """Highest sequence number already used by receipts of the day"""
+        from app.models.receipt import Receipt
+        numbers = session.execute(
+            select(Receipt.receipt_no).where(Receipt.receipt_no.like(f'{prefix}-{day}-%'))
+        ).scalars()
+        return max((int(no.rsplit('-', 1)[-1]) for no in numbers), default=0)
+
+    @classmethod
+    def allocate(cls, prefix, day, count=1, session=None):
+        """
+        Reserve consecutive sequence numbers in the caller's transaction
+
+        The UPDATE takes the row (PostgreSQL) or database (SQLite) write lock
+        first, so concurrent callers never receive the same numbers.
+
+        Args:
+            prefix: Receipt number prefix
+            day: Day key (YYYYMMDD)
+            count: How many numbers to reserve
+            session: Session to use (default: db.session)
+
+        Returns:
+            First reserved sequence number
+        """
+        session = session or db.session
+        row = (cls.prefix == prefix) & (cls.day == day)
+
+        for _ in range(3):
+            updated = session.execute(
+                update(cls).where(row).values(next_seq=cls.next_seq + count)
+            ).rowcount
+            if updated:
+                return session.execute(select(cls.next_seq).where(row)).scalar() - count
+
+            # First allocation of the day: continue after numbers issued without the allocator
+            start = cls._last_issued(prefix, day, session) + 1
+            try:
+                with session.begin_nested():
+                    session.add(cls(prefix=prefix, day=day, next_seq=start + count))
+                return start
+            except IntegrityError:
+                continue  # Created concurrently; take the UPDATE path
+
+        raise RuntimeError(f'Could not allocate receipt numbers for {prefix}-{day}')
+
+    def __repr__(self):
+        return f'<ReceiptSequence {self.prefix}-{self.day} next={self.next_seq}>'
+
+
+class ReceiptNumberBlock(db.Model):
+    """
+    Range of receipt numbers reserved for an offline-capable counter
+
+    Recorded in the central database when allocated (audit) and in the
+    counter's local database, where next_seq tracks consumption.
+    """
+    __tablename__ = 'receipt_number_blocks'
+
+    id = db.Column(db.Integer, primary_key=True)
+    counter_id = db.Column(db.String(50), nullable=False, index=True)
+    prefix = db.Column(db.String(10), nullable=False)
+    day = db.Column(db.String(8), nullable=False)  # YYYYMMDD
+    start_seq = db.Column(db.Integer, nullable=False)
+    end_seq = db.Column(db.Integer, nullable=False)  # Inclusive
+    next_seq = db.Column(db.Integer, nullable=False)
+    allocated_at = db.Column(db.DateTime, default=now_tw)
+
+    @classmethod
+    def remaining(cls, counter_id, prefix, day):
+        """Unused numbers of a counter for a day"""
+        return db.session.query(
+            db.func.coalesce(db.func.sum(cls.end_seq - cls.next_seq + 1), 0)
+        ).filter(
+            cls.counter_id == counter_id, cls.prefix == prefix, cls.day == day,
+            cls.next_seq <= cls.end_seq
+        ).scalar()
+
+    @classmethod
+    def take(cls, counter_id, prefix, day):
+        """
+        Consume the next number from the counter's blocks (local database)
+
+        Returns:
+            Sequence number, or None if the day's blocks are used up
+        """
+        block_ids = db.session.query(cls.id).filter(
+            cls.counter_id == counter_id, cls.prefix == prefix, cls.day == day,
+            cls.next_seq <= cls.end_seq
+        ).order_by(cls.start_seq).all()
+
+        for (block_id,) in block_ids:
+            updated = cls.query.filter(
+                cls.id == block_id, cls.next_seq <= cls.end_seq
+            ).update({'next_seq': cls.next_seq + 1}, synchronize_session=False)
+            if updated:
+                return db.session.query(cls.next_seq).filter_by(id=block_id).scalar() - 1
+        return None
+
+    def __repr__(self):
+        return f'<ReceiptNumberBlock {self.counter_id} {self.prefix}-{self.day} {self.start_seq}-{self.end_seq}>'
@@ -0,0 +1,70 @@
+"""
+Report Version Model - Data version per site and reporting period
+"""
+from app import db
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from app.sites import DEFAULT_SITE_ID, current_site_id
+
+
+class ReportVersion(db.Model):
+    """Counter bumped whenever receipts of a site's period change (cache invalidation)"""
+    __tablename__ = 'report_versions'
+    # Derived data only: bootstrap may drop and recreate it on schema changes
+    __table_args__ = {'info': {'rebuildable': True}}
+
+    site_id = db.Column(db.Integer, primary_key=True, default=DEFAULT_SITE_ID)
+    period = db.Column(db.String(7), primary_key=True)  # YYYY-MM
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def period_of(value):
+        """Get the period key (YYYY-MM) of a date/datetime"""
+        return value.strftime('%Y-%m')
+
+    @classmethod
+    def get_version(cls, period, site_id=None):
+        """
+        Get the current version of a period (0 if never written)
+
+        Args:
+            period: Period key (YYYY-MM)
+            site_id: Site (default: the current site; with no site, the sum
+                     over all sites, which changes whenever any of them does)
+        """
+        site_id = site_id or current_site_id()
+        query = db.session.query(db.func.sum(cls.version)).filter(cls.period == period)
+        if site_id is not None:
+            query = query.filter(cls.site_id == site_id)
+        return query.scalar() or 0
+
+    @classmethod
+    def bump(cls, period, site_id=None, session=None):
+        """
+        Increment the version of a period in the current transaction
+
+        Must be called before the caller's commit so the bump and the data
+        change are atomic.
+
+        Args:
+            period: Period key (YYYY-MM)
+            site_id: Site whose receipts changed (default: the current site)
+            session: Session to use (default: db.session)
+        """
+        session = session or db.session
+        site_id = site_id or current_site_id() or DEFAULT_SITE_ID
+        increment = update(cls).where(
+            cls.site_id == site_id, cls.period == period
+        ).values(version=cls.version + 1)
+        if session.execute(increment).rowcount:
+            return
+
+        # First write of the period; another worker may insert it concurrently
+        try:
+            with session.begin_nested():
+                session.add(cls(site_id=site_id, period=period, version=1))
+        except IntegrityError:
+            session.execute(increment)
+
+    def __repr__(self):
+        return f'<ReportVersion {self.site_id}/{self.period} v{self.version}>'
@@ -0,0 +1,120 @@
+"""
+Sales Cube Model - Active receipt counts and takings per hour, weekday and fee item
+"""
+from app import db
+from sqlalchemy import bindparam, insert, update
+from sqlalchemy.exc import IntegrityError
+from app.models.site import SiteScoped
+from app.sites import DEFAULT_SITE_ID
+
+
+class SalesCube(SiteScoped, db.Model):
+    """
+    One cell of the sales cube: a site's active receipts of one fee item
+    issued in a month on one weekday (0 = Monday) and hour (Taiwan time)
+
+    Maintained in the transaction of every receipt write that changes what
+    is active (see ReceiptService), and rebuilt in bulk by
+    SalesCubeService.rebuild. Identity types roll up through FeeItem.
+    """
+    __tablename__ = 'sales_cube'
+    __table_args__ = (
+        db.PrimaryKeyConstraint('site_id', 'period', 'weekday', 'hour', 'item_id'),
+        # Derived data only: bootstrap may drop, recreate and rebuild it
+        {'info': {'rebuildable': True}},
+    )
+
+    period = db.Column(db.String(7), nullable=False)  # YYYY-MM
+    weekday = db.Column(db.SmallInteger, nullable=False)
+    hour = db.Column(db.SmallInteger, nullable=False)
+    item_id = db.Column(db.Integer, nullable=False)
+    receipt_count = db.Column(db.Integer, nullable=False, default=0)
+    amount = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+
+    KEY_COLUMNS = ('site_id', 'period', 'weekday', 'hour', 'item_id')
+
+    @classmethod
+    def add(cls, created_at, item_id, count, amount, site_id=None, session=None):
+        """
+        Add receipts to their cell in the current transaction
+
+        Must be called before the caller's commit so the cube and the
+        receipts change atomically.
+
+        Args:
+            created_at: Issue time of the receipts (Taiwan time)
+            item_id: Fee item ID
+            count: Receipts that became active (negative: left active)
+            amount: Their total amount (same sign as count)
+            site_id: Site of the receipts (default: the default site)
+            session: Session to use (default: db.session)
+        """
+        key = (site_id or DEFAULT_SITE_ID, created_at.strftime('%Y-%m'), created_at.weekday(),
+               created_at.hour, item_id)
+        cls._apply(dict(zip(cls.KEY_COLUMNS, key)), count, amount, session or db.session)
+
+    @classmethod
+    def _apply(cls, key, count, amount, session):
+        increment = update(cls).where(
+            *[getattr(cls, name) == value for name, value in key.items()]
+        ).values(receipt_count=cls.receipt_count + count, amount=cls.amount + amount)
+        # Explicit site: the cell may belong to another site than the current one
+        if session.execute(increment, execution_options={'all_sites': True}).rowcount:
+            return
+
+        # First receipt of the cell; another worker may insert it concurrently
+        try:
+            with session.begin_nested():
+                session.add(cls(receipt_count=count, amount=amount, **key))
+        except IntegrityError:
+            session.execute(increment, execution_options={'all_sites': True})
+
+    @classmethod
+    def add_many(cls, cells, session=None):
+        """
+        Add many cells at once (bulk loads), in the current transaction
+
+        One SELECT for the cells that exist, one executemany UPDATE for
+        them and one multi-row INSERT for the others; if another writer
+        inserts one of those first, the cells are applied one by one.
+
+        Args:
+            cells: {(site_id, period, weekday, hour, item_id): (count, amount)}
+            session: Session to use (default: db.session)
+        """
+        if not cells:
+            return
+        session = session or db.session
+        table = cls.__table__
+        names = cls.KEY_COLUMNS
+        columns = [table.c[name] for name in names]
+        existing = set(session.execute(
+            db.select(*columns).where(
+                table.c.site_id.in_({key[0] for key in cells}),
+                table.c.period.in_({key[1] for key in cells}),
+            )
+        ).tuples())
+
+        updates = [dict({f'k_{name}': value for name, value in zip(names, key)},
+                        d_count=count, d_amount=amount)
+                   for key, (count, amount) in cells.items() if key in existing]
+        if updates:
+            session.execute(
+                update(table).where(*[column == bindparam(f'k_{column.name}') for column in columns])
+                .values(receipt_count=table.c.receipt_count + bindparam('d_count'),
+                        amount=table.c.amount + bindparam('d_amount')),
+                updates
+            )
+        inserts = [dict(zip(names, key), receipt_count=count, amount=amount)
+                   for key, (count, amount) in cells.items() if key not in existing]
+        if inserts:
+            try:
+                with session.begin_nested():
+                    session.execute(insert(table), inserts)
+            except IntegrityError:
+                for row in inserts:
+                    cls._apply({name: row[name] for name in names}, row['receipt_count'],
+                               row['amount'], session)
+
+    def __repr__(self):
+        return f'<SalesCube {self.site_id}/{self.period} {self.weekday}:{self.hour:02d} item {self.item_id}>'
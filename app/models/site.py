@@ -0,0 +1,132 @@
+"""
+Site Model - Pools served by one deployment
+"""
+import os
+import time
+from flask import current_app
+from app import db
+from app.database import shared_state_path
+from sqlalchemy import insert
+from sqlalchemy.orm import declared_attr
+from app.sites import DEFAULT_SITE_ID, current_site_id
+from app.timezone import now_tw
+
+
+def _default_site_id():
+    return current_site_id() or DEFAULT_SITE_ID
+
+
+class SiteScoped:
+    """
+    Rows that belong to one site
+
+    While a site is active (app.sites) queries of these models only see
+    its rows; new rows default to it.
+    """
+
+    @declared_attr
+    def site_id(cls):
+        return db.Column(db.Integer, db.ForeignKey('sites.id'), nullable=False,
+                         default=_default_site_id, server_default=str(DEFAULT_SITE_ID))
+
+
+class Site(db.Model):
+    """Swimming pool (site) with its own receipt numbering, catalog and staff"""
+    __tablename__ = 'sites'
+
+    DEFAULT_ID = DEFAULT_SITE_ID
+
+    id = db.Column(db.Integer, primary_key=True)
+    code = db.Column(db.String(20), unique=True, nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    receipt_prefix = db.Column(db.String(10), unique=True, nullable=False)  # Fixed once receipts exist
+    printer_url = db.Column(db.String(200))  # Thermal receipt printer: tcp://host:9100 or a device path
+    is_active = db.Column(db.Boolean, default=True)
+    created_at = db.Column(db.DateTime, default=now_tw)
+
+    # Per-process cache: site_id -> (expires, (code, name, receipt_prefix)).
+    # Entries expire after SITE_CACHE_TTL seconds; forget() also touches a
+    # stamp file, so every worker on the host drops them on its next lookup.
+    _descriptions = {}
+    _stamp = None
+
+    @staticmethod
+    def _stamp_path():
+        return shared_state_path(current_app, 'sites') + '.stamp'
+
+    @classmethod
+    def describe(cls, site_id):
+        """(code, name, receipt_prefix) of a site, cached per process"""
+        now = time.monotonic()
+        try:
+            stamp = os.stat(cls._stamp_path()).st_mtime_ns
+        except OSError:
+            stamp = None
+        if stamp != cls._stamp:
+            # Some worker changed a site: start over
+            cls._descriptions.clear()
+            cls._stamp = stamp
+        entry = cls._descriptions.get(site_id)
+        if entry is None or entry[0] <= now:
+            row = db.session.query(cls.code, cls.name, cls.receipt_prefix) \
+                .filter(cls.id == site_id).first()
+            if row is None:
+                raise ValueError(f'Unknown site: {site_id}')
+            ttl = current_app.config.get('SITE_CACHE_TTL', 60)
+            entry = cls._descriptions[site_id] = (now + ttl, tuple(row))
+        return entry[1]
+
+    @classmethod
+    def prefix_of(cls, site_id):
+        """Receipt number prefix of a site"""
+        return cls.describe(site_id)[2]
+
+    @classmethod
+    def printer_of(cls, site_id, default=None):
+        """
+        Thermal receipt printer of a site, read on every call so an edit
+        applies to all workers at once
+
+        Args:
+            site_id: Site ID
+            default: Printer of the default site when it has none (PRINTER_URL)
+
+        Returns:
+            Printer URL, or None if the site has no printer
+        """
+        url = db.session.query(cls.printer_url).filter(cls.id == site_id).scalar()
+        return url or (default if site_id == cls.DEFAULT_ID else None)
+
+    @classmethod
+    def forget(cls, site_id=None):
+        """
+        Drop cached descriptions here and in the other workers of the host
+        after a site was changed (other hosts within SITE_CACHE_TTL)
+
+        Call after the change is committed.
+        """
+        if site_id is None:
+            cls._descriptions.clear()
+        else:
+            cls._descriptions.pop(site_id, None)
+        path = cls._stamp_path()
+        with open(path, 'a'):
+            pass
+        os.utime(path)
+
+    @classmethod
+    def ensure_default(cls, receipt_prefix):
+        """
+        Create the default site (id 1, owner of pre-existing rows) if missing
+
+        Runs before upgrade_schema, so only columns of the first sites
+        table are read and written.
+        """
+        if db.session.query(cls.id).filter(cls.id == cls.DEFAULT_ID).first() is None:
+            db.session.execute(insert(cls.__table__).values(
+                id=cls.DEFAULT_ID, code='MAIN', name='\u6e38\u6cf3\u6c60', receipt_prefix=receipt_prefix
+            ))
+            db.session.commit()
+
+    def __repr__(self):
+        return f'<Site {self.code}>'
@@ -5,26 +5,18 @@ from app import db, login_manager
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
+from app.models.site import SiteScoped
 
 
-class User(UserMixin, db.Model):
-    """User model for authentication and authorization"""
-    __tablename__ = 'users'
+class RolePermissions:
+    """
+    Permission checks derived from the role
 
-    id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(50), unique=True, nullable=False, index=True)
-    password_hash = db.Column(db.String(255), nullable=False)
-    full_name = db.Column(db.String(50), nullable=False)
-    role = db.Column(db.String(20), nullable=False, default='operator')
-    is_active = db.Column(db.Boolean, default=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, onupdate=datetime.utcnow)
+    Shared by User and the cached UserIdentity, so request handling can
+    check permissions without loading the User row.
+    """
 
-    # Relationships
-    receipts = db.relationship('Receipt', backref='operator', lazy='dynamic',
-                               foreign_keys='Receipt.operator_id')
-    verified_receipts = db.relationship('Receipt', backref='verifier', lazy='dynamic',
-                                        foreign_keys='Receipt.verified_by')
+    __slots__ = ()
 
     # Role constants
     ROLE_OPERATOR = 'operator'      # Operator: create receipts
@@ -32,14 +24,6 @@ class User(UserMixin, db.Model):
     ROLE_CASHIER = 'cashier'        # Cashier: verify receipts, receive payments
     ROLE_ADMIN = 'admin'            # Admin: full access
 
-    def set_password(self, password):
-        """Set password hash"""
-        self.password_hash = generate_password_hash(password)
-
-    def check_password(self, password):
-        """Verify password"""
-        return check_password_hash(self.password_hash, password)
-
     def can_create_receipt(self):
         """Check if user can create receipts"""
         return self.role in [self.ROLE_OPERATOR, self.ROLE_SUPERVISOR, self.ROLE_ADMIN]
@@ -75,11 +59,46 @@ class User(UserMixin, db.Model):
         }
         return role_names.get(self.role, self.role)
 
+
+class User(UserMixin, RolePermissions, SiteScoped, db.Model):
+    """User model for authentication and authorization (staff of one site)"""
+    __tablename__ = 'users'
+    __table_args__ = (
+        db.Index('ix_users_site_role', 'site_id', 'role', 'username'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(50), unique=True, nullable=False, index=True)
+    password_hash = db.Column(db.String(255), nullable=False)
+    full_name = db.Column(db.String(50), nullable=False)
+    role = db.Column(db.String(20), nullable=False, default='operator')
+    is_active = db.Column(db.Boolean, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, onupdate=datetime.utcnow)
+
+    # Relationships
+    receipts = db.relationship('Receipt', backref='operator', lazy='dynamic',
+                               foreign_keys='Receipt.operator_id')
+    verified_receipts = db.relationship('Receipt', backref='verifier', lazy='dynamic',
+                                        foreign_keys='Receipt.verified_by')
+
+    def set_password(self, password):
+        """Set password hash"""
+        self.password_hash = generate_password_hash(password)
+
+    def check_password(self, password):
+        """Verify password"""
+        return check_password_hash(self.password_hash, password)
+
     def __repr__(self):
         return f'<User {self.username}>'
 
 
 @login_manager.user_loader
 def load_user(user_id):
-    """Load user by ID for Flask-Login"""
-    return User.query.get(int(user_id))
+    """Load the identity of a logged-in user (cached per worker, no query on a hit)"""
+    from app.services.identity_cache import get_identity_cache
+    try:
+        return get_identity_cache().get(int(user_id))
+    except ValueError:
+        return None
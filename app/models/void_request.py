@@ -3,12 +3,16 @@ Void Request Model - Receipt void requests
 """
 from app import db
 from datetime import datetime
+from app.models.site import SiteScoped
 from app.timezone import now_tw
 
 
-class VoidRequest(db.Model):
-    """Void request model for receipt cancellation"""
+class VoidRequest(SiteScoped, db.Model):
+    """Void request model for receipt cancellation (site of the receipt)"""
     __tablename__ = 'void_requests'
+    __table_args__ = (
+        db.Index('ix_void_requests_site_status', 'site_id', 'status', 'requested_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     receipt_id = db.Column(db.Integer, db.ForeignKey('receipts.id'), nullable=False)
@@ -0,0 +1,170 @@
+"""
+Read Replica Routing - Send read-only report queries to a replica bind
+
+Reads are routed to the 'replica' bind (SQLALCHEMY_BINDS) only when:
+    - the code runs inside read_replica() (report/verification endpoints
+      listed in REPLICA_ENDPOINTS, export jobs),
+    - the statement is a SELECT and the session has no pending changes,
+    - the replica answered its last lag check within REPLICA_MAX_LAG.
+Everything else, including every flush, uses the primary.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import current_app, has_app_context, request, session, g
+from flask_sqlalchemy.session import Session
+from sqlalchemy import text
+
+REPLICA_BIND = 'replica'
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+@contextmanager
+def read_replica():
+    """Allow SELECTs in this block to be served by the replica"""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that routes eligible reads to the replica"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and _replica_reads.get() and has_app_context()
+                and getattr(clause, 'is_select', False)
+                and not (self._flushing or self.new or self.dirty or self.deleted)):
+            router = current_app.extensions.get('replica_router')
+            engine = router.engine_for_reads() if router else None
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class ReplicaRouter:
+    """Tracks replica lag and decides whether reads may use it"""
+
+    def __init__(self, engine, primary_engine, max_lag, check_interval, logger):
+        self.engine = engine
+        self.primary_engine = primary_engine
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.logger = logger
+        self.lag = None
+        self.healthy = False
+        self._checked_at = None
+        self._behind_since = None
+        self._lock = threading.Lock()
+
+    def engine_for_reads(self):
+        """Get the replica engine, or None to fall back to the primary"""
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.check_interval:
+            with self._lock:
+                if self._checked_at is None or now - self._checked_at >= self.check_interval:
+                    self._checked_at = now
+                    self._check()
+        return self.engine if self.healthy else None
+
+    def measure_lag(self):
+        """Replication lag in seconds"""
+        if self.engine.dialect.name == 'postgresql':
+            with self.engine.connect() as conn:
+                if conn.execute(text('SELECT pg_is_in_recovery()')).scalar():
+                    # Caught up (receive == replay): no lag even if the primary is idle
+                    return float(conn.execute(text(
+                        'SELECT CASE '
+                        'WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+                        'ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) '
+                        'END'
+                    )).scalar())
+        elif self.engine.dialect.name == 'sqlite':
+            # Connecting to a missing file would create an empty database
+            path = self.engine.url.database
+            if path and path != ':memory:' and not os.path.exists(path):
+                raise RuntimeError('replica database file not found')
+
+        return self._version_lag()
+
+    def _version_lag(self):
+        """
+        Lag of a stand-in replica (a refreshed copy, a non-streaming server)
+
+        Every receipt write bumps report_versions, so the replica is current
+        while its version total matches the primary's; otherwise the lag is
+        the time since it was first seen behind.
+        """
+        query = text('SELECT COALESCE(SUM(version), 0) FROM report_versions')
+        with self.engine.connect() as conn:
+            replica_version = conn.execute(query).scalar()
+        with self.primary_engine.connect() as conn:
+            primary_version = conn.execute(query).scalar()
+
+        now = time.monotonic()
+        if replica_version >= primary_version:
+            self._behind_since = None
+            return 0.0
+        if self._behind_since is None:
+            # It may have fallen behind any time since the previous check
+            self._behind_since = now - self.check_interval
+        return now - self._behind_since
+
+    def _check(self):
+        try:
+            self.lag = self.measure_lag()
+            healthy = self.lag <= self.max_lag
+            reason = f'lag {self.lag:.1f}s'
+        except Exception as e:
+            self.lag = None
+            healthy = False
+            reason = f'unreachable ({e.__class__.__name__})'
+
+        if healthy != self.healthy:
+            if healthy:
+                self.logger.info('Read replica in use (%s)', reason)
+            else:
+                self.logger.warning('Read replica skipped, reading from primary: %s', reason)
+        self.healthy = healthy
+
+
+def init_replica(app, db):
+    """Route reads of REPLICA_ENDPOINTS to the replica bind, if configured"""
+    if REPLICA_BIND not in (app.config.get('SQLALCHEMY_BINDS') or {}):
+        return
+
+    with app.app_context():
+        app.extensions['replica_router'] = ReplicaRouter(
+            db.engines[REPLICA_BIND],
+            db.engine,
+            max_lag=app.config.get('REPLICA_MAX_LAG', 30),
+            check_interval=app.config.get('REPLICA_CHECK_INTERVAL', 5),
+            logger=app.logger
+        )
+
+    @app.before_request
+    def route_reads_to_replica():
+        if request.method not in ('GET', 'HEAD'):
+            return
+        if request.endpoint not in app.config.get('REPLICA_ENDPOINTS', ()):
+            return
+        # Read-your-writes: a client that just wrote reads from the primary
+        if session.get('read_primary_until', 0) > time.time():
+            return
+        g.replica_token = _replica_reads.set(True)
+
+    @app.after_request
+    def remember_write(response):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            session['read_primary_until'] = time.time() + app.config.get('REPLICA_MAX_LAG', 30)
+        return response
+
+    @app.teardown_request
+    def end_replica_reads(exc):
+        token = g.pop('replica_token', None)
+        if token is not None:
+            _replica_reads.reset(token)
@@ -1,11 +1,16 @@
 """
 Admin Routes - System administration (Demo Mode)
 """
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+import re
+from flask import Blueprint, render_template, redirect, url_for, flash, request, session
 from app import db
-from app.models import User, FeeItem
+from app.models import Site, User, FeeItem
+from app.services.identity_cache import get_identity_cache
 from decimal import Decimal
 
+RECEIPT_PREFIX_PATTERN = re.compile(r'^[A-Z]{2,10}$')  # Receipt numbers: PREFIX-YYYYMMDD-XXXX
+PRINTER_URL_PATTERN = re.compile(r'^(tcp://[^\s/:]+(:\d+)?|(file://)?/\S+)$')  # See escpos_service.send
+
 admin_bp = Blueprint('admin', __name__)
 
 
@@ -43,7 +48,8 @@ def create_user():
             flash('請輸入姓名', 'error')
         elif len(password) < 6:
             flash('密碼至少需要6個字元', 'error')
-        elif User.query.filter_by(username=username).first():
+        elif User.query.filter_by(username=username).execution_options(all_sites=True).first():
+            # Login names are unique across sites
             flash('帳號已存在', 'error')
         else:
             user = User(
@@ -85,6 +91,7 @@ def edit_user(user_id):
                 user.set_password(new_password)
 
             db.session.commit()
+            get_identity_cache().invalidate(user.id)
             flash('使用者資料已更新', 'success')
             return redirect(url_for('admin.users'))
 
@@ -117,7 +124,7 @@ def create_fee_item():
             flash('請輸入項目名稱', 'error')
         elif default_price is None or default_price < 0:
             flash('請輸入有效的預設金額', 'error')
-        elif FeeItem.query.filter_by(item_code=item_code).first():
+        elif FeeItem.query.filter_by(item_code=item_code).first():  # Within the site
             flash('項目代碼已存在', 'error')
         else:
             item = FeeItem(
@@ -169,3 +176,76 @@ def edit_fee_item(item_id):
             return redirect(url_for('admin.fee_items'))
 
     return render_template('admin/fee_item_form.html', item=item)
+
+
+# Site Management
+@admin_bp.route('/sites')
+def sites():
+    """Site list"""
+    all_sites = Site.query.order_by(Site.id).all()
+    return render_template('admin/sites.html', sites=all_sites)
+
+
+@admin_bp.route('/sites/create', methods=['GET', 'POST'])
+def create_site():
+    """Create new site"""
+    if request.method == 'POST':
+        code = request.form.get('code', '').strip().upper()
+        name = request.form.get('name', '').strip()
+        receipt_prefix = request.form.get('receipt_prefix', '').strip().upper()
+        printer_url = request.form.get('printer_url', '').strip()
+
+        if not code:
+            flash('請輸入場館代碼', 'error')
+        elif not name:
+            flash('請輸入場館名稱', 'error')
+        elif not RECEIPT_PREFIX_PATTERN.match(receipt_prefix):
+            flash('收據字軌需為2至10個英文字母', 'error')
+        elif Site.query.filter_by(code=code).first():
+            flash('場館代碼已存在', 'error')
+        elif Site.query.filter_by(receipt_prefix=receipt_prefix).first():
+            flash('收據字軌已被其他場館使用', 'error')
+        elif printer_url and not PRINTER_URL_PATTERN.match(printer_url):
+            flash('印表機位址需為 tcp://主機:埠號 或裝置路徑', 'error')
+        else:
+            site = Site(code=code, name=name, receipt_prefix=receipt_prefix,
+                        printer_url=printer_url or None)
+            db.session.add(site)
+            db.session.commit()
+            flash(f'場館 {name} 已建立', 'success')
+            return redirect(url_for('admin.sites'))
+
+    return render_template('admin/site_form.html', site=None)
+
+
+@admin_bp.route('/sites/<int:site_id>/edit', methods=['GET', 'POST'])
+def edit_site(site_id):
+    """Edit site name and receipt printer (code and prefix are fixed)"""
+    site = Site.query.get_or_404(site_id)
+
+    if request.method == 'POST':
+        name = request.form.get('name', '').strip()
+        printer_url = request.form.get('printer_url', '').strip()
+
+        if not name:
+            flash('請輸入場館名稱', 'error')
+        elif printer_url and not PRINTER_URL_PATTERN.match(printer_url):
+            flash('印表機位址需為 tcp://主機:埠號 或裝置路徑', 'error')
+        else:
+            site.name = name
+            site.printer_url = printer_url or None
+            db.session.commit()
+            Site.forget(site.id)
+            flash('場館資料已更新', 'success')
+            return redirect(url_for('admin.sites'))
+
+    return render_template('admin/site_form.html', site=site)
+
+
+@admin_bp.route('/sites/<int:site_id>/switch', methods=['POST'])
+def switch_site(site_id):
+    """Manage another site (administrators only)"""
+    site = Site.query.get_or_404(site_id)
+    session['site_id'] = site.id
+    flash(f'已切換至 {site.name}', 'success')
+    return redirect(url_for('admin.index'))
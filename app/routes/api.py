@@ -0,0 +1,131 @@
+"""
+API Routes - Receipt change feed and dashboard KPIs (Demo Mode)
+"""
+import json
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+from app.services.change_feed_service import ChangeFeedService
+from app.services.kpi_counters import get_kpi_counters
+from app.services.sales_cube_service import SalesCubeService
+
+api_bp = Blueprint('api', __name__)
+
+
+def _error(message, status=400):
+    return {'error': message}, status
+
+
+@api_bp.route('/changes')
+def changes():
+    """
+    API: Receipt events of the current site after a cursor
+
+    Query parameters:
+        since   last cursor processed by the consumer (default 0)
+        limit   events per response (default CHANGES_PAGE_SIZE,
+                at most CHANGES_MAX_PAGE_SIZE)
+
+    The body is streamed while rows are read:
+        {"since": 0, "events": [...], "next_cursor": 1000, "has_more": true}
+    Consumers store next_cursor and call again while has_more is true.
+    """
+    try:
+        since = int(request.args.get('since', 0))
+        limit = int(request.args.get('limit', current_app.config.get('CHANGES_PAGE_SIZE', 1000)))
+    except ValueError:
+        return _error('since and limit must be integers')
+    if since < 0:
+        return _error('since must be a non-negative cursor')
+    if limit < 1:
+        return _error('limit must be positive')
+    limit = min(limit, current_app.config.get('CHANGES_MAX_PAGE_SIZE', 10000))
+    batch_size = current_app.config.get('REPORT_YIELD_PER', 1000)
+
+    def generate():
+        yield '{"since": %d, "events": [' % since
+        cursor = since
+        separator = ''
+        batch = []
+        for event in ChangeFeedService.iter_events(since, limit):
+            batch.append(json.dumps(event.to_dict(), ensure_ascii=False))
+            cursor = event.id
+            if len(batch) >= batch_size:
+                yield separator + ','.join(batch)
+                separator = ','
+                batch = []
+        if batch:
+            yield separator + ','.join(batch)
+        has_more = ChangeFeedService.has_more(cursor)
+        yield '], "next_cursor": %d, "has_more": %s}' % (cursor, 'true' if has_more else 'false')
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+
+@api_bp.route('/kpi')
+def kpi():
+    """
+    API: Dashboard KPIs from the shared counters (no query on the normal path)
+
+        {"day": "2024-05-01", "seq": 42, "pending_voids": 1,
+         "unverified_amount": 1200.0, "total_count": 12, "total_amount": 1800.0,
+         "operators": [{"id": 1, "name": "...", "count": 12, "amount": 1800.0}]}
+
+    seq changes whenever a counter changes, so pollers can skip re-rendering.
+    """
+    counters = get_kpi_counters()
+    if counters is None:
+        return _error('KPI counters are disabled', 404)
+
+    snapshot = counters.snapshot()
+    names = counters.operator_names(sorted(snapshot['operators']))
+    operators = [
+        {'id': operator_id, 'name': names[operator_id], 'count': count, 'amount': float(amount)}
+        for operator_id, (count, amount) in sorted(snapshot['operators'].items())
+        if count
+    ]
+    response = jsonify({
+        'day': snapshot['day'].isoformat(),
+        'seq': snapshot['seq'],
+        'pending_voids': snapshot['pending_voids'],
+        'unverified_amount': float(snapshot['unverified_amount']),
+        'total_count': sum(o['count'] for o in operators),
+        'total_amount': float(sum(amount for _, amount in snapshot['operators'].values())),
+        'operators': operators,
+    })
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+@api_bp.route('/sales-cube')
+def sales_cube():
+    """
+    API: Sales by weekday and hour from the sales cube
+
+        GET /api/sales-cube?year=2025[&month=3][&item_id=1][&identity_type=...]
+
+        {"year": 2025, "month": 3, "total": {"count": 812, "amount": 52300.0},
+         "cells": [[{"count": 0, "amount": 0.0}, ...24 hours], ...7 weekdays, Monday first],
+         "by_item": [{"name": "...", "count": 500, "amount": 25000.0}],
+         "by_identity": [{"identity_type": "...", "count": 500, "amount": 25000.0}]}
+    """
+    year = request.args.get('year', type=int)
+    month = request.args.get('month', type=int)
+    if not year:
+        return _error('year is required')
+    if month is not None and not 1 <= month <= 12:
+        return _error('month must be 1-12')
+
+    cube = SalesCubeService.heatmap(year, month, request.args.get('item_id', type=int),
+                                    request.args.get('identity_type') or None)
+
+    def entry(count, amount, **extra):
+        return dict(extra, count=count, amount=float(amount))
+
+    return jsonify({
+        'year': year,
+        'month': month,
+        'total': entry(*cube['total']),
+        'cells': [[entry(*cell) for cell in row] for row in cube['cells']],
+        'by_item': [entry(count, amount, name=name) for name, count, amount in cube['by_item']],
+        'by_identity': [entry(count, amount, identity_type=identity)
+                        for identity, (count, amount) in cube['by_identity']],
+    })
@@ -3,6 +3,7 @@ Authentication Routes - Login, Logout
 """
 from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_user, logout_user, login_required, current_user
+from app import db
 from app.models import User
 
 auth_bp = Blueprint('auth', __name__)
@@ -52,15 +53,17 @@ def change_password():
         new_password = request.form.get('new_password')
         confirm_password = request.form.get('confirm_password')
 
-        if not current_user.check_password(current_password):
+        # current_user is a cached identity snapshot: change the row itself
+        user = db.session.get(User, int(current_user.get_id()))
+
+        if not user.check_password(current_password):
             flash('\u76ee\u524d\u5bc6\u78bc\u932f\u8aa4', 'error')
         elif new_password != confirm_password:
             flash('\u65b0\u5bc6\u78bc\u8207\u78ba\u8a8d\u5bc6\u78bc\u4e0d\u7b26', 'error')
         elif len(new_password) < 6:
             flash('\u65b0\u5bc6\u78bc\u81f3\u5c11\u9700\u89816\u500b\u5b57\u5143', 'error')
         else:
-            current_user.set_password(new_password)
-            from app import db
+            user.set_password(new_password)
             db.session.commit()
             flash('\u5bc6\u78bc\u5df2\u6210\u529f\u8b8a\u66f4', 'success')
             return redirect(url_for('main.dashboard'))
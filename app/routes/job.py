@@ -0,0 +1,39 @@
+"""
+Job Routes - Background job status and downloads (Demo Mode)
+"""
+from io import BytesIO
+from flask import Blueprint, render_template, jsonify, send_file, abort
+from app.models import Job
+from app.services.job_service import JobService
+
+job_bp = Blueprint('job', __name__)
+
+
+@job_bp.route('/<int:job_id>')
+def status(job_id):
+    """Job status page (polls the JSON endpoint until finished)"""
+    job = Job.query.get_or_404(job_id)
+    return render_template('job/status.html', job=job)
+
+
+@job_bp.route('/<int:job_id>/status')
+def status_json(job_id):
+    """API: Get job status for polling"""
+    job = JobService.get_job(job_id)
+    if job is None:
+        abort(404)
+    return jsonify(job.to_dict())
+
+
+@job_bp.route('/<int:job_id>/download')
+def download(job_id):
+    """Download the finished job artifact"""
+    job = Job.query.get_or_404(job_id)
+
+    if job.status != Job.STATUS_DONE or job.result_data is None:
+        abort(404)
+
+    return send_file(BytesIO(job.result_data),
+                     mimetype=job.result_mimetype,
+                     as_attachment=True,
+                     download_name=job.result_filename)
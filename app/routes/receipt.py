@@ -1,10 +1,9 @@
 """
 Receipt Routes - Create, view, print receipts (Demo Mode)
 """
-from flask import Blueprint, render_template, redirect, url_for, flash, request, Response, g
-from app.models import Receipt, FeeItem
+from flask import Blueprint, render_template, redirect, url_for, flash, request, Response, g, abort, current_app
+from app.models import Receipt, FeeItem, Site
 from app.services.receipt_service import ReceiptService
-from app.services.pdf_service import ReceiptPDFService
 from decimal import Decimal
 
 receipt_bp = Blueprint('receipt', __name__)
@@ -16,6 +15,14 @@ def get_current_user():
     return DemoUser()
 
 
+def get_receipt_or_404(receipt_id):
+    """Get a hot or archived receipt, or abort with 404"""
+    receipt = ReceiptService.get_receipt(receipt_id)
+    if receipt is None:
+        abort(404)
+    return receipt
+
+
 @receipt_bp.route('/')
 def index():
     """Receipt list page"""
@@ -54,6 +61,9 @@ def create():
                     remark=remark if remark else None
                 )
                 flash(f'收據 {receipt.receipt_no} 已成功開立', 'success')
+                if current_app.config.get('PRINTER_AUTO_PRINT') and receipt_printer(receipt) \
+                        and print_thermal(receipt):
+                    return redirect(url_for('receipt.view', receipt_id=receipt.id))
                 return redirect(url_for('receipt.print_receipt', receipt_id=receipt.id))
             except ValueError as e:
                 flash(str(e), 'error')
@@ -64,22 +74,59 @@ def create():
 @receipt_bp.route('/<int:receipt_id>')
 def view(receipt_id):
     """View receipt details"""
-    receipt = Receipt.query.get_or_404(receipt_id)
-    return render_template('receipt/view.html', receipt=receipt)
+    receipt = get_receipt_or_404(receipt_id)
+    return render_template('receipt/view.html', receipt=receipt, printer=receipt_printer(receipt))
 
 
 @receipt_bp.route('/<int:receipt_id>/print')
 def print_receipt(receipt_id):
     """Print receipt page"""
-    receipt = Receipt.query.get_or_404(receipt_id)
+    receipt = get_receipt_or_404(receipt_id)
     return render_template('receipt/print.html', receipt=receipt)
 
 
+def receipt_printer(receipt):
+    """Thermal printer of the receipt's site (None if it has none)"""
+    return Site.printer_of(receipt.site_id, current_app.config.get('PRINTER_URL'))
+
+
+def print_thermal(receipt):
+    """Send a receipt to the thermal printer; flash and return False on failure"""
+    from app.services.escpos_service import EscPosService
+    try:
+        EscPosService().print_receipt(receipt)
+    except (ValueError, OSError) as e:
+        flash(f'熱感印表機列印失敗：{e}', 'error')
+        return False
+    return True
+
+
+@receipt_bp.route('/<int:receipt_id>/escpos', methods=['GET', 'POST'])
+def escpos(receipt_id):
+    """Print on the thermal printer (POST) or download the ESC/POS stream (GET)"""
+    receipt = get_receipt_or_404(receipt_id)
+    if request.method == 'POST':
+        if print_thermal(receipt):
+            flash(f'收據 {receipt.receipt_no} 已送至熱感印表機', 'success')
+        return redirect(url_for('receipt.view', receipt_id=receipt.id))
+
+    from app.services.escpos_service import EscPosService
+    return Response(
+        EscPosService().render(receipt),
+        mimetype='application/octet-stream',
+        headers={
+            'Content-Disposition': f'attachment; filename=receipt_{receipt.receipt_no}.bin'
+        }
+    )
+
+
 @receipt_bp.route('/<int:receipt_id>/pdf')
 def download_pdf(receipt_id):
     """Download receipt as PDF"""
-    receipt = Receipt.query.get_or_404(receipt_id)
+    receipt = get_receipt_or_404(receipt_id)
 
+    # ReportLab is loaded on first PDF request only
+    from app.services.pdf_service import ReceiptPDFService
     pdf_service = ReceiptPDFService()
     pdf_buffer = pdf_service.generate(receipt)
 
@@ -1,16 +1,23 @@
 """
 Report Routes - Daily/Monthly reports (Demo Mode)
 """
-from flask import Blueprint, render_template, request, Response
+from flask import Blueprint, render_template, request, redirect, url_for
+from app.models import FeeItem, Job
 from app.services.report_service import ReportService
-from app.services.pdf_service import ReceiptPDFService
-from app.services.number_chinese import amount_to_chinese
+from app.services.sales_cube_service import SalesCubeService
+from app.services.job_service import JobService
+from app.templating import stream_page
 from datetime import date
-from io import BytesIO
 
 report_bp = Blueprint('report', __name__)
 
 
+def get_current_user():
+    """Get demo user"""
+    from app import DemoUser
+    return DemoUser()
+
+
 @report_bp.route('/daily')
 def daily():
     """Daily report page"""
@@ -25,12 +32,14 @@ def daily():
     else:
         target_date = date.today()
 
-    report_data = ReportService.get_daily_report(
+    # Summary first, then rows streamed from the cursor
+    report_data = ReportService.get_daily_summary(
         target_date=target_date,
         operator_id=operator_id
     )
+    report_data['receipts'] = ReportService.iter_daily_receipts(target_date, operator_id)
 
-    return render_template('report/daily.html', report=report_data)
+    return stream_page('report/daily.html', report=report_data)
 
 
 @report_bp.route('/monthly')
@@ -40,18 +49,15 @@ def monthly():
     month = request.args.get('month', type=int) or date.today().month
     operator_id = request.args.get('operator_id', type=int)
 
-    report_data = ReportService.get_monthly_report(
+    # Cached summary is shared between requests: copy before adding the rows
+    report_data = dict(ReportService.get_cached_monthly_summary(
         year=year,
         month=month,
         operator_id=operator_id
-    )
-
-    # Add Chinese amount
-    report_data['summary']['net_total_chinese'] = amount_to_chinese(
-        report_data['summary']['net_total']
-    )
+    ))
+    report_data['receipts'] = ReportService.iter_monthly_receipts(year, month, operator_id)
 
-    return render_template('report/monthly.html', report=report_data)
+    return stream_page('report/monthly.html', report=report_data)
 
 
 @report_bp.route('/monthly/print')
@@ -61,89 +67,56 @@ def monthly_print():
     month = request.args.get('month', type=int) or date.today().month
     operator_id = request.args.get('operator_id', type=int)
 
-    report_data = ReportService.get_monthly_report(
+    report_data = ReportService.get_cached_monthly_summary(
         year=year,
         month=month,
         operator_id=operator_id
     )
 
-    report_data['summary']['net_total_chinese'] = amount_to_chinese(
-        report_data['summary']['net_total']
-    )
-
     return render_template('report/monthly_print.html', report=report_data)
 
 
+@report_bp.route('/heatmap')
+def heatmap():
+    """Hourly/weekday sales heatmap (sales cube) for staffing"""
+    year = request.args.get('year', type=int) or date.today().year
+    month = request.args.get('month', type=int)  # None: whole year
+    item_id = request.args.get('item_id', type=int)
+    identity_type = request.args.get('identity_type') or None
+    measure = 'amount' if request.args.get('measure') == 'amount' else 'count'
+
+    cube = SalesCubeService.heatmap(year, month, item_id, identity_type)
+    items = FeeItem.query.order_by(FeeItem.category, FeeItem.sort_order).all()
+    identity_types = sorted({item.identity_type for item in items if item.identity_type})
+
+    return render_template('report/heatmap.html', cube=cube, measure=measure,
+                           item_id=item_id, identity_type=identity_type, items=items,
+                           identity_types=identity_types,
+                           years=SalesCubeService.available_years())
+
+
 @report_bp.route('/export/excel')
 def export_excel():
-    """Export receipts to Excel"""
+    """Queue a monthly Excel export and go to its job page"""
+    return _enqueue_monthly_job(Job.TYPE_EXPORT_EXCEL)
+
+
+@report_bp.route('/export/pdf')
+def export_pdf():
+    """Queue a monthly PDF report and go to its job page"""
+    return _enqueue_monthly_job(Job.TYPE_REPORT_PDF)
+
+
+def _enqueue_monthly_job(job_type):
+    """Queue a monthly export job for the requested period"""
     year = request.args.get('year', type=int) or date.today().year
     month = request.args.get('month', type=int) or date.today().month
     operator_id = request.args.get('operator_id', type=int)
 
-    report_data = ReportService.get_monthly_report(year, month, operator_id)
-    receipts = report_data['receipts']
-
-    # Prepare Excel data
-    try:
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, Alignment, Border, Side
-
-        wb = Workbook()
-        ws = wb.active
-        ws.title = f'{year}{month:02d}月報表'
-
-        # Header
-        headers = ['收據編號', '日期時間', '收費項目', '金額', '備註', '狀態', '經辦員', '驗證狀態']
-        ws.append(headers)
-
-        # Style header
-        for cell in ws[1]:
-            cell.font = Font(bold=True)
-            cell.alignment = Alignment(horizontal='center')
-
-        # Data rows
-        for r in receipts:
-            ws.append([
-                r.receipt_no,
-                r.created_at.strftime('%Y/%m/%d %H:%M:%S') if r.created_at else '',
-                r.item_name,
-                float(r.amount),
-                r.remark or '',
-                r.status_display,
-                r.operator_name,
-                '已驗證' if r.is_verified else '未驗證'
-            ])
-
-        # Summary
-        ws.append([])
-        ws.append(['合計', '', '', float(report_data['summary']['net_total'])])
-
-        # Auto-fit column width
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            ws.column_dimensions[column_letter].width = max_length + 2
-
-        # Save to buffer
-        buffer = BytesIO()
-        wb.save(buffer)
-        buffer.seek(0)
-
-        filename = f'swim_report_{year}{month:02d}.xlsx'
-        return Response(
-            buffer.getvalue(),
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            headers={
-                'Content-Disposition': f'attachment; filename={filename}'
-            }
-        )
-
-    except ImportError:
-        return '缺少 openpyxl 套件，無法匯出 Excel', 500
+    job = JobService.enqueue(job_type, {
+        'year': year,
+        'month': month,
+        'operator_id': operator_id
+    }, user=get_current_user())
+
+    return redirect(url_for('job.status', job_id=job.id))
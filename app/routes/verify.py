@@ -1,13 +1,14 @@
 """
 Verification Routes - Cashier verification (Demo Mode)
 """
-from flask import Blueprint, render_template, redirect, url_for, flash, request
-from app import db
-from app.models import Receipt, PaymentRecord, User
+from datetime import MAXYEAR, MINYEAR
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, abort
+from app.models import Receipt, User
 from app.services.receipt_service import ReceiptService
 from app.services.report_service import ReportService
-from datetime import date
-from decimal import Decimal
+from app.services.settlement_service import (SettlementService, empty_totals, month_period,
+                                             parse_amount)
+from app.timezone import today_tw
 
 verify_bp = Blueprint('verify', __name__)
 
@@ -26,10 +27,12 @@ def index():
         User.role.in_([User.ROLE_OPERATOR, User.ROLE_SUPERVISOR, User.ROLE_ADMIN])
     ).filter_by(is_active=True).all()
 
-    # Get verification summary for current month
+    # Verification summary for current month (one grouped query for all operators)
+    today = today_tw()
+    totals = SettlementService.period_totals(today.year, today.month)
     summaries = []
     for operator in operators:
-        summary = ReportService.get_verification_summary(operator_id=operator.id)
+        summary = dict(totals.get(operator.id) or empty_totals())
         summary['operator'] = operator
         summaries.append(summary)
 
@@ -85,42 +88,96 @@ def create_payment(operator_id):
     """Create payment record"""
     current_user = get_current_user()
     operator = User.query.get_or_404(operator_id)
-    summary = ReportService.get_verification_summary(operator_id=operator_id)
+    today = today_tw()
+    period_start, period_end = month_period(today.year, today.month)
+    summary = SettlementService.period_totals(
+        today.year, today.month, operator_id=operator_id
+    ).get(operator_id) or empty_totals()
+    summary.update(period_start=period_start, period_end=period_end)
 
     if request.method == 'POST':
-        actual_amount = request.form.get('actual_amount', type=float)
         notes = request.form.get('notes', '').strip()
-
-        if actual_amount is None:
-            flash('請輸入實際繳款金額', 'error')
+        try:
+            actual_amount = parse_amount(request.form.get('actual_amount'))
+        except ValueError as e:
+            flash(str(e), 'error')
+            actual_amount = None
         else:
-            system_amount = float(summary['total_amount'])
-            difference = actual_amount - system_amount
-
-            payment = PaymentRecord(
-                operator_id=operator_id,
-                period_start=summary['period_start'],
-                period_end=summary['period_end'],
-                system_amount=Decimal(str(system_amount)),
-                actual_amount=Decimal(str(actual_amount)),
-                difference=Decimal(str(difference)),
-                received_by=current_user.id,
-                notes=notes if notes else None
-            )
-
-            db.session.add(payment)
-            db.session.commit()
-
-            flash('繳款紀錄已建立', 'success')
-            return redirect(url_for('verify.index'))
+            if actual_amount is None:
+                flash('請輸入實際繳款金額', 'error')
+
+        if actual_amount is not None:
+            try:
+                SettlementService.settle(today.year, today.month,
+                                         {operator_id: (actual_amount, notes)}, current_user)
+                flash('繳款紀錄已建立', 'success')
+                return redirect(url_for('verify.index'))
+            except ValueError as e:
+                flash(str(e), 'error')
 
     return render_template('verify/create_payment.html',
                           operator=operator,
                           summary=summary)
 
 
+@verify_bp.route('/settlement', methods=['GET', 'POST'])
+def settlement():
+    """Month-end settlement: enter every operator's payment on one page"""
+    current_user = get_current_user()
+    today = today_tw()
+    year = request.values.get('year', type=int) or today.year
+    month = request.values.get('month', type=int) or today.month
+    if not MINYEAR <= year < MAXYEAR:  # The last year has no day after December
+        abort(400)
+    if not 1 <= month <= 12:
+        month = today.month
+
+    if request.method == 'POST':
+        entries = {}
+        errors = []
+        for operator_id in request.form.getlist('operator_ids', type=int):
+            try:
+                amount = parse_amount(request.form.get(f'actual_{operator_id}'))
+            except ValueError as e:
+                errors.append(str(e))
+                continue
+            if amount is not None:
+                entries[operator_id] = (amount, request.form.get(f'notes_{operator_id}', '').strip())
+
+        if errors:
+            for error in errors:
+                flash(error, 'error')
+        elif not entries:
+            flash('請輸入至少一位操作員的實際繳款金額', 'error')
+        else:
+            try:
+                payments = SettlementService.settle(year, month, entries, current_user)
+                flash(f'已建立 {len(payments)} 筆繳款紀錄', 'success')
+                return redirect(url_for('verify.settlement', year=year, month=month))
+            except ValueError as e:
+                flash(str(e), 'error')
+
+    sheet = SettlementService.get_settlement(year, month)
+    return render_template('verify/settlement.html', sheet=sheet, form=request.form)
+
+
 @verify_bp.route('/payments')
 def payment_list():
-    """List all payment records"""
-    payments = PaymentRecord.query.order_by(PaymentRecord.received_at.desc()).all()
-    return render_template('verify/payment_list.html', payments=payments)
+    """Payment ledger: newest first, keyset-paged, with running differences"""
+    operator_id = request.args.get('operator_id', type=int)
+    year = request.args.get('year', type=int)
+    month = request.args.get('month', type=int) if year else None
+    cursor = request.args.get('cursor') or None
+
+    try:
+        ledger = SettlementService.get_ledger(
+            operator_id=operator_id, year=year, month=month, cursor=cursor,
+            page_size=current_app.config.get('ITEMS_PER_PAGE', 20)
+        )
+    except ValueError:
+        abort(400)
+
+    operators = User.query.order_by(User.id).all()
+    filters = {'operator_id': operator_id, 'year': year, 'month': month}
+    return render_template('verify/payment_list.html', ledger=ledger,
+                           operators=operators, filters=filters, cursor=cursor)
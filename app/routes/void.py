@@ -1,9 +1,14 @@
 """
 Void Management Routes - Request and approve void (Demo Mode)
 """
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+import json
+import time
+from flask import Blueprint, Response, current_app, render_template, redirect, url_for, flash, request
+from app import db
 from app.models import Receipt, VoidRequest
 from app.services.receipt_service import ReceiptService
+from app.sites import current_site_id
+from app.services.void_events import RELOAD, get_void_events, has_void_changes_since, latest_void_cursor
 
 void_bp = Blueprint('void', __name__)
 
@@ -29,7 +34,76 @@ def index():
 
     return render_template('void/index.html',
                           pending_requests=pending_requests,
-                          my_requests=my_requests)
+                          my_requests=my_requests,
+                          events_cursor=latest_void_cursor())
+
+
+@void_bp.route('/events')
+def events():
+    """
+    Server-Sent Events: void queue changes after a cursor
+
+    The page passes the cursor it was rendered at (?since=); the browser
+    sends Last-Event-ID when it reconnects. A `reload` event tells the page
+    that changes were missed. Threaded workers keep the stream open for
+    VOID_EVENTS_STREAM_SECONDS, at most VOID_EVENTS_MAX_STREAMS per process.
+    Otherwise (sync workers, streams full) the answer comes at once so a
+    supervisor tab never holds a worker, and the browser reconnects after
+    VOID_EVENTS_POLL_SECONDS.
+    """
+    try:
+        since = int(request.headers.get('Last-Event-ID') or request.args.get('since', 0))
+    except ValueError:
+        return {'error': 'since must be an integer'}, 400
+
+    config = current_app.config
+    bus = get_void_events()
+    # Each open stream holds a worker thread: keep some for ordinary requests
+    stream = (bus is not None and request.environ.get('wsgi.multithread', False)
+              and bus.subscriber_count() < config.get('VOID_EVENTS_MAX_STREAMS', 2))
+    # Subscribe before looking for missed changes, so nothing falls in between
+    subscription = bus.subscribe(db.engine) if stream else None
+    try:
+        missed = has_void_changes_since(since)
+    except Exception:
+        if subscription is not None:
+            bus.unsubscribe(subscription)
+        raise
+    # The stream needs no database: release the connection now
+    db.session.remove()
+
+    retry = 3 if stream else config.get('VOID_EVENTS_POLL_SECONDS', 15)
+    duration = config.get('VOID_EVENTS_STREAM_SECONDS', 300)
+    heartbeat = config.get('VOID_EVENTS_HEARTBEAT', 15)
+    site_id = current_site_id()  # The bus carries every site's changes
+
+    def generate():
+        try:
+            yield f'retry: {retry * 1000}\n\n'
+            if missed:
+                yield 'event: reload\ndata: {}\n\n'
+                return
+            if subscription is None:
+                return
+            deadline = time.monotonic() + duration
+            while time.monotonic() < deadline:
+                message = subscription.get(timeout=heartbeat)
+                if message is None:
+                    yield ': keep-alive\n\n'
+                elif message is RELOAD:
+                    yield 'event: reload\ndata: {}\n\n'
+                    return
+                elif site_id is None or message.get('site_id', site_id) == site_id:
+                    data = json.dumps(message, ensure_ascii=False)
+                    yield f'id: {message["cursor"]}\nevent: void\ndata: {data}\n\n'
+        finally:
+            if subscription is not None:
+                bus.unsubscribe(subscription)
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Proxies must not buffer the stream
+    return response
 
 
 @void_bp.route('/request/<int:receipt_id>', methods=['GET', 'POST'])
@@ -3,7 +3,29 @@ Business Logic Services
 """
 from app.services.number_chinese import amount_to_chinese
 from app.services.receipt_service import ReceiptService
-from app.services.pdf_service import ReceiptPDFService
 from app.services.report_service import ReportService
 
 __all__ = ['amount_to_chinese', 'ReceiptService', 'ReceiptPDFService', 'ReportService']
+
+
+def __getattr__(name):
+    """Import ReceiptPDFService (and ReportLab) only when it is first used"""
+    if name == 'ReceiptPDFService':
+        from app.services.pdf_service import ReceiptPDFService
+        return ReceiptPDFService
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def preload_optional_modules(font_path=None):
+    """
+    Import ReportLab and openpyxl up front and register the PDF font
+
+    Called from create_app when PRELOAD_OPTIONAL_MODULES is set, e.g. with
+    `gunicorn --preload` so workers share the pages forked from the master.
+    """
+    from app.services.pdf_service import register_fonts
+    register_fonts(font_path)
+    try:
+        import openpyxl  # noqa: F401
+    except ImportError:
+        pass
@@ -0,0 +1,140 @@
+"""
+Archive Service - Move receipts of closed periods to cold storage
+
+A month is closed when it lies before the hot window (ARCHIVE_HOT_MONTHS)
+and every operator who issued receipts in it has a PaymentRecord covering
+the whole month. Receipts with void requests stay in the hot table so the
+void history keeps its foreign keys.
+"""
+from calendar import monthrange
+from datetime import date, datetime
+from sqlalchemy import func, and_, insert, delete, select, text
+from app import db
+from app.models import (Receipt, VoidRequest, PaymentRecord, ReportVersion,
+                        ArchivedReceipt, ArchivedPeriod)
+
+
+def month_bounds(year, month):
+    """Get [start, next month start) datetimes of a month"""
+    start = datetime(year, month, 1)
+    if month == 12:
+        return start, datetime(year + 1, 1, 1)
+    return start, datetime(year, month + 1, 1)
+
+
+def shift_month(year, month, delta):
+    """Move (year, month) by delta months"""
+    index = year * 12 + (month - 1) + delta
+    return index // 12, index % 12 + 1
+
+
+class ArchiveService:
+    """Service for receipt archival"""
+
+    @staticmethod
+    def closed_periods(before):
+        """
+        Find months ready for archival
+
+        Args:
+            before: date; only months ending before it are considered
+
+        Returns:
+            List of (year, month) tuples, oldest first
+        """
+        year_col = func.extract('year', Receipt.created_at)
+        month_col = func.extract('month', Receipt.created_at)
+
+        months = db.session.query(year_col, month_col).filter(
+            Receipt.created_at < datetime(before.year, before.month, 1)
+        ).group_by(year_col, month_col).all()
+
+        archived = {p for (p,) in db.session.query(ArchivedPeriod.period)}
+
+        closed = []
+        for year, month in sorted((int(year), int(month)) for year, month in months):
+            if f'{year:04d}-{month:02d}' in archived:
+                continue
+            month_start, month_end = month_bounds(year, month)
+            # A payment of the receipt's operator covering the whole month
+            covered = db.session.query(PaymentRecord.id).filter(
+                PaymentRecord.operator_id == Receipt.operator_id,
+                PaymentRecord.period_start <= date(year, month, 1),
+                PaymentRecord.period_end >= date(year, month, monthrange(year, month)[1])
+            ).exists()
+            unsettled = db.session.query(Receipt.id).filter(
+                Receipt.created_at >= month_start,
+                Receipt.created_at < month_end,
+                ~covered
+            ).first()
+            if unsettled is None:
+                closed.append((year, month))
+
+        return closed
+
+    @staticmethod
+    def _ensure_partition(year, month):
+        """Create the monthly archive partition on PostgreSQL"""
+        if db.engine.dialect.name != 'postgresql':
+            return
+        start, end = month_bounds(year, month)
+        db.session.execute(text(
+            f'CREATE TABLE IF NOT EXISTS receipts_archive_y{year:04d}m{month:02d} '
+            f'PARTITION OF receipts_archive '
+            f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+        ))
+
+    @staticmethod
+    def archive_period(year, month):
+        """
+        Move a month's settled receipts to the archive in one transaction
+
+        Safe to re-run: archive rows left behind by an interrupted run are
+        replaced.
+
+        Returns:
+            Number of receipts moved
+        """
+        start, end = month_bounds(year, month)
+        in_month = and_(Receipt.created_at >= start, Receipt.created_at < end)
+        has_void_request = select(VoidRequest.id).where(
+            VoidRequest.receipt_id == Receipt.id
+        ).exists()
+        movable = select(Receipt.id).where(in_month, ~has_void_request)
+
+        ArchiveService._ensure_partition(year, month)
+
+        # Drop leftovers of an interrupted run (still present in the hot table)
+        db.session.execute(delete(ArchivedReceipt).where(
+            ArchivedReceipt.created_at >= start,
+            ArchivedReceipt.created_at < end,
+            ArchivedReceipt.id.in_(select(Receipt.id).where(in_month))
+        ))
+
+        site_ids = db.session.scalars(
+            select(Receipt.site_id).where(Receipt.id.in_(movable)).distinct()
+        ).all()
+        columns = ArchivedReceipt.COPY_COLUMNS
+        db.session.execute(
+            insert(ArchivedReceipt).from_select(
+                columns,
+                select(*[getattr(Receipt, c) for c in columns]).where(Receipt.id.in_(movable))
+            )
+        )
+        moved = db.session.execute(
+            delete(Receipt).where(Receipt.id.in_(movable)).execution_options(
+                synchronize_session=False
+            )
+        ).rowcount
+
+        period = f'{year:04d}-{month:02d}'
+        archived_period = ArchivedPeriod.query.get(period)
+        if archived_period is None:
+            db.session.add(ArchivedPeriod(period=period, receipt_count=moved))
+        else:
+            archived_period.receipt_count += moved
+        for site_id in site_ids:
+            ReportVersion.bump(period, site_id)
+
+        db.session.commit()
+        return moved
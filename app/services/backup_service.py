@@ -0,0 +1,542 @@
+"""
+Backup Service - Online backups, WAL shipping and point-in-time restore (SQLite)
+
+Three pieces, all working on the database file while the app keeps
+issuing receipts:
+
+    - online_backup(): SQLite's backup API copying BACKUP_STEP_PAGES pages
+      per step. In WAL mode the copy reads one snapshot and never blocks
+      writers; with the rollback journal the read lock is released between
+      steps so receipt writes get in (the copy restarts when they do and
+      takes bigger steps after a few restarts).
+    - WalShipper (flask wal-ship): every WAL_SHIP_INTERVAL seconds copies
+      the frames committed to the -wal file since the last round into a
+      segment file. A shipping run is a generation: a base copy aligned with
+      the WAL position, then its segments. The shipper keeps a read
+      transaction open so SQLite cannot restart the WAL over frames it has
+      not copied yet.
+    - restore_database(): the newest snapshot or base + segments at or
+      before a point in time, written to a new file.
+
+Layout of BACKUP_DIR:
+    snapshots/swim-YYYYmmddTHHMMSS.db       online backups
+    wal/<generation>/base.db, meta.json     one per wal-ship run
+    wal/<generation>/segments/NNNNNNNN-YYYYmmddTHHMMSS.wal
+
+PostgreSQL deployments use pg_basebackup and WAL archiving instead.
+"""
+import json
+import os
+import shutil
+import sqlite3
+import struct
+import time
+from datetime import datetime
+from app.timezone import now_tw
+
+STAMP_FORMAT = '%Y%m%dT%H%M%S'
+
+# magic, format version, page size, checkpoint seq, salt1, salt2, cksum1, cksum2
+WAL_HEADER = struct.Struct('>IIIIIIII')
+# page number, pages in the database after a commit (0 otherwise), salt1, salt2, cksum1, cksum2
+FRAME_HEADER = struct.Struct('>IIIIII')
+WAL_MAGIC = (0x377f0682, 0x377f0683)  # Checksums over little/big-endian words
+
+
+class BackupError(Exception):
+    """Backup or restore cannot proceed"""
+
+
+class _Restarted(Exception):
+    """Online backup restarted too often at the current step size"""
+
+
+def _stamp():
+    return now_tw().strftime(STAMP_FORMAT)
+
+
+def _parse_stamp(value):
+    try:
+        return datetime.strptime(value, STAMP_FORMAT)
+    except ValueError:
+        return None
+
+
+def _fsync_file(path):
+    with open(path, 'rb+') as f:
+        os.fsync(f.fileno())
+
+
+def _connect(path):
+    # Autocommit: transactions are opened explicitly with BEGIN
+    connection = sqlite3.connect(path, isolation_level=None, timeout=30)
+    connection.execute('PRAGMA busy_timeout=30000')
+    return connection
+
+
+# -- online backup ----------------------------------------------------
+
+def online_backup(db_path, dest_path, pages=256, sleep=0.005, max_restarts=3, source=None):
+    """
+    Copy a live SQLite database in small steps
+
+    Args:
+        db_path: Database file being backed up
+        dest_path: File to create (written as dest_path.tmp, then renamed)
+        pages: Pages copied per step
+        sleep: Seconds between steps (rollback journal: writers get the lock)
+        max_restarts: Restarts caused by concurrent writes before the step
+                      size is multiplied by 8 (-1, one step, at the end)
+        source: Open connection whose read transaction pins the snapshot
+                to copy (WAL shipping); by default one is opened here
+
+    Returns:
+        dict with pages, steps, restarts, seconds
+    """
+    tmp_path = dest_path + '.tmp'
+    own_source = source is None
+    if own_source:
+        source = _connect(db_path)
+    stats = {'pages': 0, 'steps': 0, 'restarts': 0}
+    start = time.perf_counter()
+    try:
+        wal = source.execute('PRAGMA journal_mode').fetchone()[0].lower() == 'wal'
+        if own_source and wal:
+            # One snapshot for the whole copy; WAL readers never block writers
+            source.execute('BEGIN')
+            source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+
+        while True:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            target = sqlite3.connect(tmp_path)
+            progress_state = {'remaining': None, 'restarts': 0}
+
+            def progress(status, remaining, total):
+                stats['steps'] += 1
+                stats['pages'] = total
+                last = progress_state['remaining']
+                if last is not None and remaining > last:
+                    # Another connection wrote: SQLite starts over
+                    progress_state['restarts'] += 1
+                    stats['restarts'] += 1
+                    if pages > 0 and progress_state['restarts'] > max_restarts:
+                        raise _Restarted()
+                progress_state['remaining'] = remaining
+
+            try:
+                source.backup(target, pages=pages, progress=progress, sleep=sleep)
+                break
+            except _Restarted:
+                pages = pages * 8 if pages < 65536 else -1
+            finally:
+                target.close()
+
+        check = sqlite3.connect(tmp_path)
+        try:
+            if check.execute('PRAGMA quick_check').fetchone()[0] != 'ok':
+                raise BackupError(f'Backup of {db_path} failed the integrity check')
+            # A standalone copy: no -wal file to keep next to it
+            check.execute('PRAGMA journal_mode=DELETE')
+        finally:
+            check.close()
+        _fsync_file(tmp_path)
+        os.replace(tmp_path, dest_path)
+    finally:
+        if own_source:
+            if source.in_transaction:
+                source.execute('ROLLBACK')
+            source.close()
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+    stats['seconds'] = time.perf_counter() - start
+    return stats
+
+
+def backup_snapshot(db_path, backup_dir, pages=256, sleep=0.005, keep=7, archive_path=None):
+    """
+    Write snapshots/swim-<stamp>.db and prune old snapshots
+
+    The archive database (ARCHIVE_SQLITE_PATH) is copied alongside as
+    swim-<stamp>-archive.db.
+
+    Returns:
+        (path, stats of the main database copy)
+    """
+    directory = os.path.join(backup_dir, 'snapshots')
+    os.makedirs(directory, exist_ok=True)
+    new_path = os.path.join(directory, 'swim-new.db')
+    stats = online_backup(db_path, new_path, pages=pages, sleep=sleep)
+    # Stamped when done: the copy holds nothing committed after its name
+    stamp = _stamp()
+    path = os.path.join(directory, f'swim-{stamp}.db')
+    os.replace(new_path, path)
+    if archive_path and os.path.exists(archive_path):
+        online_backup(archive_path, os.path.join(directory, f'swim-{stamp}-archive.db'),
+                      pages=pages, sleep=sleep)
+
+    if keep:
+        for old in list_snapshots(backup_dir)[:-keep]:
+            for suffix in ('.db', '-archive.db'):
+                stale = os.path.join(directory, f'swim-{old[0].strftime(STAMP_FORMAT)}{suffix}')
+                if os.path.exists(stale):
+                    os.unlink(stale)
+    return path, stats
+
+
+def list_snapshots(backup_dir):
+    """[(taken_at, path)] of the snapshots, oldest first"""
+    directory = os.path.join(backup_dir, 'snapshots')
+    snapshots = []
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            if name.startswith('swim-') and name.endswith('.db') and not name.endswith('-archive.db'):
+                taken_at = _parse_stamp(name[5:-3])
+                if taken_at:
+                    snapshots.append((taken_at, os.path.join(directory, name)))
+    return sorted(snapshots)
+
+
+# -- WAL frames -------------------------------------------------------
+
+def _checksum(data, s0, s1, big_endian):
+    """SQLite WAL checksum of data (a multiple of 8 bytes), continuing s0/s1"""
+    words = struct.unpack(('>' if big_endian else '<') + f'{len(data) // 4}I', data)
+    for i in range(0, len(words), 2):
+        s0 = (s0 + words[i] + s1) & 0xFFFFFFFF
+        s1 = (s1 + words[i + 1] + s0) & 0xFFFFFFFF
+    return s0, s1
+
+
+def read_wal_header(wal_path):
+    """WAL header fields as a dict, or None if there is no valid header"""
+    try:
+        with open(wal_path, 'rb') as f:
+            data = f.read(WAL_HEADER.size)
+    except FileNotFoundError:
+        return None
+    if len(data) < WAL_HEADER.size:
+        return None
+    magic, version, page_size, seq, salt1, salt2, cksum1, cksum2 = WAL_HEADER.unpack(data)
+    if magic not in WAL_MAGIC:
+        return None
+    big_endian = magic & 1 == 1
+    if _checksum(data[:24], 0, 0, big_endian) != (cksum1, cksum2):
+        return None
+    return {'page_size': page_size, 'salt': (salt1, salt2),
+            'cksum': (cksum1, cksum2), 'big_endian': big_endian}
+
+
+def read_committed_frames(wal_path, header, offset, cksum):
+    """
+    Frames of committed transactions from offset on
+
+    Stops at the first frame of another WAL generation (salt), with a bad
+    checksum (still being written) or after the last commit frame.
+
+    Returns:
+        (frame bytes, offset after them, running checksum after them)
+    """
+    frame_size = FRAME_HEADER.size + header['page_size']
+    chunks = []
+    committed = (offset, cksum, 0)
+    with open(wal_path, 'rb') as f:
+        f.seek(offset)
+        while True:
+            frame = f.read(frame_size)
+            if len(frame) < frame_size:
+                break
+            pgno, commit, salt1, salt2, cksum1, cksum2 = FRAME_HEADER.unpack_from(frame)
+            if (salt1, salt2) != header['salt']:
+                break
+            s0, s1 = _checksum(frame[:8], *cksum, header['big_endian'])
+            s0, s1 = _checksum(frame[FRAME_HEADER.size:], s0, s1, header['big_endian'])
+            if (s0, s1) != (cksum1, cksum2):
+                break
+            cksum = (s0, s1)
+            chunks.append(frame)
+            if commit:
+                committed = (offset + frame_size * len(chunks), cksum, len(chunks))
+    end, cksum, count = committed
+    return b''.join(chunks[:count]), end, cksum
+
+
+def apply_frames(db_file, data, page_size):
+    """Write WAL frames into an open database file (as a checkpoint would)"""
+    frame_size = FRAME_HEADER.size + page_size
+    for start in range(0, len(data), frame_size):
+        pgno, commit = struct.unpack_from('>II', data, start)
+        db_file.seek((pgno - 1) * page_size)
+        db_file.write(data[start + FRAME_HEADER.size:start + frame_size])
+        if commit:
+            db_file.truncate(commit * page_size)
+
+
+# -- WAL shipping -----------------------------------------------------
+
+class WalShipper:
+    """Copy committed WAL frames of a live database into a backup directory"""
+
+    def __init__(self, db_path, backup_dir, pages=256, sleep=0.005,
+                 rotate_bytes=16 * 1024 * 1024, keep_generations=3):
+        self.db_path = db_path
+        self.wal_path = db_path + '-wal'
+        self.directory = os.path.join(backup_dir, 'wal')
+        self.pages = pages
+        self.sleep = sleep
+        self.rotate_bytes = rotate_bytes
+        self.keep_generations = keep_generations
+        self.generation = None
+        self.segments = 0
+        self._reader = None
+        self._header = None
+        self._offset = None
+        self._cksum = None
+
+    @property
+    def generation_dir(self):
+        return os.path.join(self.directory, self.generation)
+
+    def _pin(self):
+        """Open a read transaction: SQLite keeps the WAL frames it can see"""
+        reader = _connect(self.db_path)
+        reader.execute('BEGIN')
+        reader.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+        previous, self._reader = self._reader, reader
+        if previous is not None:
+            previous.execute('ROLLBACK')
+            previous.close()
+
+    def _scan_header(self):
+        """Follow the WAL from the current header (restarted WAL: new header)"""
+        header = read_wal_header(self.wal_path)
+        if header is None:
+            return
+        if self._header is None or header['salt'] != self._header['salt']:
+            # Each restart increments salt1 (the checkpoint sequence is per connection)
+            if self._header is not None and \
+                    header['salt'][0] != (self._header['salt'][0] + 1) & 0xFFFFFFFF:
+                raise BackupError('WAL restarted more than once between rounds; '
+                                  'frames may be missing (start a new generation)')
+            self._header = header
+            self._offset = WAL_HEADER.size
+            self._cksum = header['cksum']
+
+    def start_generation(self):
+        """Write the base copy of a new generation, aligned with the WAL position"""
+        # Hold the write lock just long enough to pin a snapshot at the WAL position
+        self._header = None
+        self.segments = 0
+        lock = _connect(self.db_path)
+        try:
+            if lock.execute('PRAGMA journal_mode').fetchone()[0].lower() != 'wal':
+                raise BackupError('WAL shipping needs SQLITE_PROFILE=wal')
+            lock.execute('BEGIN IMMEDIATE')
+            self._scan_header()
+            if self._header is not None:
+                _, self._offset, self._cksum = read_committed_frames(
+                    self.wal_path, self._header, self._offset, self._cksum)
+            self._pin()
+            lock.execute('ROLLBACK')
+        finally:
+            lock.close()
+
+        # Named after the pinned snapshot, never before it
+        self.generation = _stamp()
+        while os.path.exists(self.generation_dir):
+            time.sleep(1)
+            self.generation = _stamp()
+        os.makedirs(os.path.join(self.generation_dir, 'segments'))
+        online_backup(self.db_path, os.path.join(self.generation_dir, 'base.db'),
+                      pages=self.pages, sleep=self.sleep, source=self._reader)
+        page_size = self._reader.execute('PRAGMA page_size').fetchone()[0]
+        with open(os.path.join(self.generation_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({'generation': self.generation, 'page_size': page_size}, f)
+        self._prune()
+        return self.generation
+
+    def ship(self):
+        """
+        Copy the frames committed since the last round into one segment
+
+        Returns:
+            Number of bytes shipped (0 if nothing was committed)
+        """
+        if self.generation is None:
+            self.start_generation()
+
+        # Pin a newer snapshot before releasing the old one: never unprotected
+        self._pin()
+        self._scan_header()
+        if self._header is None:
+            return 0
+        if self._header['page_size'] != self._page_size():
+            raise BackupError('WAL page size changed; start a new generation')
+
+        data, self._offset, self._cksum = read_committed_frames(
+            self.wal_path, self._header, self._offset, self._cksum)
+        if data:
+            self._write_segment(data)
+        if self._offset >= self.rotate_bytes:
+            self._rotate()
+        return len(data)
+
+    def _page_size(self):
+        with open(os.path.join(self.generation_dir, 'meta.json'), encoding='utf-8') as f:
+            return json.load(f)['page_size']
+
+    def _write_segment(self, data):
+        self.segments += 1
+        name = f'{self.segments:08d}-{_stamp()}.wal'
+        path = os.path.join(self.generation_dir, 'segments', name)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+
+    def _rotate(self):
+        """
+        Let SQLite restart a long WAL without losing frames
+
+        With writers locked out: ship the tail, release the pinned snapshot
+        and checkpoint everything. The next writer restarts the WAL (new
+        salt), which the next round follows from its header.
+        """
+        lock = _connect(self.db_path)
+        try:
+            lock.execute('BEGIN IMMEDIATE')
+            data, self._offset, self._cksum = read_committed_frames(
+                self.wal_path, self._header, self._offset, self._cksum)
+            if data:
+                self._write_segment(data)
+            self._reader.execute('ROLLBACK')
+            self._reader.close()
+            self._reader = None
+            checkpointer = _connect(self.db_path)
+            try:
+                checkpointer.execute('PRAGMA wal_checkpoint(PASSIVE)').fetchone()
+            finally:
+                checkpointer.close()
+            self._pin()
+            lock.execute('ROLLBACK')
+        finally:
+            lock.close()
+
+    def _prune(self):
+        if not self.keep_generations:
+            return
+        generations = sorted(name for name in os.listdir(self.directory)
+                             if _parse_stamp(name))
+        for name in generations[:-self.keep_generations]:
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    def close(self):
+        if self._reader is not None:
+            self._reader.execute('ROLLBACK')
+            self._reader.close()
+            self._reader = None
+
+
+def list_generations(backup_dir):
+    """
+    WAL shipping generations, oldest first
+
+    Returns:
+        [{'generation', 'base_at', 'path', 'page_size',
+          'segments': [(shipped_at, path), ...]}]
+    """
+    directory = os.path.join(backup_dir, 'wal')
+    generations = []
+    if not os.path.isdir(directory):
+        return generations
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        base_at = _parse_stamp(name)
+        meta_path = os.path.join(path, 'meta.json')
+        if base_at is None or not os.path.exists(meta_path):
+            continue  # Base copy still being written
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+        segments = []
+        segment_dir = os.path.join(path, 'segments')
+        for segment in sorted(os.listdir(segment_dir)):
+            if segment.endswith('.wal'):
+                segments.append((_parse_stamp(segment[9:-4]), os.path.join(segment_dir, segment)))
+        generations.append({'generation': name, 'base_at': base_at, 'path': path,
+                            'page_size': meta['page_size'], 'segments': segments})
+    return generations
+
+
+# -- restore ----------------------------------------------------------
+
+def restore_points(backup_dir):
+    """[(point in time, description)] available for restore, oldest first"""
+    points = [(taken_at, f'snapshot {os.path.basename(path)}')
+              for taken_at, path in list_snapshots(backup_dir)]
+    for generation in list_generations(backup_dir):
+        points.append((generation['base_at'], f"generation {generation['generation']} base"))
+        if generation['segments']:
+            points.append((generation['segments'][-1][0],
+                           f"generation {generation['generation']} "
+                           f"+ {len(generation['segments'])} segment(s)"))
+    return sorted(points)
+
+
+def restore_database(backup_dir, output_path, target=None):
+    """
+    Rebuild the database as of a point in time into a new file
+
+    Uses whichever is newer at or before target: a snapshot, or the base of
+    a WAL shipping generation plus its segments shipped by then.
+
+    Args:
+        backup_dir: BACKUP_DIR
+        output_path: File to create (must not exist)
+        target: Naive Taiwan time; None restores the latest state
+
+    Returns:
+        dict with restored_at, source, segments
+    """
+    if os.path.exists(output_path):
+        raise BackupError(f'{output_path} already exists')
+    target = target or datetime.max
+
+    best = None  # (point, source path, generation, segments)
+    for taken_at, path in list_snapshots(backup_dir):
+        if taken_at <= target:
+            best = (taken_at, path, None, [])
+    for generation in list_generations(backup_dir):
+        if generation['base_at'] > target:
+            continue
+        segments = [path for shipped_at, path in generation['segments'] if shipped_at <= target]
+        point = max([generation['base_at']] + [shipped_at for shipped_at, _ in
+                                               generation['segments'] if shipped_at <= target])
+        if best is None or point >= best[0]:
+            best = (point, os.path.join(generation['path'], 'base.db'), generation, segments)
+    if best is None:
+        raise BackupError('No backup at or before the requested time')
+
+    point, source, generation, segments = best
+    tmp_path = output_path + '.tmp'
+    shutil.copyfile(source, tmp_path)
+    try:
+        if segments:
+            with open(tmp_path, 'r+b') as db_file:
+                for path in segments:
+                    with open(path, 'rb') as f:
+                        apply_frames(db_file, f.read(), generation['page_size'])
+        check = sqlite3.connect(tmp_path)
+        try:
+            if check.execute('PRAGMA integrity_check').fetchone()[0] != 'ok':
+                raise BackupError('Restored database failed the integrity check')
+            check.execute('PRAGMA journal_mode=DELETE')
+        finally:
+            check.close()
+        _fsync_file(tmp_path)
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+    return {'restored_at': point, 'source': source, 'segments': len(segments)}
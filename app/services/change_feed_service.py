@@ -0,0 +1,42 @@
+"""
+Change Feed Service - Receipt events after a cursor, for downstream sync
+
+A consumer keeps the last cursor it processed and asks for events after
+it; each call costs O(new events), independent of the receipt history.
+Like every site-scoped query, a request only sees its own site's events
+(a site's cursors are in commit order); CLI code sees every site.
+"""
+from flask import current_app
+from app.models import ReceiptEvent
+
+
+class ChangeFeedService:
+    """Service for reading the receipt event log"""
+
+    @staticmethod
+    def iter_events(since=0, limit=None):
+        """
+        Iterate events with a cursor greater than `since`, oldest first
+
+        Fetches REPORT_YIELD_PER rows per round trip, so a large page is
+        streamed rather than loaded.
+
+        Args:
+            since: Last cursor the consumer has processed (0: from the start)
+            limit: Maximum number of events (default: CHANGES_PAGE_SIZE)
+
+        Yields:
+            ReceiptEvent objects
+        """
+        if limit is None:
+            limit = current_app.config.get('CHANGES_PAGE_SIZE', 1000)
+        yield_per = min(limit, current_app.config.get('REPORT_YIELD_PER', 1000))
+        query = ReceiptEvent.query.filter(ReceiptEvent.id > since) \
+            .order_by(ReceiptEvent.id).limit(limit).yield_per(yield_per)
+        yield from query
+
+    @staticmethod
+    def has_more(cursor):
+        """Check if there are events after `cursor`"""
+        return ReceiptEvent.query.filter(ReceiptEvent.id > cursor).first() is not None
+
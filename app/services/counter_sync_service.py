@@ -0,0 +1,214 @@
+"""
+Counter Sync Service - Push offline counter receipts to the central database
+
+A counter in COUNTER_MODE writes receipts to its local database (a small
+SQLite journal) with numbers from blocks reserved in advance, so issuing
+a receipt never waits on the campus network. `flask counter-sync` then,
+every COUNTER_SYNC_INTERVAL seconds:
+
+    1. pulls sites, users and fee items from the central database,
+    2. tops up the counter's number blocks for the coming days,
+    3. pushes pending receipts in batches. Inserts are idempotent
+       (ON CONFLICT DO NOTHING on receipt_no), so a batch interrupted after
+       the central commit is simply confirmed on the next round. A central
+       receipt with the same number but different content is reported as a
+       conflict and left for a supervisor.
+
+A counter serves one site: its RECEIPT_PREFIX must be that site's
+receipt prefix, since its number blocks are reserved under it.
+"""
+from datetime import timedelta
+from decimal import Decimal
+from flask import current_app
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+from app import db
+from app.config import normalize_database_url
+from app.models import (Site, User, FeeItem, Receipt, ReportVersion, ReceiptSequence,
+                        ReceiptNumberBlock, CounterOutbox, ReceiptEvent, SalesCube)
+from app.timezone import now_tw, today_tw
+
+# Columns that must match for a central receipt to be the same sale
+MATCH_COLUMNS = ['item_id', 'amount', 'operator_id', 'created_at']
+
+
+def _row_values(obj, exclude=()):
+    return {c.key: getattr(obj, c.key) for c in obj.__table__.columns if c.key not in exclude}
+
+
+def _same_value(local, central):
+    if isinstance(local, Decimal) or isinstance(central, Decimal):
+        return Decimal(str(local)) == Decimal(str(central))
+    return local == central
+
+
+class CounterSyncService:
+    """Synchronizes this counter's local database with the central database"""
+
+    def __init__(self, central_url, counter_id, prefix='SWIM', batch_size=200,
+                 block_size=200, block_days=2):
+        url = normalize_database_url(central_url)
+        self.engine = create_engine(url, pool_pre_ping=True)
+        self.Session = sessionmaker(bind=self.engine)
+        self.counter_id = counter_id
+        self.prefix = prefix
+        self.batch_size = batch_size
+        self.block_size = block_size
+        self.block_days = block_days
+
+    @classmethod
+    def from_app(cls, app):
+        """Create the service from the application's COUNTER_* settings"""
+        return cls(
+            app.config['COUNTER_CENTRAL_DATABASE_URL'],
+            app.config['COUNTER_ID'],
+            prefix=app.config.get('RECEIPT_PREFIX', 'SWIM'),
+            batch_size=app.config.get('COUNTER_SYNC_BATCH', 200),
+            block_size=app.config.get('COUNTER_BLOCK_SIZE', 200),
+            block_days=app.config.get('COUNTER_BLOCK_DAYS', 2)
+        )
+
+    def sync_once(self):
+        """
+        Run one sync round
+
+        Returns:
+            dict with counts: reference rows pulled, blocks allocated,
+            receipts synced and conflicts found
+        """
+        stats = {'reference': self.pull_reference_data(), 'blocks': self.refill_blocks(),
+                 'synced': 0, 'conflicts': 0}
+        while True:
+            synced, conflicts = self.push_receipts()
+            stats['synced'] += synced
+            stats['conflicts'] += conflicts
+            if synced + conflicts < self.batch_size:
+                return stats
+
+    def pull_reference_data(self):
+        """Copy sites, users and fee items from the central database (same ids)"""
+        count = 0
+        with self.Session() as central:
+            for model in (Site, User, FeeItem):
+                for obj in central.execute(select(model)).scalars():
+                    db.session.merge(model(**_row_values(obj)))
+                    count += 1
+        db.session.commit()
+        Site.forget()
+        # Role or active flag may have changed at the central office
+        cache = current_app.extensions.get('identity_cache')
+        if cache is not None:
+            cache.invalidate()
+        return count
+
+    def refill_blocks(self):
+        """
+        Reserve number blocks for today and the next days
+
+        A new block is allocated when less than half a block is left for a
+        day. The central commit comes first: a crash in between only leaves
+        a gap in the numbering, never a reused number.
+        """
+        allocated = 0
+        today = today_tw()
+        for offset in range(self.block_days):
+            day = (today + timedelta(days=offset)).strftime('%Y%m%d')
+            if ReceiptNumberBlock.remaining(self.counter_id, self.prefix, day) >= self.block_size // 2:
+                continue
+
+            with self.Session() as central, central.begin():
+                start = ReceiptSequence.allocate(self.prefix, day, self.block_size, session=central)
+                values = dict(counter_id=self.counter_id, prefix=self.prefix, day=day,
+                              start_seq=start, end_seq=start + self.block_size - 1,
+                              next_seq=start)
+                central.add(ReceiptNumberBlock(**values))
+
+            db.session.add(ReceiptNumberBlock(**values))
+            db.session.commit()
+            allocated += 1
+        return allocated
+
+    def _insert_ignore(self, central, rows):
+        """
+        INSERT receipts, skipping receipt numbers the central database already has
+
+        Returns:
+            Set of receipt numbers actually inserted
+        """
+        dialect = self.engine.dialect.name
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        elif dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            raise RuntimeError(f'Unsupported central database: {dialect}')
+        statement = insert(Receipt.__table__).on_conflict_do_nothing(
+            index_elements=['receipt_no']
+        ).returning(Receipt.__table__.c.receipt_no)
+        return set(central.execute(statement, rows).scalars())
+
+    def push_receipts(self):
+        """
+        Push one batch of pending receipts
+
+        Returns:
+            (synced, conflicts) counts
+        """
+        entries = CounterOutbox.query.filter_by(
+            status=CounterOutbox.STATUS_PENDING
+        ).order_by(CounterOutbox.id).limit(self.batch_size).all()
+        if not entries:
+            return 0, 0
+
+        receipts = {entry.receipt_no: entry.receipt for entry in entries}
+        with self.Session() as central, central.begin():
+            inserted = self._insert_ignore(
+                central, [_row_values(r, exclude=('id',)) for r in receipts.values()]
+            )
+            stored = {
+                r.receipt_no: r for r in central.execute(
+                    select(Receipt).where(Receipt.receipt_no.in_(list(receipts)))
+                ).scalars()
+            }
+            for site_id, period in {(r.site_id, ReportVersion.period_of(r.created_at))
+                                    for r in receipts.values()}:
+                ReportVersion.bump(period, site_id, session=central)
+            # A re-sent receipt was counted and announced by the round that inserted it
+            for receipt_no in sorted(inserted):
+                receipt = stored[receipt_no]
+                if receipt.status == Receipt.STATUS_ACTIVE:
+                    SalesCube.add(receipt.created_at, receipt.item_id, 1, receipt.amount,
+                                  receipt.site_id, session=central)
+            # Change feed events last (ReceiptEvent.record)
+            for receipt_no in sorted(inserted):
+                ReceiptEvent.record(stored[receipt_no], ReceiptEvent.TYPE_CREATED,
+                                    stored[receipt_no].operator_id, session=central)
+
+            # Resolve inside the central transaction, apply locally after its commit
+            results = {}
+            for receipt_no, receipt in receipts.items():
+                central_receipt = stored[receipt_no]
+                mismatched = [name for name in MATCH_COLUMNS
+                              if not _same_value(getattr(receipt, name), getattr(central_receipt, name))]
+                results[receipt_no] = (central_receipt.id, mismatched,
+                                       {name: getattr(central_receipt, name) for name in mismatched})
+
+        synced = conflicts = 0
+        now = now_tw()
+        for entry in entries:
+            central_id, mismatched, central_values = results[entry.receipt_no]
+            entry.central_receipt_id = central_id
+            entry.synced_at = now
+            if mismatched:
+                entry.status = CounterOutbox.STATUS_CONFLICT
+                entry.detail = ('Central receipt differs: ' + ', '.join(
+                    f'{name}={central_values[name]}' for name in mismatched))[:500]
+                conflicts += 1
+                current_app.logger.warning('Receipt %s conflicts with the central database: %s',
+                                           entry.receipt_no, entry.detail)
+            else:
+                entry.status = CounterOutbox.STATUS_SYNCED
+                synced += 1
+        db.session.commit()
+        return synced, conflicts
+
@@ -0,0 +1,226 @@
+"""
+ESC/POS Service - Print receipts directly on a thermal receipt printer
+
+Receipts are rendered to an ESC/POS byte stream: Chinese text in the
+printer's Big5 (CP950) character mode, the receipt number as a QR code or
+CODE128 barcode drawn by the printer itself, and a header bitmap with the
+school and site name. The stream is written to the printer of the
+receipt's site (Site.printer_url; PRINTER_URL for the default site when
+it has none): a raw TCP printer port (tcp://host:9100) or a device/file
+path (/dev/usb/lp0). The app host itself sends to the printer.
+
+Header bitmaps need Pillow and a Chinese font (PDF_FONT_PATH or the PDF
+font list); without them the header is printed in the printer's own font.
+Headers are rendered once per process and site, so a receipt is a few
+hundred bytes of text around a cached bitmap.
+"""
+import os
+import socket
+import threading
+from urllib.parse import urlsplit
+from flask import current_app, has_app_context
+from app.models.site import Site
+from app.sites import DEFAULT_SITE_ID
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:  # Optional dependency
+    Image = None
+
+
+ENCODING = 'cp950'  # Big5 with the Windows extensions, as in Taiwanese printers
+
+INIT = b'\x1b@'
+CHINESE_ON = b'\x1c&'
+ALIGN_LEFT, ALIGN_CENTER = b'\x1ba\x00', b'\x1ba\x01'
+BOLD_ON, BOLD_OFF = b'\x1bE\x01', b'\x1bE\x00'
+SIZE_NORMAL = b'\x1d!\x00\x1c!\x00'
+SIZE_DOUBLE = b'\x1d!\x11\x1c!\x0c'  # Double width and height, half- and full-width
+FEED_AND_CUT = b'\x1dVB\x03'  # Feed 3 lines, partial cut
+
+CHAR_DOTS = 12  # Font A: 12 dots per half-width column, 24 per Chinese character
+
+SCHOOL_NAME = '\u81fa\u5317\u5e02\u7acb\u5927\u5b78'
+TITLE_SUFFIX = '\u6536\u8cbb\u6536\u64da'
+FOOTER = '\u672c\u6536\u64da\u70ba\u6e38\u6cf3\u6c60\u73fe\u91d1\u6536\u8cbb\u8b49\u660e\uff0c\u8acb\u59a5\u5584\u4fdd\u7ba1'
+
+# Per-process header cache: (site_id, site name, width, font) -> bytes
+_header_lock = threading.Lock()
+_headers = {}
+
+
+def encode(text):
+    """Text in the printer's Chinese character mode"""
+    return text.encode(ENCODING, errors='replace')
+
+
+def raster(bits, width, height):
+    """
+    GS v 0 raster bitmap command
+
+    Args:
+        bits: Packed rows, most significant bit first, 1 = black dot
+        width: Width in dots (multiple of 8)
+        height: Height in dots
+    """
+    row_bytes = width // 8
+    return b'\x1dv0\x00' + bytes((row_bytes & 0xff, row_bytes >> 8,
+                                  height & 0xff, height >> 8)) + bits
+
+
+def qr_code(data, module_size=6):
+    """GS ( k commands storing and printing a QR code (model 2, level M)"""
+    data = data.encode('ascii')
+    store = len(data) + 3
+    return (b'\x1d(k\x04\x001A2\x00'
+            + b'\x1d(k\x03\x001C' + bytes((module_size,))
+            + b'\x1d(k\x03\x001E1'
+            + b'\x1d(k' + bytes((store & 0xff, store >> 8)) + b'1P0' + data
+            + b'\x1d(k\x03\x001Q0')
+
+
+def barcode(data, width_dots):
+    """GS k CODE128 (code set B) with the text printed below, as wide as fits"""
+    modules = 11 * (len(data) + 2) + 13  # Start, data and check symbols, stop
+    data = b'{B' + data.encode('ascii')
+    module_width = max(1, min(3, width_dots // modules))
+    return (b'\x1dh\x50' + b'\x1dw' + bytes((module_width,)) + b'\x1dH\x02'
+            + b'\x1dk\x49' + bytes((len(data),)) + data)
+
+
+def find_font(font_path=None):
+    """Chinese font for header bitmaps: font_path, else the PDF font list"""
+    from app.services.pdf_service import FONT_PATHS
+    for path in ([font_path] if font_path else []) + FONT_PATHS:
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def send(data, url, timeout=5.0):
+    """
+    Write a byte stream to a printer
+
+    Args:
+        data: ESC/POS bytes
+        url: tcp://host[:port] (raw port, default 9100), or a device or
+            file path (file:// optional); files are appended to
+        timeout: Seconds to connect and send (TCP)
+
+    Raises:
+        OSError: The printer is unreachable or the device is not writable
+    """
+    parts = urlsplit(url)
+    if parts.scheme == 'tcp':
+        with socket.create_connection((parts.hostname, parts.port or 9100), timeout) as sock:
+            sock.sendall(data)
+        return
+    path = parts.path if parts.scheme == 'file' else url
+    with open(path, 'ab', buffering=0) as f:
+        f.write(data)
+
+
+class EscPosService:
+    """
+    Render receipts to ESC/POS and send them to the configured printer
+
+    Only the per-process header cache is shared; instances are cheap and
+    safe to create per request.
+    """
+
+    def __init__(self, width=None, code=None, font_path=None):
+        """
+        Args:
+            width: Printable width in dots (default PRINTER_WIDTH: 576 for
+                80 mm paper, 384 for 58 mm)
+            code: 'qr', 'barcode' or '' (default PRINTER_CODE)
+            font_path: Header bitmap font (default PDF_FONT_PATH)
+        """
+        config = current_app.config if has_app_context() else {}
+        self.width = (width or config.get('PRINTER_WIDTH', 576)) // 8 * 8
+        self.code = config.get('PRINTER_CODE', 'qr') if code is None else code
+        self.font_path = font_path or config.get('PDF_FONT_PATH')
+        self.columns = self.width // CHAR_DOTS
+
+    def header(self, site_id):
+        """Header of a site's receipts (bitmap when possible), cached per process"""
+        name = Site.describe(site_id)[1]
+        key = (site_id, name, self.width, self.font_path)
+        header = _headers.get(key)
+        if header is None:
+            with _header_lock:
+                header = _headers.get(key)
+                if header is None:
+                    font = find_font(self.font_path) if Image is not None else None
+                    lines = [SCHOOL_NAME, name + TITLE_SUFFIX]
+                    header = self._bitmap_header(lines, font) if font else self._text_header(lines)
+                    _headers[key] = header
+        return header
+
+    def _text_header(self, lines):
+        return (ALIGN_CENTER + SIZE_DOUBLE
+                + b''.join(encode(line) + b'\n' for line in lines)
+                + SIZE_NORMAL + ALIGN_LEFT)
+
+    def _bitmap_header(self, lines, font_path):
+        fonts = [ImageFont.truetype(font_path, size, index=0) for size in (40, 32)]
+        heights = [font.getbbox(line)[3] + 8 for line, font in zip(lines, fonts)]
+        image = Image.new('1', (self.width, sum(heights)), 0)
+        draw = ImageDraw.Draw(image)
+        top = 0
+        for line, font, height in zip(lines, fonts, heights):
+            draw.text((self.width // 2, top), line, font=font, fill=1, anchor='mt')
+            top += height
+        return ALIGN_CENTER + raster(image.tobytes(), self.width, image.height) + ALIGN_LEFT
+
+    def _columns(self, left, right):
+        """One line with left and right text at the edges (Big5 width)"""
+        left, right = encode(left), encode(right)
+        return left + b' ' * max(1, self.columns - len(left) - len(right)) + right + b'\n'
+
+    def render(self, receipt):
+        """
+        ESC/POS byte stream of a receipt, ending with a paper cut
+
+        Args:
+            receipt: Receipt or ArchivedReceipt
+
+        Returns:
+            bytes
+        """
+        rule = b'-' * self.columns + b'\n'
+        created_at = receipt.created_at.strftime('%Y/%m/%d %H:%M:%S') if receipt.created_at else ''
+        out = [INIT, CHINESE_ON, self.header(receipt.site_id or DEFAULT_SITE_ID), b'\n',
+               encode(created_at + '\n'),
+               encode(f'\u6536\u64da\u7de8\u865f\uff1a{receipt.receipt_no}\n'),
+               rule,
+               self._columns('\u6536\u8cbb\u9805\u76ee', '\u91d1\u984d'),
+               self._columns(receipt.item_name, f'{receipt.amount:,.0f}')]
+        if receipt.remark:
+            out.append(encode(f'\u5099\u8a3b\uff1a{receipt.remark}\n'))
+        out += [rule,
+                BOLD_ON, SIZE_DOUBLE, encode(f'\u5408\u8a08\uff1a{receipt.amount:,.0f} \u5143\n'),
+                SIZE_NORMAL, BOLD_OFF,
+                encode(f'\u65b0\u53f0\u5e63\uff1a{receipt.amount_chinese}\n'),
+                encode(f'\u7d93\u8fa6\u54e1\uff1a{receipt.operator_name}\n\n'),
+                ALIGN_CENTER]
+        if self.code == 'qr':
+            out.append(qr_code(receipt.receipt_no))
+        elif self.code == 'barcode':
+            out.append(barcode(receipt.receipt_no, self.width))
+        out += [b'\n', encode(FOOTER + '\n'), ALIGN_LEFT, FEED_AND_CUT]
+        return b''.join(out)
+
+    def print_receipt(self, receipt, url=None):
+        """
+        Print a receipt on its site's printer (or url)
+
+        Raises:
+            ValueError: The site has no printer
+            OSError: The printer could not be reached
+        """
+        url = url or Site.printer_of(receipt.site_id or DEFAULT_SITE_ID,
+                                     current_app.config.get('PRINTER_URL'))
+        if not url:
+            raise ValueError('\u6b64\u5834\u9928\u672a\u8a2d\u5b9a\u71b1\u611f\u5370\u8868\u6a5f')
+        send(self.render(receipt), url, current_app.config.get('PRINTER_TIMEOUT', 5.0))
@@ -0,0 +1,145 @@
+"""
+Export Service - Build monthly Excel and PDF report files
+"""
+from io import BytesIO
+from app.services.report_service import ReportService
+
+
+# Report progress to the caller every this many rows
+PROGRESS_EVERY = 500
+
+EXCEL_HEADERS = ['\u6536\u64da\u7de8\u865f', '\u65e5\u671f\u6642\u9593', '\u6536\u8cbb\u9805\u76ee',
+                 '\u91d1\u984d', '\u5099\u8a3b', '\u72c0\u614b', '\u7d93\u8fa6\u54e1',
+                 '\u9a57\u8b49\u72c0\u614b']
+EXCEL_WIDTHS = [22, 21, 30, 12, 30, 14, 12, 10]
+
+
+def _monthly_rows(year, month, operator_id):
+    """
+    Receipts and totals for a month
+
+    Totals come from the cached monthly summary (shared with the report
+    pages); receipts are streamed from the database.
+    """
+    report = ReportService.get_cached_monthly_summary(year, month, operator_id)
+    return ReportService.iter_monthly_receipts(year, month, operator_id), report['summary']
+
+
+def _track_progress(rows, total, progress):
+    """Yield rows and call progress(percent) periodically"""
+    for index, row in enumerate(rows, start=1):
+        yield row
+        if progress and total and index % PROGRESS_EVERY == 0:
+            progress(min(99, index * 100 // total))
+
+
+class ExportService:
+    """Service for building downloadable report files"""
+
+    @staticmethod
+    def monthly_excel(year, month, operator_id=None, progress=None):
+        """
+        Build the monthly receipt Excel file
+
+        Args:
+            year: Year
+            month: Month (1-12)
+            operator_id: Filter by operator (optional)
+            progress: Optional callback receiving percent complete
+
+        Returns:
+            (filename, mimetype, BytesIO) tuple
+        """
+        from openpyxl import Workbook
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.styles import Font, Alignment
+        from openpyxl.utils import get_column_letter
+
+        receipts, totals = _monthly_rows(year, month, operator_id)
+
+        # Write-only workbook: rows are flushed as they arrive from the cursor
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet(title=f'{year}{month:02d}\u6708\u5831\u8868')
+
+        # Column widths must be set before the first row in write-only mode
+        for index, width in enumerate(EXCEL_WIDTHS, start=1):
+            ws.column_dimensions[get_column_letter(index)].width = width
+
+        # Header
+        header_cells = []
+        for title in EXCEL_HEADERS:
+            cell = WriteOnlyCell(ws, value=title)
+            cell.font = Font(bold=True)
+            cell.alignment = Alignment(horizontal='center')
+            header_cells.append(cell)
+        ws.append(header_cells)
+
+        # Data rows, streamed with a server-side cursor
+        for r in _track_progress(receipts, totals['total_count'], progress):
+            ws.append([
+                r.receipt_no,
+                r.created_at.strftime('%Y/%m/%d %H:%M:%S') if r.created_at else '',
+                r.item_name,
+                float(r.amount),
+                r.remark or '',
+                r.status_display,
+                r.operator_name,
+                '\u5df2\u9a57\u8b49' if r.is_verified else '\u672a\u9a57\u8b49'
+            ])
+
+        # Summary
+        ws.append([])
+        ws.append(['\u5408\u8a08', '', '', float(totals['net_total'])])
+
+        buffer = BytesIO()
+        wb.save(buffer)
+        buffer.seek(0)
+
+        filename = f'swim_report_{year}{month:02d}.xlsx'
+        mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        return filename, mimetype, buffer
+
+    @staticmethod
+    def monthly_pdf(year, month, operator_id=None, progress=None):
+        """
+        Build the monthly receipt list as a PDF report
+
+        Args:
+            year: Year
+            month: Month (1-12)
+            operator_id: Filter by operator (optional)
+            progress: Optional callback receiving percent complete
+
+        Returns:
+            (filename, mimetype, BytesIO) tuple
+        """
+        from app.services.pdf_service import ReceiptPDFService
+
+        receipts, totals = _monthly_rows(year, month, operator_id)
+
+        columns = ['\u6536\u64da\u7de8\u865f', '\u65e5\u671f\u6642\u9593', '\u6536\u8cbb\u9805\u76ee',
+                   '\u91d1\u984d', '\u72c0\u614b', '\u7d93\u8fa6\u54e1']
+        data = []
+        for r in _track_progress(receipts, totals['total_count'], progress):
+            data.append([
+                r.receipt_no,
+                r.created_at.strftime('%Y/%m/%d %H:%M') if r.created_at else '',
+                r.item_name,
+                f'{r.amount:,.0f}',
+                r.status_display,
+                r.operator_name
+            ])
+
+        summary = {
+            '\u6b63\u5e38\u7b46\u6578': totals['active_count'],
+            '\u4f5c\u5ee2\u7b46\u6578': totals['voided_count'],
+            '\u5408\u8a08': f"{totals['net_total']:,.0f} \u5143",
+            '\u65b0\u53f0\u5e63': totals['net_total_chinese']
+        }
+
+        buffer = ReceiptPDFService().generate_report(
+            f'{year}\u5e74{month}\u6708 \u6536\u8cbb\u5831\u8868', data, columns, summary
+        )
+
+        filename = f'swim_report_{year}{month:02d}.pdf'
+        return filename, 'application/pdf', buffer
@@ -0,0 +1,123 @@
+"""
+Identity Cache - Logged-in user identities without a query per request
+
+Flask-Login calls the user loader on every authenticated request. The
+loader returns an immutable UserIdentity (id, username, full_name, role,
+site_id, is_active) from a per-worker cache instead of loading the User row;
+permission checks work on the snapshot (RolePermissions).
+
+Entries expire after IDENTITY_CACHE_TTL seconds. Changing a user calls
+invalidate(), which also touches a stamp file, so every worker on the
+host drops its cache on its next request (other hosts within the TTL).
+"""
+import os
+import threading
+import time
+from flask import current_app
+from app import db
+from app.database import shared_state_path
+from app.models import User
+from app.models.user import RolePermissions
+
+
+class UserIdentity(RolePermissions):
+    """Immutable snapshot of the user fields needed to handle a request"""
+
+    __slots__ = ('id', 'username', 'full_name', 'role', 'site_id', 'is_active')
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, id, username, full_name, role, site_id, is_active):
+        values = (id, username, full_name, role, site_id, bool(is_active))
+        for name, value in zip(self.__slots__, values):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('UserIdentity is read-only; change the User row instead')
+
+    def get_id(self):
+        return str(self.id)
+
+    def __eq__(self, other):
+        return isinstance(other, UserIdentity) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __repr__(self):
+        return f'<UserIdentity {self.username}>'
+
+
+class IdentityCache:
+    """Per-worker TTL cache of UserIdentity, invalidated host-wide by a stamp file"""
+
+    def __init__(self, ttl=60, stamp_path=None):
+        self.ttl = ttl
+        self.stamp_path = stamp_path
+        self._entries = {}
+        self._stamp = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _read_stamp(self):
+        try:
+            return os.stat(self.stamp_path).st_mtime_ns
+        except (OSError, TypeError):
+            return None
+
+    def get(self, user_id):
+        """UserIdentity of a user, or None if it does not exist"""
+        now = time.monotonic()
+        stamp = self._read_stamp()
+        with self._lock:
+            if stamp != self._stamp:
+                # Some worker changed a user: start over
+                self._entries.clear()
+                self._stamp = stamp
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        # The request's site is derived from this identity: load it unscoped
+        row = db.session.query(
+            User.id, User.username, User.full_name, User.role, User.site_id, User.is_active
+        ).filter(User.id == user_id).execution_options(all_sites=True).first()
+        if row is None:
+            return None
+        identity = UserIdentity(*row)
+        with self._lock:
+            self._entries[user_id] = (now + self.ttl, identity)
+        return identity
+
+    def invalidate(self, user_id=None):
+        """
+        Forget one user (or all) here and in the other workers of the host
+
+        Call after the change is committed.
+        """
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+        if self.stamp_path:
+            with open(self.stamp_path, 'a'):
+                pass
+            os.utime(self.stamp_path)
+
+
+def init_identity_cache(app):
+    """Create the per-worker identity cache for an application"""
+    app.extensions['identity_cache'] = IdentityCache(
+        ttl=app.config.get('IDENTITY_CACHE_TTL', 60),
+        stamp_path=shared_state_path(app, 'identity') + '.stamp'
+    )
+
+
+def get_identity_cache():
+    """Get the identity cache of the current application"""
+    return current_app.extensions['identity_cache']
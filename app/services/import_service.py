@@ -0,0 +1,422 @@
+"""
+Import Service - Bulk load of historical receipts from CSV/XLSX files
+
+Rows are streamed from the file and loaded in chunks, one transaction per
+chunk: COPY on PostgreSQL, one executemany INSERT on SQLite. Original
+receipt numbers and timestamps are kept. Each chunk also writes the
+`created` change feed events (detail 'import'), bumps the report
+versions of its months and adds its active receipts to the sales cube.
+
+Input columns (header row, any order):
+    receipt_no, created_at, item_code, amount, operator (username)
+    optional: remark, status (active/voided), verified (1/0), void_reason
+
+Each receipt belongs to the site of its operator, and item_code is looked
+up in that site's catalog.
+
+Invalid rows are written to a rejects CSV with the line number and the
+reason; receipt numbers already in the database (hot or archive) are
+counted as duplicates and skipped, so a run can simply be repeated. A
+checkpoint file records the rows done after every chunk, and a rerun
+continues from there.
+"""
+import csv
+import io
+import json
+import os
+import re
+import time
+from datetime import datetime
+from sqlalchemy import insert, literal, select, update
+from app import db
+from app.models import (ArchivedReceipt, FeeItem, Receipt, ReceiptEvent, ReceiptSequence,
+                        ReportVersion, SalesCube, User)
+from app.models.receipt_event import lock_event_order
+from app.services.number_chinese import amount_to_chinese
+from app.services.settlement_service import parse_amount
+from app.timezone import now_tw
+
+REQUIRED_COLUMNS = ('receipt_no', 'created_at', 'item_code', 'amount', 'operator')
+OPTIONAL_COLUMNS = ('remark', 'status', 'verified', 'void_reason')
+
+# Receipt columns written by the import, in COPY order
+LOAD_COLUMNS = (
+    'receipt_no', 'item_id', 'item_name', 'amount', 'amount_chinese', 'remark',
+    'operator_id', 'operator_name', 'created_at', 'status', 'is_verified',
+    'verified_at', 'void_reason', 'voided_at', 'site_id',
+)
+
+RECEIPT_NO_PATTERN = re.compile(r'^([A-Z]+)-(\d{8})-(\d+)$')
+TRUE_VALUES = {'1', 'y', 'yes', 'true', 't', '是', 'v'}
+
+
+def _text(value):
+    """Cell value as stripped text ('' for empty cells)"""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)  # XLSX stores numeric codes as floats
+    return str(value).strip()
+
+
+def parse_timestamp(value):
+    """
+    Parse an original receipt time (datetime cell, or YYYY-MM-DD / YYYY/MM/DD
+    with optional HH:MM[:SS])
+
+    Raises:
+        ValueError: unrecognized format
+    """
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    text = _text(value).replace('/', '-')
+    if not text:
+        raise ValueError('created_at is empty')
+    try:
+        return datetime.fromisoformat(text).replace(tzinfo=None)
+    except ValueError:
+        raise ValueError(f'Invalid created_at: {value}')
+
+
+def iter_rows(path, skip=0):
+    """
+    Stream data rows of a CSV or XLSX file
+
+    Args:
+        path: .csv (UTF-8, BOM allowed) or .xlsx file
+        skip: Non-blank data rows to pass over without parsing them (resume;
+              ImportStats.rows counts the same rows)
+
+    Yields:
+        (line number, dict column -> raw value)
+    """
+    if path.lower().endswith('.xlsx'):
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            raise RuntimeError('openpyxl is required to import .xlsx files')
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = [_text(name).lower() for name in next(rows, ())]
+            for line, row in enumerate(rows, start=2):
+                if any(cell is not None for cell in row):
+                    if skip:
+                        skip -= 1
+                        continue
+                    yield line, dict(zip(header, row))
+        finally:
+            workbook.close()
+        return
+
+    with open(path, newline='', encoding='utf-8-sig') as source:
+        reader = csv.reader(source)
+        header = [name.strip().lower() for name in next(reader, [])]
+        for line, row in enumerate(reader, start=2):
+            if any(row):
+                if skip:
+                    skip -= 1
+                    continue
+                yield line, dict(zip(header, row))
+
+
+class ImportStats:
+    """Counters of an import run"""
+
+    def __init__(self, rows=0, imported=0, duplicates=0, rejected=0):
+        self.rows = rows
+        self.imported = imported
+        self.duplicates = duplicates
+        self.rejected = rejected
+        self.started = time.perf_counter()
+        self.resumed_rows = rows
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rows_per_second(self):
+        done = self.rows - self.resumed_rows
+        return done / self.elapsed if self.elapsed else 0.0
+
+    def to_dict(self):
+        return {'rows': self.rows, 'imported': self.imported,
+                'duplicates': self.duplicates, 'rejected': self.rejected}
+
+
+class ReceiptImporter:
+    """Loads one file of historical receipts"""
+
+    def __init__(self, path, chunk_size=5000, verified=True, checkpoint_path=None,
+                 rejects_path=None):
+        """
+        Args:
+            path: CSV/XLSX file
+            chunk_size: Rows per transaction
+            verified: Default verification flag of imported receipts
+                      (historical receipts are normally settled already)
+            checkpoint_path: Progress file (default: <path>.checkpoint.json)
+            rejects_path: Invalid rows (default: <path>.rejects.csv)
+        """
+        self.path = path
+        self.chunk_size = chunk_size
+        self.verified = verified
+        self.checkpoint_path = checkpoint_path or path + '.checkpoint.json'
+        self.rejects_path = rejects_path or path + '.rejects.csv'
+        self._chinese = {}
+
+        # Catalogs are small: one query each, then lookups in memory
+        self.items = {(item.site_id, item.item_code): (item.id, item.item_name) for item in
+                      db.session.execute(select(FeeItem.site_id, FeeItem.item_code,
+                                                FeeItem.id, FeeItem.item_name))}
+        self.users = {user.username: (user.id, user.full_name, user.site_id) for user in
+                      db.session.execute(select(User.username, User.id, User.full_name,
+                                                User.site_id))}
+
+    # -- checkpoint ---------------------------------------------------
+
+    def _source_signature(self):
+        stat = os.stat(self.path)
+        return {'source': os.path.abspath(self.path), 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+    def load_checkpoint(self):
+        """Stats of a previous interrupted run of the same file, or None"""
+        try:
+            with open(self.checkpoint_path, encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return None
+        signature = self._source_signature()
+        if any(saved.get(key) != value for key, value in signature.items()):
+            return None  # The file changed: start over (duplicates are skipped anyway)
+        return ImportStats(**saved['stats'])
+
+    def _save_checkpoint(self, stats):
+        data = dict(self._source_signature(), stats=stats.to_dict())
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    # -- parsing ------------------------------------------------------
+
+    def parse_row(self, raw):
+        """
+        Validate one input row
+
+        Returns:
+            dict of receipt column values (LOAD_COLUMNS)
+
+        Raises:
+            ValueError: reason the row is rejected
+        """
+        missing = [name for name in REQUIRED_COLUMNS if not _text(raw.get(name))]
+        if missing:
+            raise ValueError(f'Missing {", ".join(missing)}')
+
+        receipt_no = _text(raw['receipt_no'])
+        if len(receipt_no) > 30:
+            raise ValueError(f'receipt_no too long: {receipt_no}')
+
+        operator = self.users.get(_text(raw['operator']))
+        if operator is None:
+            raise ValueError(f'Unknown operator: {_text(raw["operator"])}')
+        item = self.items.get((operator[2], _text(raw['item_code'])))
+        if item is None:
+            raise ValueError(f'Unknown item_code: {_text(raw["item_code"])}')
+
+        try:
+            amount = parse_amount(_text(raw['amount']))
+        except ValueError:  # Malformed, or too large for Numeric(10, 2)
+            raise ValueError(f'Invalid amount: {_text(raw["amount"])}')
+        if not amount or amount <= 0:
+            raise ValueError(f'Amount must be positive: {_text(raw["amount"])}')
+
+        created_at = parse_timestamp(raw['created_at'])
+
+        status = _text(raw.get('status')).lower() or Receipt.STATUS_ACTIVE
+        if status not in (Receipt.STATUS_ACTIVE, Receipt.STATUS_VOIDED):
+            raise ValueError(f'Invalid status: {status}')
+        verified_text = _text(raw.get('verified')).lower()
+        verified = verified_text in TRUE_VALUES if verified_text else self.verified
+        verified = verified and status == Receipt.STATUS_ACTIVE
+        voided = status == Receipt.STATUS_VOIDED
+
+        if amount not in self._chinese:
+            self._chinese[amount] = amount_to_chinese(amount)
+
+        return {
+            'receipt_no': receipt_no,
+            'item_id': item[0],
+            'item_name': item[1],
+            'amount': amount,
+            'amount_chinese': self._chinese[amount],
+            'remark': _text(raw.get('remark'))[:200] or None,
+            'operator_id': operator[0],
+            'operator_name': operator[1],
+            'created_at': created_at,
+            'status': status,
+            'is_verified': verified,
+            'verified_at': created_at if verified else None,
+            'void_reason': (_text(raw.get('void_reason'))[:200] or None) if voided else None,
+            'voided_at': created_at if voided else None,
+            'site_id': operator[2],
+        }
+
+    # -- loading ------------------------------------------------------
+
+    def _existing_numbers(self, numbers):
+        existing = set(db.session.scalars(
+            select(Receipt.receipt_no).where(Receipt.receipt_no.in_(numbers))))
+        existing.update(db.session.scalars(
+            select(ArchivedReceipt.receipt_no).where(ArchivedReceipt.receipt_no.in_(numbers))))
+        return existing
+
+    def _copy(self, rows):
+        """PostgreSQL: stream the chunk with COPY in the session's transaction"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([
+                ('t' if row[name] else 'f') if isinstance(row[name], bool)
+                else row[name].isoformat() if isinstance(row[name], datetime)
+                else row[name]
+                for name in LOAD_COLUMNS
+            ])
+        buffer.seek(0)
+        cursor = db.session.connection().connection.cursor()
+        try:
+            cursor.copy_expert(
+                f'COPY {Receipt.__tablename__} ({", ".join(LOAD_COLUMNS)}) FROM STDIN WITH (FORMAT csv)',
+                buffer
+            )
+        finally:
+            cursor.close()
+
+    def _record_events(self, rows):
+        """INSERT ... SELECT the created events of the chunk's new receipts"""
+        # Same ordering guarantee as ReceiptEvent.record, for every site of the chunk
+        lock_event_order(db.session, [row['site_id'] for row in rows])
+        numbers = [row['receipt_no'] for row in rows]
+        receipts = Receipt.__table__
+        source = select(
+            literal(ReceiptEvent.TYPE_CREATED), receipts.c.id, receipts.c.receipt_no,
+            receipts.c.status, receipts.c.item_id, receipts.c.item_name, receipts.c.amount,
+            receipts.c.created_at, receipts.c.operator_id, literal('import'),
+            literal(now_tw(), type_=db.DateTime), receipts.c.site_id
+        ).where(receipts.c.receipt_no.in_(numbers)).order_by(receipts.c.created_at, receipts.c.id)
+        db.session.execute(insert(ReceiptEvent.__table__).from_select(
+            ['event_type', 'receipt_id', 'receipt_no', 'status', 'item_id', 'item_name',
+             'amount', 'receipt_created_at', 'actor_id', 'detail', 'created_at', 'site_id'],
+            source
+        ))
+
+    def _advance_sequences(self, rows):
+        """Keep the number allocator past imported numbers of its own format"""
+        highest = {}
+        for row in rows:
+            match = RECEIPT_NO_PATTERN.match(row['receipt_no'])
+            if match:
+                key = (match.group(1), match.group(2))
+                highest[key] = max(highest.get(key, 0), int(match.group(3)))
+        for (prefix, day), seq in highest.items():
+            db.session.execute(update(ReceiptSequence).where(
+                ReceiptSequence.prefix == prefix, ReceiptSequence.day == day,
+                ReceiptSequence.next_seq <= seq
+            ).values(next_seq=seq + 1))
+
+    def _count_sales(self, rows):
+        """Add the chunk's active receipts to the sales cube"""
+        cells = {}
+        for row in rows:
+            if row['status'] != Receipt.STATUS_ACTIVE:
+                continue
+            created = row['created_at']
+            key = (row['site_id'], created.strftime('%Y-%m'), created.weekday(), created.hour,
+                   row['item_id'])
+            count, amount = cells.get(key, (0, 0))
+            cells[key] = (count + 1, amount + row['amount'])
+        SalesCube.add_many(cells)
+
+    def load_chunk(self, rows):
+        """
+        Insert one chunk of parsed rows in a single transaction
+
+        Returns:
+            (imported, duplicates) counts
+        """
+        unique = {}
+        for row in rows:
+            unique.setdefault(row['receipt_no'], row)
+        existing = self._existing_numbers(list(unique))
+        new_rows = [row for number, row in unique.items() if number not in existing]
+        duplicates = len(rows) - len(new_rows)
+        if not new_rows:
+            db.session.rollback()
+            return 0, duplicates
+
+        dialect = db.session.get_bind().dialect.name
+        if dialect == 'postgresql':
+            self._copy(new_rows)
+        else:
+            db.session.execute(insert(Receipt.__table__), new_rows)  # executemany
+
+        self._record_events(new_rows)
+        for site_id, period in sorted({(row['site_id'], ReportVersion.period_of(row['created_at']))
+                                       for row in new_rows}):
+            ReportVersion.bump(period, site_id)
+        self._count_sales(new_rows)
+        self._advance_sequences(new_rows)
+        db.session.commit()
+        return len(new_rows), duplicates
+
+    def run(self, progress=None):
+        """
+        Import the file, resuming from the checkpoint if there is one
+
+        Args:
+            progress: Optional callable(stats) called after every chunk
+
+        Returns:
+            ImportStats
+        """
+        stats = self.load_checkpoint() or ImportStats()
+        resume = stats.rows > 0
+
+        with open(self.rejects_path, 'a' if resume else 'w', newline='', encoding='utf-8-sig') as f:
+            rejects = csv.writer(f)
+            if not resume:
+                rejects.writerow(['line', 'error', *REQUIRED_COLUMNS, *OPTIONAL_COLUMNS])
+
+            chunk = []
+            read = 0
+            for line, raw in iter_rows(self.path, skip=stats.rows):
+                read += 1
+                try:
+                    chunk.append(self.parse_row(raw))
+                except ValueError as e:
+                    stats.rejected += 1
+                    rejects.writerow([line, str(e), *(_text(raw.get(name))
+                                                      for name in REQUIRED_COLUMNS + OPTIONAL_COLUMNS)])
+                if read == self.chunk_size:
+                    self._finish_chunk(chunk, read, stats, f, progress)
+                    chunk, read = [], 0
+            if read:
+                self._finish_chunk(chunk, read, stats, f, progress)
+
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+        return stats
+
+    def _finish_chunk(self, chunk, read, stats, rejects_file, progress):
+        if chunk:
+            imported, duplicates = self.load_chunk(chunk)
+            stats.imported += imported
+            stats.duplicates += duplicates
+        stats.rows += read
+        # Rejects first: a checkpoint never points past unwritten rejects
+        rejects_file.flush()
+        self._save_checkpoint(stats)
+        if progress:
+            progress(stats)
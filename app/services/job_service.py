@@ -0,0 +1,286 @@
+"""
+Job Service - Database-backed background job queue
+
+Requests enqueue a Job row and return immediately; a job worker
+(`flask --app run:app jobs-worker`) claims pending jobs, runs the handler
+and stores the artifact in the job row, where any web process can serve
+it. Workers run in their own process (or container) so long exports
+never occupy a gunicorn worker.
+
+A running job sends a heartbeat every JOB_HEARTBEAT_INTERVAL; a job whose
+heartbeat stopped for JOB_TIMEOUT lost its worker and is claimed again, up
+to JOB_MAX_ATTEMPTS times. Each claim is numbered (attempts), and a worker
+only writes the job while it still holds the latest claim.
+"""
+import json
+import threading
+import time
+from datetime import timedelta
+from flask import current_app
+from sqlalchemy import func
+from app import db
+from app.models import Job
+from app.replica import read_replica
+from app.sites import current_site_id, site_scope
+from app.timezone import now_tw
+
+
+def _export_excel(params, progress):
+    from app.services.export_service import ExportService
+    return ExportService.monthly_excel(params['year'], params['month'],
+                                       params.get('operator_id'), progress)
+
+
+def _report_pdf(params, progress):
+    from app.services.export_service import ExportService
+    return ExportService.monthly_pdf(params['year'], params['month'],
+                                     params.get('operator_id'), progress)
+
+
+# Job type -> handler(params, progress) returning (filename, mimetype, BytesIO)
+JOB_HANDLERS = {
+    Job.TYPE_EXPORT_EXCEL: _export_excel,
+    Job.TYPE_REPORT_PDF: _report_pdf,
+}
+
+
+class JobService:
+    """Service class for background jobs"""
+
+    @staticmethod
+    def enqueue(job_type, params, user=None):
+        """
+        Queue a background job
+
+        Args:
+            job_type: One of JOB_HANDLERS
+            params: JSON-serializable handler arguments (the current site
+                    is added as site_id; the job runs for that site)
+            user: User requesting the job (optional)
+
+        Returns:
+            Job object
+        """
+        if job_type not in JOB_HANDLERS:
+            raise ValueError(f'Unknown job type: {job_type}')
+
+        site_id = current_site_id()
+        if site_id is not None:
+            params = dict(params, site_id=site_id)
+
+        job = Job(
+            job_type=job_type,
+            params=json.dumps(params),
+            status=Job.STATUS_PENDING,
+            created_by=user.id if user else None
+        )
+        db.session.add(job)
+        db.session.commit()
+        return job
+
+    @staticmethod
+    def get_job(job_id):
+        """Get job by ID"""
+        return Job.query.get(job_id)
+
+    @staticmethod
+    def claim_next():
+        """
+        Atomically claim the oldest pending job
+
+        Returns:
+            Job object now marked running, or None if the queue is empty
+        """
+        candidates = db.session.query(Job.id).filter_by(
+            status=Job.STATUS_PENDING
+        ).order_by(Job.id).limit(5).all()
+
+        for (job_id,) in candidates:
+            # Conditional update: only one worker can move a job out of pending
+            now = now_tw()
+            claimed = Job.query.filter_by(
+                id=job_id, status=Job.STATUS_PENDING
+            ).update({
+                'status': Job.STATUS_RUNNING,
+                'started_at': now,
+                'heartbeat_at': now,
+                'attempts': Job.attempts + 1,
+                'progress': 0
+            }, synchronize_session=False)
+            db.session.commit()
+            if claimed:
+                return Job.query.get(job_id)
+
+        return None
+
+    @staticmethod
+    def heartbeat(job_id, attempt, **values):
+        """
+        Show that the worker running a job is alive (and record values)
+
+        Args:
+            job_id: Job ID
+            attempt: Claim held by the worker (Job.attempts when claimed)
+            values: Other columns to update, e.g. progress
+
+        Returns:
+            False if the job was claimed again since (the caller should stop)
+        """
+        # Separate connection: the session is still streaming the handler's cursor
+        with db.engine.begin() as conn:
+            return bool(conn.execute(
+                db.update(Job).where(
+                    Job.id == job_id, Job.status == Job.STATUS_RUNNING, Job.attempts == attempt
+                ).values(heartbeat_at=now_tw(), **values)
+            ).rowcount)
+
+    @staticmethod
+    def set_progress(job_id, attempt, percent):
+        """Record progress of a running job (also a heartbeat)"""
+        return JobService.heartbeat(job_id, attempt, progress=percent)
+
+    @staticmethod
+    def _finish(job_id, attempt, **values):
+        """Store the outcome of a run unless the job was claimed again since"""
+        finished = Job.query.filter_by(
+            id=job_id, status=Job.STATUS_RUNNING, attempts=attempt
+        ).update(dict(values, finished_at=now_tw()), synchronize_session=False)
+        db.session.commit()
+        return finished
+
+    @staticmethod
+    def run_job(job):
+        """
+        Run a claimed job and store its result
+
+        Args:
+            job: Job in running state
+        """
+        handler = JOB_HANDLERS[job.job_type]
+        job_id, attempt = job.id, job.attempts
+        params = job.get_params()
+
+        # Heartbeats between progress reports (e.g. while a query runs)
+        app = current_app._get_current_object()
+        stop = threading.Event()
+
+        def beat():
+            interval = app.config.get('JOB_HEARTBEAT_INTERVAL', 30)
+            while not stop.wait(interval):
+                with app.app_context():
+                    if not JobService.heartbeat(job_id, attempt):
+                        return
+
+        beater = threading.Thread(target=beat, name=f'job-{job_id}-heartbeat', daemon=True)
+        beater.start()
+        try:
+            # Exports only read receipts: let the replica serve them
+            with read_replica(), site_scope(params.get('site_id')):
+                filename, mimetype, buffer = handler(
+                    params, lambda percent: JobService.set_progress(job_id, attempt, percent)
+                )
+
+            JobService._finish(job_id, attempt, status=Job.STATUS_DONE, progress=100,
+                               result_data=buffer.getvalue(), result_filename=filename,
+                               result_mimetype=mimetype)
+        except Exception as e:
+            db.session.rollback()
+            JobService._finish(job_id, attempt, status=Job.STATUS_FAILED, error=str(e)[:500])
+        finally:
+            stop.set()
+
+        return Job.query.get(job_id)
+
+    @staticmethod
+    def requeue_stale(timeout, max_attempts):
+        """
+        Put back jobs whose worker stopped sending heartbeats
+
+        Jobs that already used max_attempts claims (e.g. one that crashes
+        every worker running it) are marked failed instead.
+
+        Args:
+            timeout: Seconds without a heartbeat after which a running job
+                     is considered abandoned
+            max_attempts: Claims allowed per job
+
+        Returns:
+            Number of requeued jobs
+        """
+        now = now_tw()
+        stale = (Job.status == Job.STATUS_RUNNING,
+                 func.coalesce(Job.heartbeat_at, Job.started_at) < now - timedelta(seconds=timeout))
+        Job.query.filter(*stale, Job.attempts >= max_attempts).update({
+            'status': Job.STATUS_FAILED,
+            'error': f'\u80cc\u666f\u5de5\u4f5c\u7a0b\u5e8f\u4e2d\u65b7 {max_attempts} '
+                     '\u6b21\uff0c\u5df2\u505c\u6b62\u91cd\u8a66',
+            'finished_at': now,
+        }, synchronize_session=False)
+        count = Job.query.filter(*stale, Job.attempts < max_attempts).update(
+            {'status': Job.STATUS_PENDING}, synchronize_session=False
+        )
+        db.session.commit()
+        return count
+
+    @staticmethod
+    def purge_expired(max_age):
+        """
+        Delete finished jobs (and their results) older than max_age seconds
+
+        Returns:
+            Number of deleted jobs
+        """
+        cutoff = now_tw() - timedelta(seconds=max_age)
+        count = Job.query.filter(
+            Job.status.in_([Job.STATUS_DONE, Job.STATUS_FAILED]),
+            Job.finished_at < cutoff
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        return count
+
+
+def run_worker(app, stop_event=None, poll_interval=None):
+    """
+    Job worker loop: claim and run jobs until stop_event is set
+
+    Args:
+        app: Flask application
+        stop_event: threading.Event to stop the loop (optional)
+        poll_interval: Seconds to sleep when the queue is empty
+    """
+    if stop_event is None:
+        stop_event = threading.Event()
+    if poll_interval is None:
+        poll_interval = app.config.get('JOB_POLL_INTERVAL', 1.0)
+    housekeeping_every = 60
+    last_housekeeping = None
+
+    while not stop_event.is_set():
+        with app.app_context():
+            now = time.monotonic()
+            if last_housekeeping is None or now - last_housekeeping > housekeeping_every:
+                JobService.requeue_stale(app.config['JOB_TIMEOUT'], app.config['JOB_MAX_ATTEMPTS'])
+                JobService.purge_expired(app.config['JOB_RESULT_TTL'])
+                last_housekeeping = now
+
+            job = JobService.claim_next()
+            if job is not None:
+                JobService.run_job(job)
+                continue
+
+        stop_event.wait(poll_interval)
+
+
+def start_worker_threads(app, count):
+    """
+    Start job worker threads in the current process
+
+    Returns:
+        threading.Event that stops the threads when set
+    """
+    stop_event = threading.Event()
+    for index in range(count):
+        thread = threading.Thread(target=run_worker, args=(app, stop_event),
+                                  name=f'job-worker-{index}', daemon=True)
+        thread.start()
+    return stop_event
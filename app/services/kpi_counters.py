@@ -0,0 +1,371 @@
+"""
+KPI Counters - Dashboard figures kept in memory shared by the workers
+
+A small memory-mapped file (KPI_COUNTERS_PATH) holds:
+    - today's active receipt count and total per operator
+    - the number of pending void requests
+    - the unverified amount of the current month
+
+ReceiptService applies a delta after each commit, so reading the figures
+costs no query. The file is re-seeded from the database when it is read
+and is new, of another day or older than KPI_RESEED_INTERVAL seconds,
+which also corrects drift from writes that bypass ReceiptService (counter
+sync). A seed remembers the last ReceiptEvent id it counted; deltas of
+events up to that id are skipped, and deltas arriving while the file is
+not seeded for today are left to the next seed. Seeds are computed
+without holding the lock, so receipt writes never wait for the queries.
+Workers on one host share the file; an exclusive flock serializes
+updates (a thread lock only where fcntl is unavailable).
+Each site has its own file (KpiCounterSet): the default site uses
+KPI_COUNTERS_PATH, other sites the same path with a .site<id> suffix.
+"""
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+from flask import current_app
+from app.database import shared_state_path
+from app.sites import DEFAULT_SITE_ID, current_site_id, site_scope
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process development server
+    fcntl = None
+
+MAGIC = b'KPI1'
+MAX_OPERATORS = 64
+
+# magic, day (YYYYMMDD), month (YYYYMM), seeded_at, event watermark, seq,
+# pending voids, unverified cents, slots used
+HEADER = struct.Struct('<4sIIdqqqqI')
+# operator_id, count, total cents
+SLOT = struct.Struct('<qqq')
+FILE_SIZE = HEADER.size + SLOT.size * MAX_OPERATORS
+
+
+def _cents(amount):
+    return int((Decimal(str(amount)) * 100).to_integral_value())
+
+
+class KpiCounters:
+    """Dashboard counters of one site in a shared memory-mapped file"""
+
+    def __init__(self, path, reseed_interval=300, site_id=DEFAULT_SITE_ID):
+        self.path = path
+        self.reseed_interval = reseed_interval
+        self.site_id = site_id
+        self._thread_lock = threading.Lock()
+        self._pid = None
+        self._file = None
+        self._map = None
+        self._names = {}
+        self._names_at = 0.0
+
+    def _mapping(self):
+        """Open the file once per process (gunicorn forks after import)"""
+        if self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            if os.fstat(fd).st_size < FILE_SIZE:
+                os.ftruncate(fd, FILE_SIZE)
+            self._file = fd
+            self._map = mmap.mmap(fd, FILE_SIZE)
+            self._pid = os.getpid()
+        return self._map
+
+    @contextmanager
+    def _locked(self):
+        with self._thread_lock:
+            buffer = self._mapping()
+            if fcntl is not None:
+                fcntl.flock(self._file, fcntl.LOCK_EX)
+            try:
+                yield buffer
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._file, fcntl.LOCK_UN)
+
+    # -- state (de)serialization --------------------------------------
+
+    @staticmethod
+    def _read(buffer):
+        magic, day, month, seeded_at, watermark, seq, pending, unverified, used = \
+            HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            return None
+        operators = {}
+        for i in range(min(used, MAX_OPERATORS)):
+            operator_id, count, total = SLOT.unpack_from(buffer, HEADER.size + i * SLOT.size)
+            operators[operator_id] = [count, total]
+        return {'day': day, 'month': month, 'seeded_at': seeded_at, 'watermark': watermark,
+                'seq': seq, 'pending_voids': pending, 'unverified': unverified, 'operators': operators}
+
+    @staticmethod
+    def _write(buffer, state):
+        operators = list(state['operators'].items())[:MAX_OPERATORS]
+        for i, (operator_id, (count, total)) in enumerate(operators):
+            SLOT.pack_into(buffer, HEADER.size + i * SLOT.size, operator_id, count, total)
+        HEADER.pack_into(buffer, 0, MAGIC, state['day'], state['month'], state['seeded_at'],
+                         state['watermark'], state['seq'], state['pending_voids'],
+                         state['unverified'], len(operators))
+
+    @classmethod
+    def _touch(cls, buffer, state):
+        """
+        Note a change the file does not count yet (not seeded for today)
+
+        The next seed counts it, but a seed being computed right now might
+        not: bumping seq makes that seed retry.
+        """
+        state = state or {'day': 0, 'month': 0, 'seeded_at': 0.0, 'watermark': 0, 'seq': 0,
+                          'pending_voids': 0, 'unverified': 0, 'operators': {}}
+        state['seq'] += 1
+        cls._write(buffer, state)
+
+    @staticmethod
+    def _is_today(state, today):
+        return state is not None and state['day'] == int(today.strftime('%Y%m%d'))
+
+    def _needs_seed(self, state, today):
+        return (not self._is_today(state, today)
+                or time.time() - state['seeded_at'] > self.reseed_interval)
+
+    def _refresh(self, today, force=False, attempts=3):
+        """
+        Current state, re-seeded first if due (or force)
+
+        The seed queries run outside the lock; the seed is written only if
+        the file did not change meanwhile (same seq), since a delta applied
+        in between may belong to an event after the seed's watermark.
+        Otherwise the file is re-read and the seed retried; if deltas keep
+        arriving the current figures are kept until the next read (a
+        forced seed is then computed under the lock).
+        """
+        for _ in range(attempts):
+            with self._locked() as buffer:
+                state = self._read(buffer)
+            if not force and not self._needs_seed(state, today):
+                return state
+            seed = self._seed(today, state)
+            with self._locked() as buffer:
+                current = self._read(buffer)
+                if (current and current['seq']) == (state and state['seq']):
+                    self._write(buffer, seed)
+                    return seed
+            # A seed written by another worker meanwhile will do
+            force = force and (current or {}).get('seeded_at') == (state or {}).get('seeded_at')
+        if not force:
+            return current if self._is_today(current, today) else seed
+        with self._locked() as buffer:
+            seed = self._seed(today, self._read(buffer))
+            self._write(buffer, seed)
+        return seed
+
+    def _seed(self, today, previous, attempts=3):
+        """
+        Recompute every counter from the database
+
+        Every counted change commits a ReceiptEvent, so the figures are a
+        consistent snapshot when the last event id is the same before and
+        after the queries; otherwise retry (the last attempt is kept and
+        corrected by the next seed).
+        """
+        with site_scope(self.site_id):
+            return self._seed_site(today, previous, attempts)
+
+    def _seed_site(self, today, previous, attempts):
+        from app import db
+        from app.models import Receipt, ReceiptEvent, VoidRequest
+        from app.services.settlement_service import SettlementService
+        from app.timezone import day_range
+
+        day_start, day_end = day_range(today, today)
+        last_event = db.session.query(db.func.coalesce(db.func.max(ReceiptEvent.id), 0))
+        watermark = last_event.scalar()
+        for _ in range(attempts):
+            rows = db.session.query(
+                Receipt.operator_id, db.func.count(Receipt.id),
+                db.func.coalesce(db.func.sum(Receipt.amount), 0)
+            ).filter(
+                Receipt.created_at >= day_start,
+                Receipt.created_at < day_end,
+                Receipt.status == Receipt.STATUS_ACTIVE
+            ).group_by(Receipt.operator_id).all()
+            month_totals = SettlementService.period_totals(today.year, today.month)
+            pending_voids = VoidRequest.query.filter_by(status=VoidRequest.STATUS_PENDING).count()
+
+            latest = last_event.scalar()
+            if latest == watermark:
+                break
+            watermark = latest
+
+        return {
+            'day': int(today.strftime('%Y%m%d')),
+            'month': today.year * 100 + today.month,
+            'seeded_at': time.time(),
+            'watermark': watermark,
+            'seq': (previous['seq'] if previous else 0) + 1,
+            'pending_voids': pending_voids,
+            'unverified': sum(_cents(t['unverified_amount']) for t in month_totals.values()),
+            'operators': {operator_id: [count, _cents(total)] for operator_id, count, total in rows},
+        }
+
+    # -- public API ---------------------------------------------------
+
+    def snapshot(self):
+        """
+        Current figures (seeding first if needed)
+
+        Returns:
+            dict with day, seq (changes on every update), pending_voids,
+            unverified_amount and operators {operator_id: (count, total)}
+        """
+        from app.timezone import today_tw
+
+        today = today_tw()
+        state = self._refresh(today)
+
+        return {
+            'day': today,
+            'seq': state['seq'],
+            'pending_voids': state['pending_voids'],
+            'unverified_amount': Decimal(state['unverified']) / 100,
+            'operators': {operator_id: (count, Decimal(total) / 100)
+                          for operator_id, (count, total) in state['operators'].items()},
+        }
+
+    def reseed(self):
+        """Recompute the counters from the database now (deploy/startup)"""
+        from app.timezone import today_tw
+
+        self._refresh(today_tw(), force=True)
+
+    def operator_names(self, operator_ids):
+        """Display names of operators, cached per process for KPI_RESEED_INTERVAL"""
+        if time.time() - self._names_at > self.reseed_interval:
+            self._names, self._names_at = {}, time.time()
+        missing = [i for i in operator_ids if i not in self._names]
+        if missing:
+            from app.models import User
+            for user_id, full_name in User.query.with_entities(User.id, User.full_name) \
+                    .filter(User.id.in_(missing)):
+                self._names[user_id] = full_name
+            for user_id in missing:
+                self._names.setdefault(user_id, str(user_id))
+        return {i: self._names[i] for i in operator_ids}
+
+    def record(self, event_id, receipt, active_delta=0, pending_delta=0):
+        """
+        Apply a committed change of one receipt
+
+        Args:
+            event_id: ReceiptEvent id committed with the change
+            receipt: Receipt after the change
+            active_delta: +1 if it became active, -1 if it left active
+                          (today's takings and month's unverified amount)
+            pending_delta: Change of the pending void request count
+        """
+        from app.timezone import today_tw
+
+        today = today_tw()
+        with self._locked() as buffer:
+            state = self._read(buffer)
+            if not self._is_today(state, today):
+                self._touch(buffer, state)
+                return
+            if event_id <= state['watermark']:
+                return  # Already counted by the seed
+
+            created = receipt.created_at.date() if receipt.created_at else today
+            cents = _cents(receipt.amount)
+            if active_delta and created == today:
+                entry = state['operators'].setdefault(receipt.operator_id, [0, 0])
+                entry[0] += active_delta
+                entry[1] += active_delta * cents
+            if active_delta and not receipt.is_verified and \
+                    created.year * 100 + created.month == state['month']:
+                state['unverified'] += active_delta * cents
+            state['pending_voids'] += pending_delta
+            state['seq'] += 1
+            self._write(buffer, state)
+
+    def record_verified(self, event_id, receipt):
+        """Apply a committed verification (leaves the unverified amount)"""
+        from app.timezone import today_tw
+
+        today = today_tw()
+        with self._locked() as buffer:
+            state = self._read(buffer)
+            if not self._is_today(state, today):
+                self._touch(buffer, state)
+                return
+            if event_id <= state['watermark']:
+                return
+            created = receipt.created_at.date() if receipt.created_at else today
+            if created.year * 100 + created.month == state['month']:
+                state['unverified'] -= _cents(receipt.amount)
+            state['seq'] += 1
+            self._write(buffer, state)
+
+
+class KpiCounterSet:
+    """
+    KpiCounters of every site, opened on first use
+
+    record()/record_verified() go to the receipt's site, reseed() covers
+    all sites; get_kpi_counters() returns the current site's counters.
+    """
+
+    def __init__(self, path, reseed_interval=300):
+        self.path = path
+        self.reseed_interval = reseed_interval
+        self._sites = {}
+        self._lock = threading.Lock()
+
+    def for_site(self, site_id=None):
+        """Counters of a site (default: the current site)"""
+        site_id = site_id or current_site_id() or DEFAULT_SITE_ID
+        counters = self._sites.get(site_id)
+        if counters is None:
+            with self._lock:
+                counters = self._sites.get(site_id)
+                if counters is None:
+                    path = self.path if site_id == DEFAULT_SITE_ID else f'{self.path}.site{site_id}'
+                    counters = self._sites[site_id] = KpiCounters(
+                        path, self.reseed_interval, site_id
+                    )
+        return counters
+
+    def record(self, event_id, receipt, active_delta=0, pending_delta=0):
+        self.for_site(receipt.site_id).record(event_id, receipt, active_delta, pending_delta)
+
+    def record_verified(self, event_id, receipt):
+        self.for_site(receipt.site_id).record_verified(event_id, receipt)
+
+    def reseed(self):
+        """Recompute the counters of every active site now (deploy/startup)"""
+        from app import db
+        from app.models import Site
+
+        site_ids = db.session.query(Site.id).filter(Site.is_active.is_(True)).all()
+        for (site_id,) in site_ids:
+            self.for_site(site_id).reseed()
+
+
+def init_kpi_counters(app):
+    """Attach the shared KPI counters to an application"""
+    path = app.config.get('KPI_COUNTERS_PATH') or shared_state_path(app, 'kpi') + '.bin'
+    app.extensions['kpi_counters'] = KpiCounterSet(
+        path, reseed_interval=app.config.get('KPI_RESEED_INTERVAL', 300)
+    )
+
+
+def get_kpi_counters(site_id=None):
+    """Get the KPI counters of a site (default: current site; None if disabled)"""
+    counters = current_app.extensions.get('kpi_counters')
+    return counters.for_site(site_id) if counters is not None else None
@@ -8,42 +8,71 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
+from flask import current_app, has_app_context
 from io import BytesIO
 import os
+import threading
+
+
+# Chinese fonts tried in order; PDF_FONT_PATH, if set, is tried first
+FONT_PATHS = [
+    'C:/Windows/Fonts/msjh.ttc',      # Microsoft JhengHei
+    'C:/Windows/Fonts/mingliu.ttc',   # MingLiU
+    'C:/Windows/Fonts/simsun.ttc',    # SimSun
+    '/usr/share/fonts/truetype/noto/NotoSansCJK-Regular.ttc',  # Linux
+]
+
+# ReportLab's font registry is process-wide: register once, under a lock
+_font_lock = threading.Lock()
+_font_name = None
+
+
+def register_fonts(font_path=None):
+    """
+    Register the Chinese font with ReportLab once per process
+
+    Threads of a gthread worker share pdfmetrics, so the font is parsed and
+    registered a single time and never replaced while another thread is
+    building a PDF with it.
+
+    Args:
+        font_path: Font file tried before FONT_PATHS (PDF_FONT_PATH)
+
+    Returns:
+        Font name to use ('ChineseFont', or 'Helvetica' if none was found)
+    """
+    global _font_name
+    if _font_name is not None:
+        return _font_name
+
+    with _font_lock:
+        if _font_name is None:
+            font_paths = ([font_path] if font_path else []) + FONT_PATHS
+            font_name = 'Helvetica'  # Fallback to default
+            for font_path in font_paths:
+                if os.path.exists(font_path):
+                    try:
+                        pdfmetrics.registerFont(TTFont('ChineseFont', font_path, subfontIndex=0))
+                        font_name = 'ChineseFont'
+                        break
+                    except Exception:
+                        continue
+            _font_name = font_name
+    return _font_name
 
 
 class ReceiptPDFService:
-    """Service for generating receipt PDFs"""
+    """
+    Service for generating receipt PDFs
+
+    Instances hold no state besides the font name; styles and flowables are
+    built per document, so one instance per request is safe with threads.
+    """
 
     def __init__(self):
         """Initialize PDF service and register fonts"""
-        self._register_fonts()
-
-    def _register_fonts(self):
-        """Register Chinese fonts"""
-        # Try to find system Chinese fonts
-        font_paths = [
-            'C:/Windows/Fonts/msjh.ttc',      # Microsoft JhengHei
-            'C:/Windows/Fonts/mingliu.ttc',   # MingLiU
-            'C:/Windows/Fonts/simsun.ttc',    # SimSun
-            '/usr/share/fonts/truetype/noto/NotoSansCJK-Regular.ttc',  # Linux
-        ]
-
-        font_registered = False
-        for font_path in font_paths:
-            if os.path.exists(font_path):
-                try:
-                    pdfmetrics.registerFont(TTFont('ChineseFont', font_path, subfontIndex=0))
-                    font_registered = True
-                    break
-                except Exception:
-                    continue
-
-        if not font_registered:
-            # Fallback to default
-            self.chinese_font = 'Helvetica'
-        else:
-            self.chinese_font = 'ChineseFont'
+        font_path = current_app.config.get('PDF_FONT_PATH') if has_app_context() else None
+        self.chinese_font = register_fonts(font_path)
 
     def generate(self, receipt):
         """
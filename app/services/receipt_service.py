@@ -1,20 +1,89 @@
 """
 Receipt Service - Business logic for receipts
 """
+from flask import current_app
 from app import db
-from app.models import Receipt, FeeItem, VoidRequest
+from app.models import (Receipt, FeeItem, VoidRequest, ReportVersion, ArchivedReceipt, CounterOutbox,
+                        ReceiptEvent, SalesCube, Site)
 from app.services.number_chinese import amount_to_chinese
+from app.sites import DEFAULT_SITE_ID, current_site_id
+from app.timezone import now_tw, today_tw
+from sqlalchemy import inspect
 from datetime import datetime
 
 
+def _touch_period(receipt):
+    """Bump the report data version of the receipt's site and month (before commit)"""
+    period_date = receipt.created_at or today_tw()
+    ReportVersion.bump(ReportVersion.period_of(period_date), receipt.site_id)
+
+
+def _count_sale(receipt, active_delta):
+    """Move the receipt into (+1) or out of (-1) the sales cube (before commit)"""
+    SalesCube.add(receipt.created_at, receipt.item_id, active_delta,
+                  active_delta * receipt.amount, receipt.site_id)
+
+
+def _update_kpis(event, receipt, active_delta=0, pending_delta=0, verified=False):
+    """Apply a committed change to the shared dashboard counters (after commit)"""
+    counters = current_app.extensions.get('kpi_counters')
+    if counters is None:
+        return
+    # The identity key survives expire-on-commit, unlike event.id
+    event_id = inspect(event).identity[0]
+    try:
+        if verified:
+            counters.record_verified(event_id, receipt)
+        else:
+            counters.record(event_id, receipt, active_delta, pending_delta)
+    except Exception:
+        # The counters re-seed themselves; never fail a committed write over them
+        current_app.logger.exception('KPI counter update failed for receipt %s', receipt.id)
+
+
+def _publish_void_event(event, void_request, requester_name=None):
+    """Push a committed void queue change to open void pages (after commit)"""
+    bus = current_app.extensions.get('void_events')
+    if bus is None:
+        return
+    receipt = void_request.receipt
+    message = {
+        'cursor': inspect(event).identity[0],
+        'event': event.event_type,
+        'site_id': receipt.site_id,
+        'request_id': void_request.id,
+        'receipt_id': receipt.id,
+        'receipt_no': receipt.receipt_no,
+        'amount': float(receipt.amount),
+        'requester': requester_name,
+        'requested_at': void_request.requested_at.strftime('%m/%d %H:%M') if void_request.requested_at else '',
+        'reason': void_request.reason,
+    }
+    try:
+        bus.publish(message, db.engine)
+    except Exception:
+        # Pages catch up when they reconnect
+        current_app.logger.exception('Void event publish failed for request %s', void_request.id)
+
+
 class ReceiptService:
-    """Service class for receipt operations"""
+    """
+    Service class for receipt operations
+
+    Methods use db.session, which Flask-SQLAlchemy scopes to the current app
+    context: every request (and every thread of a gthread worker) gets its
+    own session. Returned objects belong to that session and are not shared
+    across requests; the report cache holds only aggregated totals.
+    """
 
     @staticmethod
     def create_receipt(item_id, amount, operator, remark=None):
         """
         Create a new receipt
 
+        The receipt belongs to the current site (else the operator's) and
+        is numbered in that site's sequence (Site.receipt_prefix).
+
         Args:
             item_id: Fee item ID
             amount: Amount to charge
@@ -24,12 +93,14 @@ class ReceiptService:
         Returns:
             Receipt object if successful, None otherwise
         """
+        site_id = current_site_id() or getattr(operator, 'site_id', None) or DEFAULT_SITE_ID
         fee_item = FeeItem.query.get(item_id)
-        if not fee_item:
+        if not fee_item or fee_item.site_id != site_id:
             raise ValueError('Invalid fee item')
 
         receipt = Receipt(
-            receipt_no=Receipt.generate_receipt_no(),
+            site_id=site_id,
+            receipt_no=Receipt.generate_receipt_no(Site.prefix_of(site_id)),
             item_id=item_id,
             item_name=fee_item.item_name,
             amount=amount,
@@ -37,23 +108,37 @@ class ReceiptService:
             remark=remark,
             operator_id=operator.id,
             operator_name=operator.full_name,
+            created_at=now_tw(),  # Known before the flush: the sales cube buckets by hour
             status=Receipt.STATUS_ACTIVE
         )
 
         db.session.add(receipt)
+        if current_app.config.get('COUNTER_MODE'):
+            # Local journal entry, pushed to the central database by `flask counter-sync`
+            db.session.add(CounterOutbox(receipt=receipt, receipt_no=receipt.receipt_no))
+        _touch_period(receipt)
+        _count_sale(receipt, 1)
+        event = ReceiptEvent.record(receipt, ReceiptEvent.TYPE_CREATED, operator.id)
         db.session.commit()
+        _update_kpis(event, receipt, active_delta=1)
 
         return receipt
 
     @staticmethod
     def get_receipt(receipt_id):
-        """Get receipt by ID"""
-        return Receipt.query.get(receipt_id)
+        """Get receipt by ID (falls back to the archive)"""
+        receipt = Receipt.query.get(receipt_id)
+        if receipt is None:
+            receipt = ArchivedReceipt.query.filter_by(id=receipt_id).first()
+        return receipt
 
     @staticmethod
     def get_receipt_by_no(receipt_no):
-        """Get receipt by receipt number"""
-        return Receipt.query.filter_by(receipt_no=receipt_no).first()
+        """Get receipt by receipt number (falls back to the archive)"""
+        receipt = Receipt.query.filter_by(receipt_no=receipt_no).first()
+        if receipt is None:
+            receipt = ArchivedReceipt.query.filter_by(receipt_no=receipt_no).first()
+        return receipt
 
     @staticmethod
     def request_void(receipt_id, reason, requester):
@@ -86,6 +171,7 @@ class ReceiptService:
 
         # Create void request
         void_request = VoidRequest(
+            site_id=receipt.site_id,
             receipt_id=receipt_id,
             reason=reason,
             requested_by=requester.id
@@ -95,7 +181,12 @@ class ReceiptService:
         receipt.status = Receipt.STATUS_VOID_PENDING
 
         db.session.add(void_request)
+        _touch_period(receipt)
+        _count_sale(receipt, -1)
+        event = ReceiptEvent.record(receipt, ReceiptEvent.TYPE_VOID_REQUESTED, requester.id, reason)
         db.session.commit()
+        _update_kpis(event, receipt, active_delta=-1, pending_delta=1)
+        _publish_void_event(event, void_request, requester.full_name)
 
         return void_request
 
@@ -129,7 +220,11 @@ class ReceiptService:
         receipt.voided_by = reviewer.id
         receipt.voided_at = datetime.utcnow()
 
+        _touch_period(receipt)
+        event = ReceiptEvent.record(receipt, ReceiptEvent.TYPE_VOIDED, reviewer.id, void_request.reason)
         db.session.commit()
+        _update_kpis(event, receipt, pending_delta=-1)
+        _publish_void_event(event, void_request)
 
         return void_request
 
@@ -160,7 +255,12 @@ class ReceiptService:
         receipt = void_request.receipt
         receipt.status = Receipt.STATUS_ACTIVE
 
+        _touch_period(receipt)
+        _count_sale(receipt, 1)
+        event = ReceiptEvent.record(receipt, ReceiptEvent.TYPE_VOID_REJECTED, reviewer.id, note)
         db.session.commit()
+        _update_kpis(event, receipt, active_delta=1, pending_delta=-1)
+        _publish_void_event(event, void_request)
 
         return void_request
 
@@ -187,7 +287,10 @@ class ReceiptService:
         receipt.verified_by = verifier.id
         receipt.verified_at = datetime.utcnow()
 
+        _touch_period(receipt)
+        event = ReceiptEvent.record(receipt, ReceiptEvent.TYPE_VERIFIED, verifier.id)
         db.session.commit()
+        _update_kpis(event, receipt, verified=True)
 
         return receipt
 
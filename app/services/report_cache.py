@@ -0,0 +1,128 @@
+"""
+Report Cache - Versioned report snapshots (in-process LRU + optional disk tier)
+
+Entries are keyed by (report type, period, operator, data version). The
+data version comes from ReportVersion and is bumped by ReceiptService in
+the same transaction as the write, so a cached report is never served
+after the period changed; old versions simply age out.
+"""
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+from flask import current_app
+
+
+class ReportCache:
+    """Size-bounded LRU with an optional on-disk tier shared by workers"""
+
+    def __init__(self, max_entries=64, cache_dir=None, max_disk_entries=256):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.max_disk_entries = max_disk_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _disk_path(self, key):
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f'{digest}.pickle')
+
+    def get(self, key):
+        """Get a cached value or None"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+        value = self._read_disk(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self._remember(key, value)
+        return value
+
+    def set(self, key, value):
+        """Store a value in memory and, if enabled, on disk"""
+        self._remember(key, value)
+        self._write_disk(key, value)
+
+    def clear(self):
+        """Drop all in-process entries"""
+        with self._lock:
+            self._entries.clear()
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _read_disk(self, key):
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._disk_path(key), 'rb') as f:
+                stored_key, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        return value if stored_key == key else None
+
+    def _write_disk(self, key, value):
+        if not self.cache_dir:
+            return
+        # Write to a temp file and rename so other workers never read a torn file
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((key, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._disk_path(key))
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+        self._prune_disk()
+
+    def _prune_disk(self):
+        """Remove the least recently written files beyond max_disk_entries"""
+        try:
+            names = [n for n in os.listdir(self.cache_dir) if n.endswith('.pickle')]
+        except OSError:
+            return
+        if len(names) <= self.max_disk_entries:
+            return
+
+        paths = [os.path.join(self.cache_dir, n) for n in names]
+        paths.sort(key=lambda p: os.path.getmtime(p) if os.path.exists(p) else 0)
+        for path in paths[:len(paths) - self.max_disk_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def init_report_cache(app):
+    """Create the per-process report cache for an application"""
+    app.extensions['report_cache'] = ReportCache(
+        max_entries=app.config.get('REPORT_CACHE_SIZE', 64),
+        cache_dir=app.config.get('REPORT_CACHE_DIR'),
+        max_disk_entries=app.config.get('REPORT_CACHE_DISK_ENTRIES', 256)
+    )
+
+
+def get_report_cache():
+    """Get the report cache of the current application"""
+    return current_app.extensions['report_cache']
@@ -1,131 +1,204 @@
 """
 Report Service - Generate reports and statistics
 """
+from flask import current_app
 from app import db
-from app.models import Receipt, FeeItem
-from sqlalchemy import func, and_
+from app.models import Receipt, FeeItem, ReportVersion, ArchivedReceipt, ArchivedPeriod
+from app.services.number_chinese import amount_to_chinese
+from app.services.report_cache import get_report_cache
+from app.sites import current_site_id
+from sqlalchemy import func
 from datetime import date, datetime
 from calendar import monthrange
 from decimal import Decimal
-from app.timezone import today_tw
+import heapq
+from app.timezone import day_range, today_tw
+
+
+def _receipt_models(start_date, end_date):
+    """Get the receipt tables holding a date range (hot, plus archive if needed)"""
+    if ArchivedPeriod.overlaps(start_date, end_date):
+        return [Receipt, ArchivedReceipt]
+    return [Receipt]
+
+
+def _period_query(model, start_date, end_date, operator_id=None):
+    """Query receipts of one table created between two dates (inclusive)"""
+    start, end = day_range(start_date, end_date)
+    query = model.query.filter(model.created_at >= start, model.created_at < end)
+    if operator_id:
+        query = query.filter_by(operator_id=operator_id)
+    return query
 
 
 class ReportService:
     """Service for generating reports"""
 
     @staticmethod
-    def get_daily_report(target_date=None, operator_id=None):
+    def _iter_receipts(start_date, end_date, operator_id=None, yield_per=None):
+        """Stream receipts between two dates (inclusive), newest first"""
+        if yield_per is None:
+            yield_per = current_app.config.get('REPORT_YIELD_PER', 1000)
+
+        streams = [
+            _period_query(model, start_date, end_date, operator_id)
+            .order_by(model.created_at.desc()).yield_per(yield_per)
+            for model in _receipt_models(start_date, end_date)
+        ]
+
+        # Hot and archived rows of a month interleave (voided receipts stay hot)
+        yield from heapq.merge(*streams, key=lambda r: r.created_at, reverse=True)
+
+    @staticmethod
+    def _period_totals(start_date, end_date, operator_id=None):
+        """Totals by status between two dates (inclusive), computed in the database"""
+        totals = {}
+        start, end = day_range(start_date, end_date)
+        for model in _receipt_models(start_date, end_date):
+            query = db.session.query(
+                model.status,
+                func.count(model.id),
+                func.coalesce(func.sum(model.amount), 0)
+            ).filter(model.created_at >= start, model.created_at < end)
+
+            if operator_id:
+                query = query.filter(model.operator_id == operator_id)
+
+            for status, count, total in query.group_by(model.status):
+                prev_count, prev_total = totals.get(status, (0, Decimal('0')))
+                totals[status] = (prev_count + count, prev_total + Decimal(str(total)))
+        active_count, active_total = totals.get(Receipt.STATUS_ACTIVE, (0, Decimal('0')))
+        voided_count, voided_total = totals.get(Receipt.STATUS_VOIDED, (0, Decimal('0')))
+
+        return {
+            'total_count': sum(count for count, _ in totals.values()),
+            'active_count': active_count,
+            'active_total': active_total,
+            'voided_count': voided_count,
+            'voided_total': voided_total,
+            'net_total': active_total
+        }
+
+    @staticmethod
+    def _item_breakdown(start_date, end_date, operator_id, active_total):
+        """Active receipts grouped by item between two dates, computed in the database"""
+        item_breakdown = {}
+        start, end = day_range(start_date, end_date)
+        for model in _receipt_models(start_date, end_date):
+            query = db.session.query(
+                model.item_name,
+                func.count(model.id),
+                func.coalesce(func.sum(model.amount), 0)
+            ).filter(
+                model.created_at >= start,
+                model.created_at < end,
+                model.status == Receipt.STATUS_ACTIVE
+            )
+
+            if operator_id:
+                query = query.filter(model.operator_id == operator_id)
+
+            for item_name, count, total in query.group_by(model.item_name):
+                data = item_breakdown.setdefault(item_name, {'count': 0, 'total': Decimal('0')})
+                data['count'] += count
+                data['total'] += Decimal(str(total))
+
+        for data in item_breakdown.values():
+            if active_total > 0:
+                data['percentage'] = float(data['total']) / float(active_total) * 100
+            else:
+                data['percentage'] = 0
+
+        return item_breakdown
+
+    @staticmethod
+    def get_daily_summary(target_date=None, operator_id=None):
         """
-        Get daily report data
+        Get daily report data without the receipt list
 
-        Args:
-            target_date: Date to report (default: today)
-            operator_id: Filter by operator (optional)
+        Pair with iter_daily_receipts to stream the rows.
 
         Returns:
-            dict with receipts and summary
+            dict with date and summary (including total_count)
         """
         if target_date is None:
             target_date = today_tw()
 
-        query = Receipt.query.filter(
-            func.date(Receipt.created_at) == target_date
-        )
-
-        if operator_id:
-            query = query.filter_by(operator_id=operator_id)
+        return {
+            'date': target_date,
+            'summary': ReportService._period_totals(target_date, target_date, operator_id)
+        }
 
-        receipts = query.order_by(Receipt.created_at.desc()).all()
+    @staticmethod
+    def iter_daily_receipts(target_date, operator_id=None, yield_per=None):
+        """Stream a day's receipts, newest first (see iter_monthly_receipts)"""
+        return ReportService._iter_receipts(target_date, target_date, operator_id, yield_per)
 
-        # Calculate summary
-        active_receipts = [r for r in receipts if r.status == Receipt.STATUS_ACTIVE]
-        voided_receipts = [r for r in receipts if r.status == Receipt.STATUS_VOIDED]
+    @staticmethod
+    def get_cached_monthly_summary(year, month, operator_id=None):
+        """
+        Get monthly report data without the receipt list, through the report cache
 
-        active_total = sum(r.amount for r in active_receipts)
-        voided_total = sum(r.amount for r in voided_receipts)
+        Totals and item breakdown are aggregated in the database; the result
+        is keyed by the site and the period's data version (see ReportVersion)
+        and is shared between requests, so it must not be modified. Pair with
+        iter_monthly_receipts to stream the rows.
 
-        return {
-            'date': target_date,
-            'receipts': receipts,
-            'summary': {
-                'active_count': len(active_receipts),
-                'active_total': active_total,
-                'voided_count': len(voided_receipts),
-                'voided_total': voided_total,
-                'net_total': active_total
+        Returns:
+            dict with year, month, period_start, period_end, summary
+            (see _period_totals, plus net_total_chinese) and item_breakdown
+        """
+        period = f'{year:04d}-{month:02d}'
+        site_id = current_site_id()  # None: all sites (CLI)
+        key = ('monthly_summary', site_id, period, operator_id or 0,
+               ReportVersion.get_version(period, site_id))
+        cache = get_report_cache()
+
+        report = cache.get(key)
+        if report is None:
+            start_date = date(year, month, 1)
+            _, last_day = monthrange(year, month)
+            end_date = date(year, month, last_day)
+
+            summary = ReportService._period_totals(start_date, end_date, operator_id)
+            summary['net_total_chinese'] = amount_to_chinese(summary['net_total'])
+            report = {
+                'year': year,
+                'month': month,
+                'period_start': start_date,
+                'period_end': end_date,
+                'summary': summary,
+                'item_breakdown': ReportService._item_breakdown(
+                    start_date, end_date, operator_id, summary['active_total']
+                )
             }
-        }
+            cache.set(key, report)
+
+        return report
 
     @staticmethod
-    def get_monthly_report(year, month, operator_id=None):
+    def iter_monthly_receipts(year, month, operator_id=None, yield_per=None):
         """
-        Get monthly report data
+        Stream a month's receipts without loading them all at once
+
+        Uses a server-side cursor on PostgreSQL (named cursor via stream_results)
+        and fetches `yield_per` rows per round trip, so memory stays flat for
+        long periods.
 
         Args:
             year: Year
             month: Month (1-12)
             operator_id: Filter by operator (optional)
+            yield_per: Rows per batch (default: REPORT_YIELD_PER)
 
-        Returns:
-            dict with receipts, summary, and breakdown by item
+        Yields:
+            Receipt objects ordered by created_at descending
         """
         start_date = date(year, month, 1)
         _, last_day = monthrange(year, month)
         end_date = date(year, month, last_day)
 
-        query = Receipt.query.filter(
-            and_(
-                func.date(Receipt.created_at) >= start_date,
-                func.date(Receipt.created_at) <= end_date
-            )
-        )
-
-        if operator_id:
-            query = query.filter_by(operator_id=operator_id)
-
-        receipts = query.order_by(Receipt.created_at.desc()).all()
-
-        # Calculate summary
-        active_receipts = [r for r in receipts if r.status == Receipt.STATUS_ACTIVE]
-        voided_receipts = [r for r in receipts if r.status == Receipt.STATUS_VOIDED]
-
-        active_total = sum(r.amount for r in active_receipts)
-        voided_total = sum(r.amount for r in voided_receipts)
-
-        # Breakdown by item
-        item_breakdown = {}
-        for receipt in active_receipts:
-            if receipt.item_name not in item_breakdown:
-                item_breakdown[receipt.item_name] = {
-                    'count': 0,
-                    'total': Decimal('0')
-                }
-            item_breakdown[receipt.item_name]['count'] += 1
-            item_breakdown[receipt.item_name]['total'] += receipt.amount
-
-        # Calculate percentages
-        for item_name in item_breakdown:
-            if active_total > 0:
-                item_breakdown[item_name]['percentage'] = \
-                    float(item_breakdown[item_name]['total']) / float(active_total) * 100
-            else:
-                item_breakdown[item_name]['percentage'] = 0
-
-        return {
-            'year': year,
-            'month': month,
-            'period_start': start_date,
-            'period_end': end_date,
-            'receipts': receipts,
-            'summary': {
-                'active_count': len(active_receipts),
-                'active_total': active_total,
-                'voided_count': len(voided_receipts),
-                'voided_total': voided_total,
-                'net_total': active_total
-            },
-            'item_breakdown': item_breakdown
-        }
+        return ReportService._iter_receipts(start_date, end_date, operator_id, yield_per)
 
     @staticmethod
     def get_unverified_receipts(operator_id=None):
@@ -170,18 +243,10 @@ class ReportService:
         _, last_day = monthrange(year, month)
         end_date = date(year, month, last_day)
 
-        query = Receipt.query.filter(
-            and_(
-                func.date(Receipt.created_at) >= start_date,
-                func.date(Receipt.created_at) <= end_date,
-                Receipt.status == Receipt.STATUS_ACTIVE
-            )
-        )
-
-        if operator_id:
-            query = query.filter_by(operator_id=operator_id)
-
-        receipts = query.all()
+        receipts = []
+        for model in _receipt_models(start_date, end_date):
+            query = _period_query(model, start_date, end_date, operator_id)
+            receipts.extend(query.filter(model.status == Receipt.STATUS_ACTIVE).all())
 
         verified = [r for r in receipts if r.is_verified]
         unverified = [r for r in receipts if not r.is_verified]
@@ -197,28 +262,3 @@ class ReportService:
             'unverified_amount': sum(r.amount for r in unverified),
             'unverified_receipts': unverified
         }
-
-    @staticmethod
-    def export_to_excel_data(receipts):
-        """
-        Prepare receipt data for Excel export
-
-        Args:
-            receipts: List of Receipt objects
-
-        Returns:
-            List of dicts for Excel export
-        """
-        data = []
-        for r in receipts:
-            data.append({
-                '\u6536\u64da\u7de8\u865f': r.receipt_no,
-                '\u65e5\u671f\u6642\u9593': r.created_at.strftime('%Y/%m/%d %H:%M:%S') if r.created_at else '',
-                '\u6536\u8cbb\u9805\u76ee': r.item_name,
-                '\u91d1\u984d': float(r.amount),
-                '\u5099\u8a3b': r.remark or '',
-                '\u72c0\u614b': r.status_display,
-                '\u7d93\u8fa6\u54e1': r.operator_name,
-                '\u9a57\u8b49\u72c0\u614b': '\u5df2\u9a57\u8b49' if r.is_verified else '\u672a\u9a57\u8b49'
-            })
-        return data
@@ -0,0 +1,156 @@
+"""
+Sales Cube Service - Hourly/weekday sales analytics for staffing
+
+The sales cube (SalesCube) holds, per site and month, the active receipt
+count and takings of every fee item for each weekday and hour. Receipt
+writes keep it current in their own transaction; `flask
+rebuild-sales-cube` recomputes it from the receipts (hot and archive)
+with one GROUP BY per table, so the database does the bulk aggregation.
+
+A heatmap for any year or month slice reads at most 7 * 24 cells per fee
+item and month, independent of the number of receipts.
+"""
+from datetime import date
+from decimal import Decimal
+from sqlalchemy import Integer, cast, delete, extract, func, insert
+from app import db
+from app.models import ArchivedReceipt, FeeItem, Receipt
+from app.models.sales_cube import SalesCube
+from app.services.archive_service import month_bounds
+
+
+def _buckets(column):
+    """SQL expressions (period YYYY-MM, weekday 0 = Monday, hour) of a timestamp column"""
+    if db.engine.dialect.name == 'postgresql':
+        return (func.to_char(column, 'YYYY-MM'),
+                cast(extract('isodow', column), Integer) - 1,
+                cast(extract('hour', column), Integer))
+    return (func.strftime('%Y-%m', column),
+            (cast(func.strftime('%w', column), Integer) + 6) % 7,
+            cast(func.strftime('%H', column), Integer))
+
+
+class SalesCubeService:
+    """Service class for the sales cube"""
+
+    @staticmethod
+    def _aggregate(model, start=None, end=None):
+        period, weekday, hour = _buckets(model.created_at)
+        query = db.session.query(
+            model.site_id, period, weekday, hour, model.item_id,
+            func.count(model.id), func.coalesce(func.sum(model.amount), 0)
+        ).filter(model.status == Receipt.STATUS_ACTIVE)
+        if start is not None:
+            query = query.filter(model.created_at >= start, model.created_at < end)
+        return query.group_by(model.site_id, period, weekday, hour, model.item_id)
+
+    @staticmethod
+    def rebuild(year=None, month=None):
+        """
+        Recompute the cube from the receipts in one transaction
+
+        Limited to the current site when one is active (see app.sites).
+
+        Args:
+            year, month: Rebuild only this month (default: everything)
+
+        Returns:
+            (cells, receipts) written
+        """
+        cells = {}
+        start = end = None
+        if year is not None:
+            start, end = month_bounds(year, month)
+        for model in (Receipt, ArchivedReceipt):
+            for site_id, period, weekday, hour, item_id, count, amount in \
+                    SalesCubeService._aggregate(model, start, end):
+                cell = cells.setdefault((site_id, period, weekday, hour, item_id), [0, Decimal(0)])
+                cell[0] += count
+                cell[1] += Decimal(str(amount))
+
+        stale = delete(SalesCube)
+        if start is not None:
+            stale = stale.where(SalesCube.period == f'{year:04d}-{month:02d}')
+        db.session.execute(stale)
+        if cells:
+            db.session.execute(insert(SalesCube), [
+                {'site_id': site_id, 'period': period, 'weekday': weekday, 'hour': hour,
+                 'item_id': item_id, 'receipt_count': count, 'amount': amount}
+                for (site_id, period, weekday, hour, item_id), (count, amount) in cells.items()
+            ])
+        db.session.commit()
+        return len(cells), sum(count for count, _ in cells.values())
+
+    @staticmethod
+    def heatmap(year, month=None, item_id=None, identity_type=None):
+        """
+        Sales by weekday and hour for a year or a month
+
+        Args:
+            year: Year to report
+            month: Month (default: the whole year)
+            item_id: Only this fee item (optional)
+            identity_type: Only fee items of this identity type (optional)
+
+        Returns:
+            dict with cells[weekday][hour] = (count, amount), totals by
+            weekday, hour, item and identity type, the largest cell (count,
+            amount) and the grand total
+        """
+        if month:
+            periods = [f'{year:04d}-{month:02d}']
+        else:
+            periods = [f'{year:04d}-{m:02d}' for m in range(1, 13)]
+
+        query = db.session.query(
+            SalesCube.weekday, SalesCube.hour, SalesCube.item_id,
+            func.sum(SalesCube.receipt_count), func.sum(SalesCube.amount)
+        ).filter(SalesCube.period.in_(periods))
+        if item_id:
+            query = query.filter(SalesCube.item_id == item_id)
+        if identity_type:
+            query = query.join(FeeItem, FeeItem.id == SalesCube.item_id) \
+                .filter(FeeItem.identity_type == identity_type)
+        rows = query.group_by(SalesCube.weekday, SalesCube.hour, SalesCube.item_id).all()
+
+        items = {item.id: item for item in FeeItem.query.filter(
+            FeeItem.id.in_({row[2] for row in rows})
+        )} if rows else {}
+
+        cells = [[[0, Decimal(0)] for _ in range(24)] for _ in range(7)]
+        by_weekday = [[0, Decimal(0)] for _ in range(7)]
+        by_hour = [[0, Decimal(0)] for _ in range(24)]
+        by_item, by_identity = {}, {}
+        total = [0, Decimal(0)]
+        for weekday, hour, row_item_id, count, amount in rows:
+            amount = Decimal(str(amount or 0))
+            item = items.get(row_item_id)
+            identity = (item.identity_type if item else None) or ''
+            for bucket in (cells[weekday][hour], by_weekday[weekday], by_hour[hour], total,
+                           by_item.setdefault(row_item_id, [0, Decimal(0)]),
+                           by_identity.setdefault(identity, [0, Decimal(0)])):
+                bucket[0] += count
+                bucket[1] += amount
+
+        return {
+            'year': year,
+            'month': month,
+            'cells': cells,
+            'by_weekday': by_weekday,
+            'by_hour': by_hour,
+            'by_item': sorted(
+                ((items[i].item_name if i in items else str(i), count, amount)
+                 for i, (count, amount) in by_item.items()),
+                key=lambda entry: -entry[1]
+            ),
+            'by_identity': sorted(by_identity.items(), key=lambda entry: -entry[1][0]),
+            'peak': [max(cell[i] for row in cells for cell in row) for i in (0, 1)],
+            'total': total,
+        }
+
+    @staticmethod
+    def available_years():
+        """Years with cube data, newest first (current year if none)"""
+        periods = db.session.query(func.substr(SalesCube.period, 1, 4)).distinct().all()
+        years = sorted({int(year) for (year,) in periods}, reverse=True)
+        return years or [date.today().year]
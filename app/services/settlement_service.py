@@ -0,0 +1,293 @@
+"""
+Settlement Service - Month-end payment settlement for all operators
+"""
+from app import db
+from app.models import Receipt, PaymentRecord, User
+from app.services.report_service import _receipt_models
+from app.timezone import day_range
+from sqlalchemy import func, case, and_, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+from datetime import date, datetime
+from calendar import monthrange
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+CENT = Decimal('0.01')
+MAX_AMOUNT = Decimal('99999999.99')  # Largest Numeric(10, 2) value
+
+
+def month_period(year, month):
+    """Get (first day, last day) of a month"""
+    _, last_day = monthrange(year, month)
+    return date(year, month, 1), date(year, month, last_day)
+
+
+def parse_amount(value):
+    """
+    Parse an amount entered by the cashier as an exact Decimal
+
+    Returns:
+        Decimal rounded half up to cents, or None if the field is empty
+
+    Raises:
+        ValueError: not a number, negative, or above MAX_AMOUNT
+    """
+    value = (value or '').strip().replace(',', '')
+    if not value:
+        return None
+    try:
+        amount = Decimal(value)
+        if not amount.is_finite() or amount < 0:
+            raise InvalidOperation
+        amount = amount.quantize(CENT, rounding=ROUND_HALF_UP)
+    except InvalidOperation:
+        raise ValueError(f'金額格式錯誤: {value}')
+    if amount > MAX_AMOUNT:
+        raise ValueError(f'金額超過上限: {value}')
+    return amount
+
+
+def empty_totals():
+    """Totals of an operator without receipts"""
+    return {
+        'total_count': 0, 'total_amount': Decimal('0'),
+        'verified_count': 0, 'verified_amount': Decimal('0'),
+        'unverified_count': 0, 'unverified_amount': Decimal('0'),
+    }
+
+
+def encode_cursor(payment):
+    """Ledger cursor of a payment record: position just after it"""
+    return f'{payment.received_at.isoformat()}_{payment.id}'
+
+
+def decode_cursor(cursor):
+    """
+    Parse a ledger cursor
+
+    Raises:
+        ValueError: malformed cursor
+    """
+    received_at, _, payment_id = (cursor or '').rpartition('_')
+    return datetime.fromisoformat(received_at), int(payment_id)
+
+
+class SettlementService:
+    """Service for month-end settlement"""
+
+    @staticmethod
+    def period_totals(year, month, operator_id=None):
+        """
+        System amounts of active receipts per operator for a month
+
+        One grouped query per receipt table (hot, plus archive for archived
+        months) instead of loading every receipt. Sums are rounded to cents
+        (SQLite adds NUMERIC columns as floats).
+
+        Args:
+            year: Year
+            month: Month (1-12)
+            operator_id: Only this operator (optional)
+
+        Returns:
+            dict operator_id -> dict with total/verified/unverified counts
+            and Decimal amounts
+        """
+        start_date, end_date = month_period(year, month)
+        totals = {}
+        start, end = day_range(start_date, end_date)
+        for model in _receipt_models(start_date, end_date):
+            verified = model.is_verified.is_(True)
+            query = db.session.query(
+                model.operator_id,
+                func.count(model.id),
+                func.coalesce(func.sum(model.amount), 0),
+                func.count(case((verified, model.id))),
+                func.coalesce(func.sum(case((verified, model.amount), else_=0)), 0),
+            ).filter(
+                model.created_at >= start,
+                model.created_at < end,
+                model.status == Receipt.STATUS_ACTIVE
+            )
+            if operator_id:
+                query = query.filter(model.operator_id == operator_id)
+
+            for op_id, count, amount, verified_count, verified_amount in \
+                    query.group_by(model.operator_id):
+                entry = totals.setdefault(op_id, empty_totals())
+                entry['total_count'] += count
+                entry['total_amount'] += Decimal(str(amount)).quantize(CENT)
+                entry['verified_count'] += verified_count
+                entry['verified_amount'] += Decimal(str(verified_amount)).quantize(CENT)
+
+        for entry in totals.values():
+            entry['unverified_count'] = entry['total_count'] - entry['verified_count']
+            entry['unverified_amount'] = entry['total_amount'] - entry['verified_amount']
+        return totals
+
+    @staticmethod
+    def get_settlement(year, month):
+        """
+        Settlement sheet of a month: one row per operator
+
+        Active operators are always listed; inactive ones only when they
+        have receipts in the month.
+
+        Returns:
+            dict with period and rows (operator, totals, existing payment)
+        """
+        start_date, end_date = month_period(year, month)
+        totals = SettlementService.period_totals(year, month)
+        operators = User.query.filter(
+            db.or_(
+                and_(User.role.in_([User.ROLE_OPERATOR, User.ROLE_SUPERVISOR, User.ROLE_ADMIN]),
+                     User.is_active.is_(True)),
+                User.id.in_(list(totals))
+            )
+        ).order_by(User.id).all()
+
+        payments = {
+            p.operator_id: p for p in PaymentRecord.query.filter_by(
+                period_start=start_date, period_end=end_date
+            )
+        }
+
+        rows = []
+        for operator in operators:
+            row = dict(totals.get(operator.id) or empty_totals())
+            row['operator'] = operator
+            row['payment'] = payments.get(operator.id)
+            rows.append(row)
+
+        return {
+            'year': year,
+            'month': month,
+            'period_start': start_date,
+            'period_end': end_date,
+            'rows': rows,
+            'total_amount': sum((row['total_amount'] for row in rows), Decimal('0')),
+        }
+
+    @staticmethod
+    def settle(year, month, entries, receiver):
+        """
+        Write the payment records of a month in one transaction
+
+        System amounts are recomputed here, not taken from the form, and
+        differences are exact Decimal arithmetic.
+
+        Args:
+            year: Year
+            month: Month (1-12)
+            entries: dict operator_id -> (actual Decimal amount, notes)
+            receiver: User receiving the money
+
+        Returns:
+            List of created PaymentRecord objects
+
+        Raises:
+            ValueError: an operator is already settled for the month
+        """
+        start_date, end_date = month_period(year, month)
+        if not entries:
+            return []
+
+        SettlementService._check_unsettled(start_date, end_date, entries)
+
+        totals = SettlementService.period_totals(year, month)
+        payments = []
+        for operator_id, (actual_amount, notes) in sorted(entries.items()):
+            system_amount = totals.get(operator_id, empty_totals())['total_amount']
+            payment = PaymentRecord(
+                operator_id=operator_id,
+                period_start=start_date,
+                period_end=end_date,
+                system_amount=system_amount,
+                actual_amount=actual_amount,
+                difference=actual_amount - system_amount,
+                received_by=receiver.id,
+                notes=notes or None
+            )
+            db.session.add(payment)
+            payments.append(payment)
+
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another submit of the sheet settled one of them first
+            db.session.rollback()
+            SettlementService._check_unsettled(start_date, end_date, entries)
+            raise
+        return payments
+
+    @staticmethod
+    def _check_unsettled(start_date, end_date, operator_ids):
+        """Raise ValueError naming the operators already settled for the period"""
+        settled = PaymentRecord.query.filter(
+            PaymentRecord.period_start == start_date,
+            PaymentRecord.period_end == end_date,
+            PaymentRecord.operator_id.in_(list(operator_ids))
+        ).all()
+        if settled:
+            names = ', '.join(sorted(p.operator.full_name for p in settled))
+            raise ValueError(f'以下操作員本月已有繳款紀錄: {names}')
+
+    @staticmethod
+    def get_ledger(operator_id=None, year=None, month=None, cursor=None, page_size=50):
+        """
+        One page of payment records, newest first, with running differences
+
+        Pages by keyset on (received_at, id), so every page costs the same
+        however many records exist. running_difference is the operator's
+        cumulative over/short up to each record, computed by a window
+        function over the operator's whole history (not just this page or
+        period).
+
+        Args:
+            operator_id: Only this operator (optional)
+            year: Only periods of this year (optional)
+            month: With year, only this month (optional)
+            cursor: encode_cursor() of the last record of the previous page
+            page_size: Records per page
+
+        Returns:
+            dict with entries [(PaymentRecord, running_difference)],
+            next_cursor (None on the last page)
+        """
+        order = (PaymentRecord.received_at, PaymentRecord.id)
+        running = db.session.query(
+            PaymentRecord.id.label('id'),
+            func.sum(func.coalesce(PaymentRecord.difference, 0)).over(
+                partition_by=PaymentRecord.operator_id, order_by=order
+            ).label('running_difference')
+        )
+        if operator_id:
+            running = running.filter(PaymentRecord.operator_id == operator_id)
+        running = running.subquery()
+
+        query = db.session.query(PaymentRecord, running.c.running_difference) \
+            .join(running, running.c.id == PaymentRecord.id) \
+            .options(joinedload(PaymentRecord.operator), joinedload(PaymentRecord.receiver))
+
+        if year and month:
+            start_date, end_date = month_period(year, month)
+            query = query.filter(PaymentRecord.period_start >= start_date,
+                                 PaymentRecord.period_end <= end_date)
+        elif year:
+            query = query.filter(PaymentRecord.period_start >= date(year, 1, 1),
+                                 PaymentRecord.period_end <= date(year, 12, 31))
+
+        if cursor:
+            received_at, payment_id = decode_cursor(cursor)
+            query = query.filter(or_(
+                PaymentRecord.received_at < received_at,
+                and_(PaymentRecord.received_at == received_at, PaymentRecord.id < payment_id)
+            ))
+
+        rows = query.order_by(PaymentRecord.received_at.desc(), PaymentRecord.id.desc()) \
+            .limit(page_size + 1).all()
+        entries = [(payment, Decimal(str(balance)).quantize(CENT)) for payment, balance in rows[:page_size]]
+        return {
+            'entries': entries,
+            'next_cursor': encode_cursor(entries[-1][0]) if len(rows) > page_size else None,
+        }
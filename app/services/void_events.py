@@ -0,0 +1,248 @@
+"""
+Void Events - Push void queue changes to open void pages (Server-Sent Events)
+
+ReceiptService publishes a message after each committed void request,
+approval and rejection. Every process keeps an in-process bus of its SSE
+subscribers (/void/events); messages reach the subscribers of the other
+workers through
+    - PostgreSQL LISTEN/NOTIFY on channel void_queue, or
+    - Unix datagram sockets, one per process with subscribers, in
+      VOID_EVENTS_SOCKET_DIR (workers on the same host; SQLite).
+Without either (Windows + SQLite) only the publishing process is notified.
+
+Listener threads start with the first subscriber of a process, never at
+import or app creation, so workers still boot without touching the
+database.
+"""
+import json
+import logging
+import os
+import queue
+import select
+import socket
+import threading
+import time
+from flask import current_app
+from sqlalchemy import text
+from app import db
+from app.database import shared_state_path
+from app.models import ReceiptEvent
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'void_queue'
+
+# ReceiptEvent types that change the void queue
+VOID_EVENT_TYPES = (ReceiptEvent.TYPE_VOID_REQUESTED, ReceiptEvent.TYPE_VOIDED,
+                    ReceiptEvent.TYPE_VOID_REJECTED)
+
+# Returned by Subscription.get when messages were dropped: the page reloads
+RELOAD = object()
+
+
+class Subscription:
+    """Bounded message queue of one SSE connection"""
+
+    def __init__(self, max_pending=100):
+        self._queue = queue.Queue(maxsize=max_pending)
+        self.overflowed = False
+
+    def put(self, message):
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout):
+        """Next message, RELOAD after an overflow, or None on timeout"""
+        if self.overflowed:
+            return RELOAD
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class VoidEventBus:
+    """In-process pub/sub with a cross-worker transport"""
+
+    def __init__(self, socket_dir):
+        self.socket_dir = socket_dir
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._pid = None
+        self._listener = None
+        self._engine = None
+
+    def _transport(self, engine):
+        if engine.dialect.name == 'postgresql':
+            return 'notify'
+        if hasattr(socket, 'AF_UNIX'):
+            return 'socket'
+        return 'local'
+
+    def _dispatch(self, message):
+        """Deliver a message to the subscribers of this process"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.put(message)
+
+    # -- subscribers --------------------------------------------------
+
+    def subscribe(self, engine):
+        """
+        Register an SSE connection of this process
+
+        Args:
+            engine: Primary database engine (LISTEN connection on PostgreSQL)
+        """
+        subscription = Subscription()
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked worker: the parent's subscribers and listener are not ours
+                self._subscribers = set()
+                self._listener = None
+                self._pid = os.getpid()
+            if self._listener is None and self._transport(engine) != 'local':
+                # Ready before the caller checks for missed events: no gap
+                self._engine = engine
+                if self._transport(engine) == 'notify':
+                    target, args = self._listen_notify, (self._open_listen_connection(),)
+                else:
+                    target, args = self._listen_socket, (self._bind_socket(),)
+                self._listener = threading.Thread(target=target, args=args,
+                                                  name='void-events', daemon=True)
+                self._listener.start()
+            self._subscribers.add(subscription)
+        return subscription
+
+    def subscriber_count(self):
+        """Open streams of this process"""
+        with self._lock:
+            return len(self._subscribers) if self._pid == os.getpid() else 0
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    # -- publishing ---------------------------------------------------
+
+    def publish(self, message, engine):
+        """
+        Announce a committed void queue change to every worker
+
+        Call after the commit: subscribers never see uncommitted changes.
+        """
+        transport = self._transport(engine)
+        payload = json.dumps(message, ensure_ascii=False)
+        if transport == 'notify':
+            with engine.connect() as connection:
+                connection.execute(text('SELECT pg_notify(:channel, :payload)'),
+                                   {'channel': CHANNEL, 'payload': payload})
+                connection.commit()
+        elif transport == 'socket':
+            self._send_sockets(payload.encode('utf-8'))
+        else:
+            self._dispatch(message)
+
+    def _send_sockets(self, data):
+        try:
+            names = [n for n in os.listdir(self.socket_dir) if n.endswith('.sock')]
+        except FileNotFoundError:
+            return  # Nobody has subscribed yet
+        sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sender.setblocking(False)
+        try:
+            for name in names:
+                path = os.path.join(self.socket_dir, name)
+                try:
+                    sender.sendto(data, path)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # Worker exited without removing its socket
+                    try:
+                        os.unlink(path)
+                    except FileNotFoundError:
+                        pass
+                except OSError as e:
+                    # Receiver's buffer is full: its pages reload on reconnect
+                    logger.warning('Void event not delivered to %s: %s', name, e)
+        finally:
+            sender.close()
+
+    # -- listeners (one thread per process) ----------------------------
+
+    def _bind_socket(self):
+        os.makedirs(self.socket_dir, exist_ok=True)
+        path = os.path.join(self.socket_dir, f'{os.getpid()}.sock')
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        receiver.bind(path)
+        return receiver
+
+    def _listen_socket(self, receiver):
+        while True:
+            data = receiver.recv(65536)
+            try:
+                self._dispatch(json.loads(data.decode('utf-8')))
+            except ValueError:
+                logger.warning('Malformed void event ignored')
+
+    def _open_listen_connection(self):
+        raw = self._engine.raw_connection()
+        raw.detach()  # Held for the life of the process, not pooled
+        connection = raw.driver_connection
+        connection.autocommit = True
+        connection.cursor().execute(f'LISTEN {CHANNEL}')
+        return connection
+
+    def _listen_notify(self, connection):
+        while True:
+            try:
+                if connection is None:
+                    connection = self._open_listen_connection()
+                if select.select([connection], [], [], 60) == ([], [], []):
+                    continue
+                connection.poll()
+                while connection.notifies:
+                    notify = connection.notifies.pop(0)
+                    self._dispatch(json.loads(notify.payload))
+            except Exception:
+                logger.exception('Void event listener failed; reconnecting')
+                # Subscribers may have missed messages: their pages reload
+                self._dispatch_reload()
+                connection = None
+                time.sleep(5)
+
+    def _dispatch_reload(self):
+        with self._lock:
+            for subscription in self._subscribers:
+                subscription.overflowed = True
+
+
+def latest_void_cursor():
+    """ReceiptEvent id of the last void queue change (0 if none)"""
+    return db.session.query(db.func.coalesce(db.func.max(ReceiptEvent.id), 0)) \
+        .filter(ReceiptEvent.event_type.in_(VOID_EVENT_TYPES)).scalar()
+
+
+def has_void_changes_since(cursor):
+    """Check if the void queue (of the current site) changed after a ReceiptEvent id"""
+    return db.session.query(ReceiptEvent.id).filter(
+        ReceiptEvent.id > cursor,
+        ReceiptEvent.event_type.in_(VOID_EVENT_TYPES)
+    ).first() is not None
+
+
+def init_void_events(app):
+    """Attach the void event bus to an application"""
+    socket_dir = app.config.get('VOID_EVENTS_SOCKET_DIR') or shared_state_path(app, 'void-events')
+    app.extensions['void_events'] = VoidEventBus(socket_dir)
+
+
+def get_void_events():
+    """Get the void event bus of the current application (None if disabled)"""
+    return current_app.extensions.get('void_events')
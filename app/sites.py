@@ -0,0 +1,88 @@
+"""
+Site Scoping - One deployment serving several pools (sites)
+
+Receipts, fee items, users, payment records and void requests carry a
+site_id (app.models.site.SiteScoped). While a site is active, every ORM
+SELECT, UPDATE and DELETE of those models is limited to its rows
+(with_loader_criteria), so routes and services need no site filters of
+their own:
+    - requests: the site of the logged-in user (administrators can switch
+      sites, remembered in the session)
+    - background jobs and counter seeding: site_scope(site_id)
+CLI commands run without a site and see every site. A statement can opt
+out with .execution_options(all_sites=True) (e.g. global unique checks).
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import g, has_app_context, session
+from sqlalchemy import event
+from sqlalchemy.orm import with_loader_criteria
+
+DEFAULT_SITE_ID = 1
+
+_site = ContextVar('site', default=None)
+
+
+def current_site_id():
+    """Site the current code runs for, or None (all sites)"""
+    site_id = _site.get()
+    if site_id is None and has_app_context():
+        site_id = g.get('site_id')
+    return site_id
+
+
+@contextmanager
+def site_scope(site_id):
+    """Run a block for one site (None: keep the surrounding scope)"""
+    token = _site.set(site_id) if site_id is not None else None
+    try:
+        yield
+    finally:
+        if token is not None:
+            _site.reset(token)
+
+
+def _limit_to_site(state):
+    site_id = current_site_id()
+    if site_id is None or state.execution_options.get('all_sites'):
+        return
+    if not (state.is_select or state.is_update or state.is_delete):
+        return
+    if state.is_column_load or state.is_relationship_load:
+        return  # Loading attributes of rows already limited to the site
+    from app.models.site import SiteScoped
+    state.statement = state.statement.options(
+        with_loader_criteria(SiteScoped, lambda cls: cls.site_id == site_id, include_aliases=True)
+    )
+
+
+def request_site_id(user):
+    """Site of a request: the user's own, or the one an administrator switched to"""
+    if not getattr(user, 'is_authenticated', False):
+        return None
+    if user.can_manage_users() and session.get('site_id'):
+        return session['site_id']
+    return getattr(user, 'site_id', None) or DEFAULT_SITE_ID
+
+
+def init_sites(app):
+    """Scope ORM queries of every request to the user's site"""
+    from flask_login import current_user
+    from app.replica import RoutingSession
+
+    if not event.contains(RoutingSession, 'do_orm_execute', _limit_to_site):
+        event.listen(RoutingSession, 'do_orm_execute', _limit_to_site)
+
+    @app.before_request
+    def select_site():
+        # Demo mode sets g.user in an earlier before_request
+        g.site_id = request_site_id(g.get('user') or current_user)
+
+    @app.context_processor
+    def inject_site():
+        site_id = g.get('site_id')
+        if site_id is None:
+            return {}
+        from app.models.site import Site
+        code, name, _ = Site.describe(site_id)
+        return {'current_site': {'id': site_id, 'code': code, 'name': name}}
@@ -0,0 +1,78 @@
+"""
+Template Engine Setup - Shared Jinja bytecode cache and precompilation
+"""
+import os
+from flask import Response, current_app, stream_template
+from jinja2 import FileSystemBytecodeCache
+
+
+def configure_templates(app):
+    """
+    Enable the filesystem bytecode cache (TEMPLATE_CACHE_DIR)
+
+    Compiled templates are written once and reused by every worker on the
+    host, so a restart does not recompile each page on its first hit.
+    Entries are keyed by template name and source checksum: an edited
+    template is recompiled automatically after a deploy.
+
+    Must run before app.jinja_env is first accessed.
+    """
+    cache_dir = app.config.get('TEMPLATE_CACHE_DIR')
+    if not cache_dir:
+        return
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+    except OSError:
+        return
+    if not os.access(cache_dir, os.W_OK):
+        return
+
+    app.jinja_options = dict(
+        app.jinja_options,
+        bytecode_cache=FileSystemBytecodeCache(cache_dir, pattern='swim-%s.cache')
+    )
+
+
+def precompile_templates(app):
+    """
+    Compile every template into the bytecode cache
+
+    Returns:
+        Number of templates compiled
+    """
+    names = app.jinja_env.list_templates(extensions=['html'])
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+
+def _buffered(chunks, size):
+    """Join small template output events into chunks of at least `size` characters"""
+    buffer = []
+    length = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer = []
+            length = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def stream_page(template_name, **context):
+    """
+    Render a template as a streamed HTML response
+
+    Context values may be generators (e.g. rows from a database cursor);
+    output is sent in STREAM_BUFFER_SIZE chunks as it is rendered, so the
+    page header reaches the browser before the last row is fetched.
+    """
+    size = current_app.config.get('STREAM_BUFFER_SIZE', 8192)
+    response = Response(_buffered(stream_template(template_name, **context), size),
+                        mimetype='text/html')
+    # Ask reverse proxies (nginx) not to hold the response until it completes
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,7 +1,7 @@
 """
 Taiwan Timezone Utilities
 """
-from datetime import datetime, timezone, timedelta
+from datetime import datetime, time, timezone, timedelta
 
 # Taiwan timezone (UTC+8)
 TW_TIMEZONE = timezone(timedelta(hours=8))
@@ -17,6 +17,17 @@ def today_tw():
     return now_tw().date()
 
 
+def day_range(start_date, end_date):
+    """
+    [start, end) datetimes covering the days start_date..end_date (inclusive)
+
+    Compare created_at with these rather than date(created_at), so indexes
+    on (..., created_at) can narrow on the range.
+    """
+    return (datetime.combine(start_date, time.min),
+            datetime.combine(end_date + timedelta(days=1), time.min))
+
+
 def to_tw_time(dt):
     """Convert a datetime to Taiwan timezone"""
     if dt is None:
@@ -0,0 +1,168 @@
+"""
+SQLite Backup Benchmark - Receipt write latency during online backups, WAL shipping and restore
+
+Fills a fresh SQLite database with historical receipts (flask
+import-receipts), then for each SQLite profile issues receipts
+continuously and reports their latency
+    - with no backup running
+    - during an online backup of BACKUP_STEP_PAGES pages per step
+    - during an online backup of the whole file in one step
+
+Then runs flask wal-ship next to three batches of receipts and checks that
+restore-database rebuilds the state between the second and third batch
+and the latest state.
+
+Usage:
+    python -m bench.backup
+    python -m bench.backup --rows 200000 --profiles default,wal
+"""
+import argparse
+import os
+import shutil
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from bench.counter_sync import BOOTSTRAP_SCRIPT, CREATE_SCRIPT, SQL_SCRIPT, check, run_script
+from bench.import_receipts import write_csv
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+TAIWAN = timezone(timedelta(hours=8))  # restore-database --to is Taiwan time
+FLASK = [sys.executable, '-m', 'flask', '--app', 'run:app']
+BACKUP_STEP_PAGES = 256  # Config.BACKUP_STEP_PAGES
+
+# Issue receipts for a fixed time, or while a backup runs in another thread; print the latencies
+WRITE_SCRIPT = '''
+import json, sys, threading, time
+from run import app
+from app import db
+from app.models import FeeItem, User
+from app.services.backup_service import backup_snapshot
+from app.services.receipt_service import ReceiptService
+with app.app_context():
+    item = FeeItem.query.filter_by(is_active=True).first()
+    operator = User.query.first()
+    ReceiptService.create_receipt(item.id, item.default_price, operator)  # Warm up
+    pages, result = int(sys.argv[1]), {}
+    arguments = (db.engine.url.database, app.config['BACKUP_DIR'])
+    options = {'pages': pages, 'sleep': app.config['BACKUP_STEP_SLEEP'], 'keep': 0}
+    backup = threading.Thread(target=lambda: result.update(backup_snapshot(*arguments, **options)[1]))
+    if pages:
+        backup.start()
+    deadline = time.monotonic() + float(sys.argv[2])
+    timings = []
+    while backup.is_alive() if pages else time.monotonic() < deadline:
+        start = time.perf_counter()
+        ReceiptService.create_receipt(item.id, item.default_price, operator)
+        timings.append(time.perf_counter() - start)
+        time.sleep(0.005)
+    backup.join() if pages else None
+print(json.dumps({'timings': timings, 'backup': result}))
+'''
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+def latency_phases(env, seconds):
+    phases = [('no backup', 0), ('stepwise backup', BACKUP_STEP_PAGES),
+              ('one-step backup', -1)]
+    results = []
+    for name, pages in phases:
+        result = run_script(WRITE_SCRIPT, env, str(pages), str(seconds))
+        results.append((name, result['timings'], result['backup']))
+    return results
+
+
+def count_receipts(env):
+    return run_script(SQL_SCRIPT, env, 'SELECT COUNT(*) FROM receipts')[0][0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='SQLite backup benchmark')
+    parser.add_argument('--rows', type=int, default=200000, help='Historical receipts loaded first')
+    parser.add_argument('--profiles', default='wal,default')
+    parser.add_argument('--seconds', type=float, default=3, help='Length of the no-backup phase')
+    args = parser.parse_args(argv)
+
+    failures = []
+    tmp_dir = tempfile.mkdtemp(prefix='swim-backup-')
+    try:
+        source = os.path.join(tmp_dir, 'legacy.csv')
+        write_csv(source, args.rows)
+        template = os.path.join(tmp_dir, 'template.db')
+        base = dict(os.environ, FLASK_ENV='production', PYTHONPATH=ROOT_DIR)
+        env = dict(base, DATABASE_URL='sqlite:///' + template)
+        run_script(BOOTSTRAP_SCRIPT, env)
+        subprocess.run(FLASK + ['import-receipts', source], cwd=ROOT_DIR, env=env, check=True,
+                       capture_output=True)
+        run_script(SQL_SCRIPT, env, 'PRAGMA wal_checkpoint(TRUNCATE)')
+        print(f'database: {args.rows:,} historical receipts, '
+              f'{os.path.getsize(template) / 1048576:.1f} MB')
+
+        print(f"\n{'profile':<9}{'phase':<18}{'writes':>8}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+        print('-' * 62)
+        for profile in args.profiles.split(','):
+            profile = profile.strip()
+            path = os.path.join(tmp_dir, f'{profile}.db')
+            shutil.copyfile(template, path)
+            if profile == 'default':
+                # The journal mode is stored in the file: back to the rollback journal
+                connection = sqlite3.connect(path)
+                connection.execute('PRAGMA journal_mode=DELETE')
+                connection.close()
+            env = dict(base, DATABASE_URL='sqlite:///' + path, SQLITE_PROFILE=profile,
+                       BACKUP_DIR=os.path.join(tmp_dir, f'backups-{profile}'))
+            for name, timings, backup in latency_phases(env, args.seconds):
+                print(f'{profile:<9}{name:<18}{len(timings):>8}'
+                      f'{percentile(timings, 0.5) * 1000:>9.1f}{percentile(timings, 0.99) * 1000:>9.1f}'
+                      f'{max(timings, default=0) * 1000:>9.1f}')
+                if backup:
+                    print(f"{'':<11}{backup['pages']:,} pages in {backup['steps']} step(s), "
+                          f"{backup['restarts']} restart(s), {backup['seconds']:.2f}s")
+
+        print('\nWAL shipping and point-in-time restore (SQLITE_PROFILE=wal)')
+        path = os.path.join(tmp_dir, 'wal.db')
+        backup_dir = os.path.join(tmp_dir, 'backups-ship')
+        env = dict(base, DATABASE_URL='sqlite:///' + path, SQLITE_PROFILE='wal',
+                   BACKUP_DIR=backup_dir, WAL_SHIP_INTERVAL='1')
+        shipper = subprocess.Popen(FLASK + ['wal-ship'], cwd=ROOT_DIR, env=env,
+                                   stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        try:
+            shipper.stdout.readline()  # Base copy written
+            counts, marks = [], []
+            for batch in range(3):
+                run_script(CREATE_SCRIPT, env, '50')
+                counts.append(count_receipts(env))
+                time.sleep(2)  # Shipped
+                marks.append(f'{datetime.now(TAIWAN):%Y-%m-%d %H:%M:%S}')
+                time.sleep(1.1)  # Next batch lands in a later second
+        finally:
+            shipper.send_signal(signal.SIGINT)
+            shipper.wait(timeout=30)
+
+        for label, target, expected in (('after batch 2', marks[1], counts[1]),
+                                        ('latest', None, counts[2])):
+            output_path = os.path.join(tmp_dir, f'restored-{len(label)}.db')
+            command = FLASK + ['restore-database', output_path] + (['--to', target] if target else [])
+            result = subprocess.run(command, cwd=ROOT_DIR, env=env, capture_output=True, text=True)
+            restored = run_script(SQL_SCRIPT, dict(env, DATABASE_URL='sqlite:///' + output_path),
+                                  'SELECT COUNT(*) FROM receipts')[0][0] \
+                if result.returncode == 0 else None
+            check(restored == expected, f'restore {label}: {restored} receipts (expected {expected})',
+                  failures)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    print('PASS' if not failures else f'{len(failures)} check(s) failed')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,175 @@
+"""
+Offline Counter Benchmark - Counter mode against a central database
+
+Runs the whole counter flow with two local SQLite databases (central and
+counter), each step in a fresh interpreter with its own environment:
+
+    1. bootstrap the central database and issue receipts there
+    2. bootstrap the counter and run its first sync (reference data, blocks)
+    3. issue receipts at the counter with the central database unreachable
+       and report the create latency
+    4. sync, then mark everything pending again and sync once more
+       (idempotent: no duplicates on the central side)
+    5. plant a different receipt on the central side under the counter's
+       next number and check that it is reported as a conflict
+    6. check that every receipt number on the central side is unique and
+       appears exactly once in the change feed
+
+Usage:
+    python -m bench.counter_sync
+    python -m bench.counter_sync --receipts 500 --block-size 200
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+BOOTSTRAP_SCRIPT = '''
+from run import app
+from app.commands import bootstrap_database
+with app.app_context():
+    bootstrap_database()
+print('{}')
+'''
+
+# Issue receipts and print their numbers and per-receipt latency
+CREATE_SCRIPT = '''
+import json, sys, time
+from run import app
+from app.models import FeeItem, User
+from app.services.receipt_service import ReceiptService
+with app.app_context():
+    item = FeeItem.query.filter_by(is_active=True).first()
+    operator = User.query.first()
+    numbers, timings = [], []
+    for _ in range(int(sys.argv[1])):
+        start = time.perf_counter()
+        numbers.append(ReceiptService.create_receipt(item.id, item.default_price, operator).receipt_no)
+        timings.append(time.perf_counter() - start)
+print(json.dumps({'numbers': numbers, 'timings': timings}))
+'''
+
+SYNC_SCRIPT = '''
+import json
+from run import app
+from app.services.counter_sync_service import CounterSyncService
+with app.app_context():
+    print(json.dumps(CounterSyncService.from_app(app).sync_once()))
+'''
+
+SQL_SCRIPT = '''
+import json, sys
+from sqlalchemy import text
+from run import app
+from app import db
+with app.app_context():
+    result = db.session.execute(text(sys.argv[1]))
+    rows = [list(row) for row in result] if result.returns_rows else []
+    db.session.commit()
+print(json.dumps(rows, default=str))
+'''
+
+
+def run_script(script, env, *args):
+    """Run a Python snippet in a fresh interpreter and return its JSON output"""
+    result = subprocess.run([sys.executable, '-c', script, *args], cwd=ROOT_DIR, env=env,
+                            check=True, capture_output=True, text=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def make_envs(tmp_dir, block_size):
+    central_url = 'sqlite:///' + os.path.join(tmp_dir, 'central.db')
+    base = dict(os.environ, FLASK_ENV='production', PYTHONPATH=ROOT_DIR)
+    central = dict(base, DATABASE_URL=central_url)
+    counter = dict(base, DATABASE_URL='sqlite:///' + os.path.join(tmp_dir, 'counter.db'),
+                   COUNTER_MODE='1', COUNTER_ID='bench-counter',
+                   COUNTER_CENTRAL_DATABASE_URL=central_url,
+                   COUNTER_BLOCK_SIZE=str(block_size))
+    # The offline phase must not touch the central database at all
+    offline = dict(counter, COUNTER_CENTRAL_DATABASE_URL='sqlite:////nonexistent/central.db')
+    return central, counter, offline
+
+
+def check(condition, message, failures):
+    print(f"  {'ok  ' if condition else 'FAIL'} {message}")
+    if not condition:
+        failures.append(message)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Offline counter benchmark')
+    parser.add_argument('--receipts', type=int, default=100,
+                        help='Receipts issued offline at the counter')
+    parser.add_argument('--block-size', type=int, default=200)
+    args = parser.parse_args(argv)
+
+    failures = []
+    tmp_dir = tempfile.mkdtemp(prefix='swim-counter-')
+    try:
+        central, counter, offline = make_envs(tmp_dir, args.block_size)
+
+        print('central: bootstrap and 5 receipts')
+        run_script(BOOTSTRAP_SCRIPT, central)
+        run_script(CREATE_SCRIPT, central, '5')
+
+        print('counter: bootstrap and first sync')
+        run_script(BOOTSTRAP_SCRIPT, counter)
+        stats = run_script(SYNC_SCRIPT, counter)
+        check(stats['reference'] > 0 and stats['blocks'] > 0,
+              f"pulled {stats['reference']} reference rows, {stats['blocks']} block(s)", failures)
+
+        print(f'counter: {args.receipts} receipts offline')
+        created = run_script(CREATE_SCRIPT, offline, str(args.receipts))
+        timings = sorted(created['timings'])
+        print(f'  create latency: median {statistics.median(timings) * 1000:.1f} ms, '
+              f'p95 {timings[int(len(timings) * 0.95) - 1] * 1000:.1f} ms')
+
+        print('counter: sync and idempotent re-sync')
+        stats = run_script(SYNC_SCRIPT, counter)
+        check(stats['synced'] == args.receipts and not stats['conflicts'],
+              f"synced {stats['synced']} receipt(s)", failures)
+        run_script(SQL_SCRIPT, counter, "UPDATE counter_outbox SET status = 'pending'")
+        stats = run_script(SYNC_SCRIPT, counter)
+        count = run_script(SQL_SCRIPT, central, 'SELECT COUNT(*) FROM receipts')[0][0]
+        check(stats['synced'] == args.receipts and count == 5 + args.receipts,
+              f're-sync confirmed {stats["synced"]}, central has {count} receipt(s)', failures)
+
+        print('conflict: central receipt planted under the counter\'s next number')
+        central_created = run_script(CREATE_SCRIPT, central, '1')['numbers'][0]
+        next_no = run_script(SQL_SCRIPT, counter, (
+            "SELECT prefix || '-' || day || '-' || substr('0000' || next_seq, -4) "
+            "FROM receipt_number_blocks WHERE next_seq <= end_seq ORDER BY day, start_seq LIMIT 1"
+        ))[0][0]
+        run_script(SQL_SCRIPT, central, (
+            f"UPDATE receipts SET receipt_no = '{next_no}' WHERE receipt_no = '{central_created}'"
+        ))
+        run_script(CREATE_SCRIPT, offline, '1')
+        stats = run_script(SYNC_SCRIPT, counter)
+        check(stats['conflicts'] == 1, f'{next_no} reported as conflict', failures)
+
+        duplicates = run_script(SQL_SCRIPT, central, (
+            'SELECT receipt_no, COUNT(*) FROM receipts GROUP BY receipt_no HAVING COUNT(*) > 1'
+        ))
+        check(not duplicates, 'central receipt numbers are unique', failures)
+
+        # Each central receipt is announced once in the change feed, re-syncs included
+        announced, total = run_script(SQL_SCRIPT, central, (
+            "SELECT (SELECT COUNT(*) FROM receipt_events WHERE event_type = 'created'), "
+            "(SELECT COUNT(*) FROM receipts)"
+        ))[0]
+        check(announced == total, f'{announced} created event(s) for {total} receipt(s)', failures)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    print('PASS' if not failures else f'{len(failures)} check(s) failed')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
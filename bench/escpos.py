@@ -0,0 +1,165 @@
+"""
+ESC/POS Benchmark - Thermal printer output vs. the HTML print page and PDF
+
+Bootstraps a database, issues receipts, starts a TCP listener standing in
+for a network receipt printer (raw port 9100), then:
+
+    1. times the HTML print page and the ReportLab PDF of a receipt
+    2. times ESC/POS rendering (first receipt renders the site header,
+       later ones reuse the cached header) and printing over TCP and to a
+       file (render + send)
+    3. checks every byte the "printer" received, and that the streams hold
+       the receipt number, the amount in Chinese (Big5), the QR or barcode
+       command and the paper cut, and that another site gets its own header
+       and prints on its own printer (a file) while the default site uses
+       PRINTER_URL (the TCP listener)
+
+Usage:
+    python -m bench.escpos
+    python -m bench.escpos --receipts 500 --font /path/to/NotoSansCJK-Regular.ttc
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+from bench.counter_sync import BOOTSTRAP_SCRIPT, check, run_script
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+PRINT_SCRIPT = '''
+import json, socket, sys, threading, time
+from run import app
+from app import db
+from app.models import FeeItem, Site, User
+from app.services.escpos_service import ENCODING, EscPosService
+from app.services.pdf_service import ReceiptPDFService
+from app.services.receipt_service import ReceiptService
+from app.sites import site_scope
+count, font, output, east_printer = int(sys.argv[1]), sys.argv[2] or None, sys.argv[3], sys.argv[4]
+
+received = bytearray()
+server = socket.create_server(('127.0.0.1', 0))
+def serve():
+    while True:
+        connection, _ = server.accept()
+        with connection:
+            while chunk := connection.recv(65536):
+                received.extend(chunk)
+threading.Thread(target=serve, daemon=True).start()
+
+def timed(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return sorted(timings)[len(timings) // 2]
+
+with app.app_context():
+    operator = User.query.filter_by(username='operator').first()
+    item = FeeItem.query.filter_by(is_active=True).first()
+    receipts = [ReceiptService.create_receipt(item.id, item.default_price, operator,
+                                              remark='bench' if i % 2 else None)
+                for i in range(count)]
+    east = Site(code='EAST', name='\\u6771\\u5340\\u6e38\\u6cf3\\u6c60', receipt_prefix='EAST',
+                printer_url=east_printer)
+    db.session.add(east)
+    db.session.commit()
+    with site_scope(east.id):
+        east_item = FeeItem(item_code=item.item_code, item_name=item.item_name,
+                            default_price=item.default_price)
+        db.session.add(east_item)
+        db.session.commit()
+        east_receipt = ReceiptService.create_receipt(east_item.id, east_item.default_price, operator)
+
+    client = app.test_client()
+    html = timed(lambda: client.get(f'/receipt/{receipts[0].id}/print'), 20)
+    pdf_service = ReceiptPDFService()
+    pdf_service.generate(receipts[0])
+    pdf = timed(lambda: pdf_service.generate(receipts[0]), 10)
+
+    printer = EscPosService(font_path=font)
+    start = time.perf_counter()
+    first = printer.render(receipts[0])
+    cold = time.perf_counter() - start
+    bitmap = b'\\x1dv0' in first
+    warm = timed(lambda: printer.render(receipts[0]), 200)
+
+    app.config['PRINTER_URL'] = 'tcp://127.0.0.1:%d' % server.getsockname()[1]
+    sent = []
+    start = time.perf_counter()
+    for receipt in receipts:
+        printer.print_receipt(receipt)
+        sent.append(printer.render(receipt))
+    tcp = (time.perf_counter() - start) / count
+    file_print = timed(lambda: printer.print_receipt(receipts[0], output), 50)
+    printer.print_receipt(east_receipt)
+    with open(east_printer, 'rb') as f:
+        east_printed = f.read() == printer.render(east_receipt)
+    deadline = time.time() + 5
+    while len(received) < sum(map(len, sent)) and time.time() < deadline:
+        time.sleep(0.01)
+
+    contents = all(stream.startswith(b'\\x1b@') and stream.endswith(b'\\x1dVB\\x03')
+                   and r.receipt_no.encode() in stream
+                   and r.amount_chinese.encode(ENCODING) in stream
+                   and b'1P0' + r.receipt_no.encode() in stream
+                   for r, stream in zip(receipts, sent))
+    barcode = EscPosService(code='barcode', font_path=font).render(receipts[0])
+    east_header = printer.header(east.id)
+    own_header = east_header != printer.header(1) and (
+        bitmap or east.name.encode(ENCODING) in east_header)
+print(json.dumps({'html': html, 'pdf': pdf, 'cold': cold, 'warm': warm, 'tcp': tcp,
+                  'file': file_print, 'bytes': len(first), 'bitmap': bitmap,
+                  'same': bytes(received) == b''.join(sent), 'contents': contents,
+                  'barcode': b'\\x1dk\\x49' in barcode and b'1P0' not in barcode,
+                  'own_header': own_header, 'east_printed': east_printed}))
+'''
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='ESC/POS receipt printing benchmark')
+    parser.add_argument('--receipts', type=int, default=200, help='Receipts printed over TCP')
+    parser.add_argument('--font', default='', help='Chinese font for the header bitmap')
+    args = parser.parse_args(argv)
+
+    failures = []
+    tmp_dir = tempfile.mkdtemp(prefix='swim-escpos-')
+    try:
+        env = dict(os.environ, FLASK_ENV='production', PYTHONPATH=ROOT_DIR,
+                   DATABASE_URL='sqlite:///' + os.path.join(tmp_dir, 'escpos.db'),
+                   KPI_COUNTERS_PATH=os.path.join(tmp_dir, 'kpi.bin'))
+        run_script(BOOTSTRAP_SCRIPT, env)
+        result = run_script(PRINT_SCRIPT, env, str(args.receipts), args.font,
+                            os.path.join(tmp_dir, 'printer.bin'), os.path.join(tmp_dir, 'east.bin'))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    header = 'bitmap' if result['bitmap'] else "text (printer font; no Pillow or Chinese font)"
+    print(f"header: {header}, {result['bytes']:,} bytes per receipt\n")
+    print(f"{'output':<34}{'ms':>10}")
+    print('-' * 44)
+    for name, key in (('HTML print page', 'html'), ('PDF (ReportLab)', 'pdf'),
+                      ('ESC/POS render, header uncached', 'cold'), ('ESC/POS render', 'warm'),
+                      ('ESC/POS print over TCP', 'tcp'), ('ESC/POS print to file', 'file')):
+        print(f'{name:<34}{result[key] * 1000:>10.3f}')
+    print()
+
+    check(result['same'], f'printer received every byte of {args.receipts} receipts', failures)
+    check(result['contents'], 'streams hold receipt number, Chinese amount, QR code and cut',
+          failures)
+    check(result['barcode'], 'barcode mode prints CODE128 instead of QR', failures)
+    check(result['own_header'], "second site's receipts carry its own header", failures)
+    check(result['east_printed'] and result['same'],
+          "second site's receipt went to its own printer only", failures)
+    check(result['tcp'] < result['pdf'], 'printing over TCP is faster than building the PDF',
+          failures)
+
+    print('PASS' if not failures else f'{len(failures)} check(s) failed')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,144 @@
+"""
+Historical Import Benchmark - flask import-receipts against a fresh database
+
+Generates a CSV of historical receipts (with a few invalid rows: unknown
+item codes, malformed amounts and amounts too large for the column; blank
+lines and repeated receipt numbers), then:
+
+    1. issues receipts one by one through ReceiptService for comparison
+    2. starts the import, kills it after the first chunks and resumes it
+    3. runs the import again (everything is a duplicate)
+    4. checks row counts, the rejects file and the change feed events
+
+Usage:
+    python -m bench.import_receipts
+    python -m bench.import_receipts --rows 200000 --chunk-size 10000
+    DATABASE_URL=postgresql://... python -m bench.import_receipts   # COPY path
+"""
+import argparse
+import csv
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+from bench.counter_sync import BOOTSTRAP_SCRIPT, CREATE_SCRIPT, SQL_SCRIPT, check, run_script
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Fee items and users created by bootstrap (init_default_data)
+ITEMS = {'ADM-STU': 50, 'ADM-STAFF': 80, 'ADM-EXT': 150, 'LOCKER-FEE': 50}
+OPERATORS = ['operator', 'supervisor', 'admin']
+
+# Defects of the invalid rows, in turn: (column, value)
+INVALID_VALUES = [(2, 'NO-SUCH-ITEM'), (3, '1e30'), (3, '100000000')]
+
+
+def write_csv(path, rows, invalid_every=500, duplicate_every=1000, blank_every=250):
+    """Write the sample file; returns (valid unique rows, invalid rows)"""
+    rng = random.Random(42)
+    start = datetime(2019, 1, 1, 8, 0)
+    valid = invalid = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['receipt_no', 'created_at', 'item_code', 'amount', 'operator',
+                         'remark', 'status'])
+        for i in range(1, rows + 1):
+            created = start + timedelta(minutes=7 * i)
+            code = rng.choice(list(ITEMS))
+            row = [f'LEGACY-{created:%Y%m%d}-{i:06d}', created.strftime('%Y/%m/%d %H:%M'),
+                   code, ITEMS[code], rng.choice(OPERATORS), '', 'active']
+            if i % invalid_every == 0:
+                column, value = INVALID_VALUES[invalid % len(INVALID_VALUES)]
+                row[column] = value
+                invalid += 1
+            elif i % duplicate_every == 1 and i > 1:
+                row[0] = f'LEGACY-{start:%Y%m%d}-{1:06d}'  # Same number as the first row
+            else:
+                valid += 1
+            writer.writerow(row)
+            if i % blank_every == 0:
+                writer.writerow([])  # Skipped, not counted as a row
+    return valid, invalid
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Historical import benchmark')
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--baseline', type=int, default=300,
+                        help='Receipts issued one by one for comparison')
+    args = parser.parse_args(argv)
+
+    failures = []
+    tmp_dir = tempfile.mkdtemp(prefix='swim-import-')
+    try:
+        env = dict(os.environ, FLASK_ENV='production', PYTHONPATH=ROOT_DIR)
+        env.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tmp_dir, 'import.db'))
+        run_script(BOOTSTRAP_SCRIPT, env)
+
+        source = os.path.join(tmp_dir, 'legacy.csv')
+        valid, invalid = write_csv(source, args.rows)
+        print(f'sample: {args.rows:,} rows ({valid:,} valid, {invalid:,} invalid, '
+              f'{args.rows - valid - invalid:,} repeated numbers)')
+
+        created = run_script(CREATE_SCRIPT, env, str(args.baseline))
+        per_receipt = sum(created['timings']) / len(created['timings'])
+        print(f'baseline: ReceiptService.create_receipt {1 / per_receipt:,.0f} receipts/s')
+
+        command = [sys.executable, '-m', 'flask', '--app', 'run:app', 'import-receipts', source,
+                   '--chunk-size', str(args.chunk_size)]
+
+        print('import: killed after the first chunks, then resumed')
+        process = subprocess.Popen(command, cwd=ROOT_DIR, env=env, stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT, text=True)
+        chunks = 0
+        for line in process.stdout:
+            if 'rows/s' in line:
+                chunks += 1
+                if chunks == 2:
+                    process.kill()
+                    break
+        process.wait()
+
+        output = subprocess.run(command, cwd=ROOT_DIR, env=env, check=True,
+                                capture_output=True, text=True).stdout
+        print('  ' + next(line for line in output.splitlines() if line.startswith('Done')))
+        check('Resuming after row' in output or chunks < 2, 'second run resumed from the checkpoint',
+              failures)
+
+        count_sql = "SELECT COUNT(*) FROM receipts WHERE receipt_no LIKE 'LEGACY-%'"
+        imported = run_script(SQL_SCRIPT, env, count_sql)[0][0]
+        check(imported == valid, f'{imported:,} receipts imported (expected {valid:,})', failures)
+
+        with open(source + '.rejects.csv', newline='', encoding='utf-8-sig') as f:
+            reasons = [row[1] for row in list(csv.reader(f))[1:]]
+        rejected = len(reasons)
+        check(rejected == invalid, f'{rejected:,} rows in the rejects file', failures)
+        bad_amounts = sum(reason.startswith('Invalid amount') for reason in reasons)
+        expected = sum(INVALID_VALUES[k % len(INVALID_VALUES)][0] == 3 for k in range(invalid))
+        check(bad_amounts == expected,
+              f'{bad_amounts:,} malformed or oversized amounts rejected', failures)
+
+        events = run_script(SQL_SCRIPT, env, (
+            "SELECT COUNT(*), COUNT(DISTINCT receipt_id) FROM receipt_events WHERE detail = 'import'"
+        ))[0]
+        check(events[0] == events[1] == valid, f'{events[0]:,} import events, one per receipt',
+              failures)
+
+        output = subprocess.run(command, cwd=ROOT_DIR, env=env, check=True,
+                                capture_output=True, text=True).stdout
+        again = run_script(SQL_SCRIPT, env, count_sql)[0][0]
+        check(again == valid and '0 imported' in output, 'repeated import adds nothing', failures)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    print('PASS' if not failures else f'{len(failures)} check(s) failed')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,438 @@
+"""
+Counter Traffic Load Test - Simulate counter staff against a local gunicorn
+
+Usage:
+    python -m bench.loadtest --duration 60 --workers 2
+    python -m bench.loadtest --users operator=8,supervisor=1,cashier=1 \\
+        --rate operator=4,supervisor=0.2,cashier=0.1
+    python -m bench.loadtest --database-url postgresql://localhost/swim_bench
+
+Simulated roles:
+    operator    create receipt -> print page -> download PDF
+    supervisor  request void on a recent receipt -> open void queue -> approve
+    cashier     open verification page -> batch verify -> queue monthly Excel
+                export -> poll the job -> download
+    reporter    open daily report -> monthly report (off by default)
+
+Only the standard library is used on the client side, so the harness runs
+anywhere the application itself runs.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import date
+from urllib.parse import urlencode, urlsplit
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+DEFAULT_USERS = {'operator': 6, 'supervisor': 1, 'cashier': 1, 'reporter': 0}
+DEFAULT_RATE = {'operator': 3.0, 'supervisor': 0.2, 'cashier': 0.1, 'reporter': 0.5}
+
+# Fee item ids created by init_default_data (admission and passes)
+FEE_ITEM_IDS = [1, 2, 3, 4, 5, 6, 7]
+
+RECEIPT_NO_RE = re.compile(r'<title>[^<]*-\s*([A-Z]+-\d{8}-\d+)\s*</title>')
+PRINT_URL_RE = re.compile(r'/receipt/(\d+)/print')
+REVIEW_URL_RE = re.compile(r'/void/review/(\d+)')
+JOB_URL_RE = re.compile(r'/jobs/(\d+)')
+RECEIPT_ID_RE = re.compile(r'name="receipt_ids" value="(\d+)"')
+
+
+class Recorder:
+    """Thread-safe collector for request latencies and errors"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.receipt_nos = []
+        self.created_ids = []
+
+    def record(self, action, seconds, ok):
+        with self._lock:
+            self.latencies[action].append(seconds)
+            if not ok:
+                self.errors[action] += 1
+
+    def add_receipt(self, receipt_id, receipt_no):
+        with self._lock:
+            self.created_ids.append(receipt_id)
+            if receipt_no:
+                self.receipt_nos.append(receipt_no)
+
+    def take_receipt(self):
+        """Pop a recently created receipt for the void flow"""
+        with self._lock:
+            if not self.created_ids:
+                return None
+            return self.created_ids.pop()
+
+    @property
+    def duplicate_count(self):
+        return len(self.receipt_nos) - len(set(self.receipt_nos))
+
+
+class Client:
+    """Minimal HTTP client; one connection per request, no redirects"""
+
+    def __init__(self, base_url, recorder, timeout=60):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.recorder = recorder
+        self.timeout = timeout
+
+    def request(self, action, method, path, form=None):
+        """Send a request and record its latency; return (status, headers, body)"""
+        body = urlencode(form, doseq=True) if form is not None else None
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'} if body else {}
+
+        start = time.perf_counter()
+        try:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                resp = conn.getresponse()
+                data = resp.read()
+                status, resp_headers = resp.status, dict(resp.getheaders())
+            finally:
+                conn.close()
+        except (OSError, http.client.HTTPException):
+            self.recorder.record(action, time.perf_counter() - start, False)
+            return None, {}, b''
+
+        self.recorder.record(action, time.perf_counter() - start, status < 400)
+        return status, resp_headers, data
+
+
+def operator_session(client, recorder):
+    """Create a receipt, open the print page, download the PDF"""
+    status, headers, _ = client.request('create_receipt', 'POST', '/receipt/create', {
+        'item_id': random.choice(FEE_ITEM_IDS),
+        'amount': random.choice([50, 80, 150, 800]),
+        'remark': 'loadtest',
+    })
+    match = PRINT_URL_RE.search(headers.get('Location', '')) if status == 302 else None
+    if not match:
+        return
+    receipt_id = int(match.group(1))
+
+    _, _, body = client.request('print_receipt', 'GET', f'/receipt/{receipt_id}/print')
+    no_match = RECEIPT_NO_RE.search(body.decode('utf-8', 'replace'))
+    recorder.add_receipt(receipt_id, no_match.group(1) if no_match else None)
+
+    client.request('download_pdf', 'GET', f'/receipt/{receipt_id}/pdf')
+
+
+def supervisor_session(client, recorder):
+    """Request a void for a recent receipt, then work the approval queue"""
+    receipt_id = recorder.take_receipt()
+    if receipt_id is not None:
+        client.request('request_void', 'POST', f'/void/request/{receipt_id}', {
+            'reason': 'loadtest void',
+        })
+
+    status, _, body = client.request('void_queue', 'GET', '/void/')
+    if status != 200:
+        return
+    request_ids = REVIEW_URL_RE.findall(body.decode('utf-8', 'replace'))
+    if request_ids:
+        client.request('approve_void', 'POST', f'/void/review/{random.choice(request_ids)}', {
+            'action': 'approve',
+            'note': 'loadtest',
+        })
+
+
+def cashier_session(client, recorder, operator_id=1):
+    """Verify a batch of receipts and export the current month"""
+    client.request('verify_index', 'GET', '/verify/')
+
+    status, _, body = client.request('operator_detail', 'GET', f'/verify/operator/{operator_id}')
+    if status == 200:
+        receipt_ids = RECEIPT_ID_RE.findall(body.decode('utf-8', 'replace'))[:50]
+        if receipt_ids:
+            client.request('verify_batch', 'POST', '/verify/batch', {'receipt_ids': receipt_ids})
+
+    today = date.today()
+    status, headers, _ = client.request(
+        'export_excel', 'GET', f'/report/export/excel?year={today.year}&month={today.month}')
+    match = JOB_URL_RE.search(headers.get('Location', '')) if status == 302 else None
+    if not match:
+        return
+
+    # Poll the background job, then download the file
+    job_id = match.group(1)
+    start = time.perf_counter()
+    job_status = None
+    while time.perf_counter() - start < 120:
+        status, _, body = client.request('job_status', 'GET', f'/jobs/{job_id}/status')
+        if status != 200:
+            break
+        job_status = json.loads(body).get('status')
+        if job_status in ('done', 'failed'):
+            break
+        time.sleep(0.5)
+    recorder.record('export_wait', time.perf_counter() - start, job_status == 'done')
+    if job_status == 'done':
+        client.request('export_download', 'GET', f'/jobs/{job_id}/download')
+
+
+def reporter_session(client, recorder):
+    """Open today's daily report and the current monthly report"""
+    today = date.today()
+    client.request('daily_report', 'GET', f'/report/daily?date={today.isoformat()}')
+    client.request('monthly_report', 'GET',
+                   f'/report/monthly?year={today.year}&month={today.month}')
+
+
+SESSIONS = {
+    'operator': operator_session,
+    'supervisor': supervisor_session,
+    'cashier': cashier_session,
+    'reporter': reporter_session,
+}
+
+
+def run_user(role, rate, client, recorder, deadline):
+    """Start sessions with exponential inter-arrival times until the deadline"""
+    session = SESSIONS[role]
+    while True:
+        wait = random.expovariate(rate) if rate > 0 else 1.0
+        if time.monotonic() + wait >= deadline:
+            break
+        time.sleep(wait)
+        start = time.perf_counter()
+        session(client, recorder)
+        recorder.record(f'{role}_session', time.perf_counter() - start, True)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, int(round(pct / 100.0 * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+def summarize(recorder, elapsed):
+    """Build a JSON-serializable summary of a run"""
+    actions = {}
+    total_requests = 0
+    total_errors = 0
+    for action, values in sorted(recorder.latencies.items()):
+        values = sorted(values)
+        is_session = action.endswith(('_session', '_wait'))
+        if not is_session:
+            total_requests += len(values)
+            total_errors += recorder.errors[action]
+        actions[action] = {
+            'count': len(values),
+            'errors': recorder.errors[action],
+            'throughput': len(values) / elapsed if elapsed else 0.0,
+            'p50_ms': percentile(values, 50) * 1000,
+            'p90_ms': percentile(values, 90) * 1000,
+            'p95_ms': percentile(values, 95) * 1000,
+            'p99_ms': percentile(values, 99) * 1000,
+            'max_ms': values[-1] * 1000 if values else 0.0,
+        }
+
+    return {
+        'elapsed_s': elapsed,
+        'requests': total_requests,
+        'errors': total_errors,
+        'throughput': total_requests / elapsed if elapsed else 0.0,
+        'receipts_created': len(recorder.receipt_nos),
+        'duplicate_receipt_nos': recorder.duplicate_count,
+        'actions': actions,
+    }
+
+
+def print_summary(summary, out=sys.stdout):
+    """Print a human-readable report"""
+    out.write('\n')
+    out.write(f"{'action':<20}{'count':>8}{'err':>6}{'req/s':>9}"
+              f"{'p50':>9}{'p90':>9}{'p95':>9}{'p99':>9}{'max':>9}\n")
+    out.write('-' * 88 + '\n')
+    for action, s in summary['actions'].items():
+        out.write(f"{action:<20}{s['count']:>8}{s['errors']:>6}{s['throughput']:>9.2f}"
+                  f"{s['p50_ms']:>9.1f}{s['p90_ms']:>9.1f}{s['p95_ms']:>9.1f}"
+                  f"{s['p99_ms']:>9.1f}{s['max_ms']:>9.1f}\n")
+    out.write('-' * 88 + '\n')
+    out.write(f"elapsed {summary['elapsed_s']:.1f}s, {summary['requests']} requests, "
+              f"{summary['throughput']:.2f} req/s, {summary['errors']} errors\n")
+    out.write(f"receipts created {summary['receipts_created']}, "
+              f"duplicate receipt numbers {summary['duplicate_receipt_nos']}\n")
+
+
+def free_port():
+    """Ask the OS for an unused TCP port"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_ready(base_url, timeout=60):
+    """Poll the dashboard until the server answers"""
+    parts = urlsplit(base_url)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=5)
+        try:
+            conn.request('GET', '/dashboard')
+            if conn.getresponse().status == 200:
+                return
+        except (OSError, http.client.HTTPException):
+            pass
+        finally:
+            conn.close()
+        time.sleep(0.2)
+    raise RuntimeError(f'Server at {base_url} did not become ready in {timeout}s')
+
+
+class GunicornServer:
+    """Start `gunicorn run:app` as in the Procfile on a local port"""
+
+    def __init__(self, database_url, workers=2, worker_class='sync', threads=1,
+                 extra_env=None, extra_args=None):
+        self.port = free_port()
+        self.base_url = f'http://127.0.0.1:{self.port}'
+        self.env = dict(os.environ, FLASK_ENV='production', DATABASE_URL=database_url)
+        self.env.update(extra_env or {})
+        self.args = [
+            sys.executable, '-m', 'gunicorn', 'run:app',
+            '--bind', f'127.0.0.1:{self.port}',
+            '--workers', str(workers),
+            '--worker-class', worker_class,
+            '--threads', str(threads),
+            '--log-level', 'warning',
+        ] + list(extra_args or [])
+        self.process = None
+        self.job_worker = None
+
+    def __enter__(self):
+        # One-shot bootstrap, as in the Procfile
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'run:app', 'bootstrap'],
+                       cwd=ROOT_DIR, env=self.env, check=True, stdout=subprocess.DEVNULL)
+        self.process = subprocess.Popen(self.args, cwd=ROOT_DIR, env=self.env)
+        # Background job worker, as the Procfile worker process
+        self.job_worker = subprocess.Popen(
+            [sys.executable, '-m', 'flask', '--app', 'run:app', 'jobs-worker'],
+            cwd=ROOT_DIR, env=self.env, stdout=subprocess.DEVNULL)
+        wait_until_ready(self.base_url)
+        return self
+
+    def __exit__(self, *exc):
+        for process in (self.process, self.job_worker):
+            if process and process.poll() is None:
+                process.terminate()
+                try:
+                    process.wait(timeout=15)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+
+def parse_role_map(text, defaults, cast):
+    """Parse 'operator=4,cashier=1' into a dict merged over defaults"""
+    result = dict(defaults)
+    if not text:
+        return result
+    for part in text.split(','):
+        role, _, value = part.partition('=')
+        role = role.strip()
+        if role not in SESSIONS:
+            raise argparse.ArgumentTypeError(f'Unknown role: {role}')
+        result[role] = cast(value)
+    return result
+
+
+def run_load(base_url, users, rate, duration):
+    """Drive the configured user mix against base_url and return a summary"""
+    recorder = Recorder()
+    client = Client(base_url, recorder)
+    deadline = time.monotonic() + duration
+
+    threads = []
+    for role, count in users.items():
+        for _ in range(count):
+            per_user_rate = rate.get(role, 0) / count if count else 0
+            t = threading.Thread(target=run_user,
+                                 args=(role, per_user_rate, client, recorder, deadline),
+                                 daemon=True)
+            threads.append(t)
+
+    start = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return summarize(recorder, time.monotonic() - start)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Counter traffic load test')
+    parser.add_argument('--target', help='Existing server URL (skip starting gunicorn)')
+    parser.add_argument('--database-url',
+                        help='Database for the started server (default: temporary SQLite file)')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers (default: 2)')
+    parser.add_argument('--worker-class', default='sync', help='gunicorn worker class')
+    parser.add_argument('--threads', type=int, default=1, help='gunicorn threads per worker')
+    parser.add_argument('--duration', type=float, default=30, help='Test length in seconds')
+    parser.add_argument('--users', default='',
+                        help='Concurrent users per role, e.g. operator=6,supervisor=1,cashier=1')
+    parser.add_argument('--rate', default='',
+                        help='Session arrivals per second per role, e.g. operator=3,cashier=0.1')
+    parser.add_argument('--seed', type=int, help='Random seed for reproducible mixes')
+    parser.add_argument('--json', dest='json_path', help='Write summary JSON to this file')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    users = parse_role_map(args.users, DEFAULT_USERS, int)
+    rate = parse_role_map(args.rate, DEFAULT_RATE, float)
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    if args.target:
+        summary = run_load(args.target, users, rate, args.duration)
+    else:
+        tmp_dir = None
+        database_url = args.database_url
+        if not database_url:
+            tmp_dir = tempfile.mkdtemp(prefix='swim-bench-')
+            database_url = 'sqlite:///' + os.path.join(tmp_dir, 'swim.db')
+        try:
+            with GunicornServer(database_url, args.workers, args.worker_class,
+                                args.threads) as server:
+                summary = run_load(server.base_url, users, rate, args.duration)
+        finally:
+            if tmp_dir:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    summary['config'] = {
+        'workers': args.workers,
+        'worker_class': args.worker_class,
+        'threads': args.threads,
+        'users': users,
+        'rate': rate,
+    }
+    print_summary(summary)
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+    return 0 if summary['errors'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,133 @@
+"""
+Sales Cube Benchmark - Heatmap queries from the cube vs. aggregating receipts
+
+Imports historical receipts (flask import-receipts keeps the cube
+current), issues receipts and void requests through ReceiptService, then:
+
+    1. checks the incrementally maintained cube equals a full rebuild
+    2. times flask rebuild-sales-cube
+    3. times heatmaps (month, whole year, one identity type) from the cube
+       against the same GROUP BY over the receipts table
+
+Usage:
+    python -m bench.sales_cube
+    python -m bench.sales_cube --rows 500000
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from bench.counter_sync import BOOTSTRAP_SCRIPT, check, run_script
+from bench.import_receipts import write_csv
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+FLASK = [sys.executable, '-m', 'flask', '--app', 'run:app']
+
+# Receipt writes through the service, then compare the cube with a rebuild
+WRITE_SCRIPT = '''
+import json, sys
+from run import app
+from app import db
+from app.models import FeeItem, SalesCube, User
+from app.services.receipt_service import ReceiptService
+from app.services.sales_cube_service import SalesCubeService
+def cells():
+    return sorted([row.site_id, row.period, row.weekday, row.hour, row.item_id,
+                   row.receipt_count, str(row.amount)] for row in SalesCube.query)
+with app.app_context():
+    operator = User.query.filter_by(username='operator').first()
+    items = FeeItem.query.filter_by(is_active=True).all()
+    receipts = [ReceiptService.create_receipt(item.id, item.default_price, operator)
+                for _ in range(int(sys.argv[1])) for item in items]
+    for i, receipt in enumerate(receipts[::3]):
+        request = ReceiptService.request_void(receipt.id, 'bench', operator)
+        if i % 2:
+            ReceiptService.reject_void(request.id, operator)
+    incremental = cells()
+    SalesCubeService.rebuild()
+    db.session.expire_all()
+    rebuilt = cells()
+print(json.dumps({'issued': len(receipts), 'same': incremental == rebuilt,
+                  'cells': len(rebuilt), 'differences': len(set(map(tuple, incremental)) ^ set(map(tuple, rebuilt)))}))
+'''
+
+# Heatmap timings: cube vs. GROUP BY over receipts
+QUERY_SCRIPT = '''
+import json, time
+from run import app
+from app import db
+from app.models import FeeItem, Receipt
+from app.services.sales_cube_service import SalesCubeService, _buckets
+from app.services.archive_service import month_bounds
+def best(function, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+def direct(start, end, identity=None):
+    period, weekday, hour = _buckets(Receipt.created_at)
+    query = db.session.query(weekday, hour, db.func.count(Receipt.id), db.func.sum(Receipt.amount)) \\
+        .filter(Receipt.status == Receipt.STATUS_ACTIVE, Receipt.created_at >= start, Receipt.created_at < end)
+    if identity:
+        query = query.join(FeeItem, FeeItem.id == Receipt.item_id).filter(FeeItem.identity_type == identity)
+    return sum(row[2] for row in query.group_by(weekday, hour))
+with app.app_context():
+    identity = FeeItem.IDENTITY_STUDENT
+    slices = [('2019-02', (2019, 2, None), month_bounds(2019, 2)),
+              ('2019', (2019, None, None), (month_bounds(2019, 1)[0], month_bounds(2019, 12)[1])),
+              ('2019 student', (2019, None, identity), (month_bounds(2019, 1)[0], month_bounds(2019, 12)[1]))]
+    results = []
+    for name, (year, month, identity_type), (start, end) in slices:
+        cube_time, cube = best(lambda: SalesCubeService.heatmap(year, month, identity_type=identity_type))
+        direct_time, count = best(lambda: direct(start, end, identity_type), repeat=2)
+        results.append([name, cube_time, direct_time, cube['total'][0], count])
+print(json.dumps(results))
+'''
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Sales cube benchmark')
+    parser.add_argument('--rows', type=int, default=200000, help='Historical receipts imported')
+    parser.add_argument('--receipts', type=int, default=20, help='Receipts issued per fee item')
+    args = parser.parse_args(argv)
+
+    failures = []
+    tmp_dir = tempfile.mkdtemp(prefix='swim-cube-')
+    try:
+        env = dict(os.environ, FLASK_ENV='production', PYTHONPATH=ROOT_DIR,
+                   DATABASE_URL='sqlite:///' + os.path.join(tmp_dir, 'cube.db'),
+                   KPI_COUNTERS_PATH=os.path.join(tmp_dir, 'kpi.bin'))
+        run_script(BOOTSTRAP_SCRIPT, env)
+        source = os.path.join(tmp_dir, 'legacy.csv')
+        valid, _ = write_csv(source, args.rows)
+        subprocess.run(FLASK + ['import-receipts', source], cwd=ROOT_DIR, env=env, check=True,
+                       capture_output=True)
+        print(f'database: {valid:,} historical receipts')
+
+        result = run_script(WRITE_SCRIPT, env, str(args.receipts))
+        check(result['same'], f"cube after import + {result['issued']} receipts and voids equals "
+              f"a rebuild ({result['cells']:,} cells, {result['differences']} differing)", failures)
+
+        output = subprocess.run(FLASK + ['rebuild-sales-cube'], cwd=ROOT_DIR, env=env, check=True,
+                                capture_output=True, text=True).stdout.strip()
+        print(f'rebuild: {output}')
+
+        print(f"\n{'slice':<14}{'cube ms':>10}{'receipts ms':>13}{'receipts':>10}")
+        print('-' * 47)
+        for name, cube_time, direct_time, cube_count, direct_count in run_script(QUERY_SCRIPT, env):
+            print(f'{name:<14}{cube_time * 1000:>10.2f}{direct_time * 1000:>13.1f}{cube_count:>10,}')
+            check(cube_count == direct_count, f'{name}: cube total matches the receipts', failures)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    print('PASS' if not failures else f'{len(failures)} check(s) failed')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
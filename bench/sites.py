@@ -0,0 +1,192 @@
+"""
+Multi-Site Benchmark - Two pools in one database
+
+Bootstraps a database, adds a second site (EAST) with its own staff and
+catalog (same item codes as the default site), imports the same history
+into both sites, then for each site in turn:
+
+    1. issues receipts through ReceiptService and checks they are numbered
+       in the site's own sequence (SWIM-..., EAST-... both from 0001)
+    2. checks that the site sees only its rows (counts, other site's fee
+       item, monthly report totals)
+    3. runs the daily and monthly reports, EXPLAINs every statement they
+       sent for receipts and checks each one is served by a site-leading
+       index narrowed on created_at (no scan over the other site's rows or
+       the site's whole history)
+
+Usage:
+    python -m bench.sites
+    python -m bench.sites --rows 100000 --receipts 50
+"""
+import argparse
+import csv
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from bench.counter_sync import BOOTSTRAP_SCRIPT, SQL_SCRIPT, check, run_script
+from bench.import_receipts import OPERATORS, write_csv
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+FLASK = [sys.executable, '-m', 'flask', '--app', 'run:app']
+
+# Second site with a copy of the default site's staff and catalog
+SETUP_SCRIPT = '''
+import json
+from run import app
+from app import db
+from app.models import FeeItem, Site, User
+from app.sites import site_scope
+with app.app_context():
+    site = Site(code='EAST', name='East pool', receipt_prefix='EAST')
+    db.session.add(site)
+    db.session.commit()
+    site_id = site.id
+    with site_scope(1):
+        users = [(u.username, u.full_name, u.role) for u in User.query.all()]
+        items = [(i.item_code, i.item_name, i.default_price) for i in FeeItem.query.all()]
+    with site_scope(site_id):
+        for username, full_name, role in users:
+            user = User(username='east-' + username, full_name=full_name, role=role)
+            user.set_password('east-' + username)
+            db.session.add(user)
+        for code, name, price in items:
+            db.session.add(FeeItem(item_code=code, item_name=name, default_price=price))
+        db.session.commit()
+print(json.dumps(site_id))
+'''
+
+# Issue receipts and run reports for one site; EXPLAIN the receipt statements
+SITE_SCRIPT = '''
+import json, sys, time
+from datetime import date
+from sqlalchemy import event
+from run import app
+from app import db
+from app.models import FeeItem, Receipt, User
+from app.services.receipt_service import ReceiptService
+from app.services.report_service import ReportService
+from app.sites import site_scope
+site_id, username, count = int(sys.argv[1]), sys.argv[2], int(sys.argv[3])
+statements = []
+with app.app_context(), site_scope(site_id):
+    operator = User.query.filter_by(username=username).first()
+    item = FeeItem.query.filter_by(item_code='ADM-STU').first()
+    numbers = [ReceiptService.create_receipt(item.id, item.default_price, operator).receipt_no
+               for _ in range(count)]
+    foreign = FeeItem.query.execution_options(all_sites=True).filter(
+        FeeItem.item_code == 'ADM-STU', FeeItem.site_id != site_id).first()
+    try:
+        ReceiptService.create_receipt(foreign.id, 1, operator)
+        foreign_rejected = False
+    except ValueError:
+        db.session.rollback()
+        foreign_rejected = True
+    visible = Receipt.query.count()
+    sites_seen = sorted({s for (s,) in db.session.query(Receipt.site_id).distinct()})
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if 'FROM receipts' in statement:
+            statements.append((statement, parameters))
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    timings = {}
+    start = time.perf_counter()
+    ReportService.get_daily_summary(date(2019, 2, 15))
+    daily_count = sum(1 for _ in ReportService.iter_daily_receipts(date(2019, 2, 15)))
+    timings['daily'] = time.perf_counter() - start
+    start = time.perf_counter()
+    monthly = ReportService.get_cached_monthly_summary(2019, 2)
+    timings['monthly'] = time.perf_counter() - start
+    event.remove(db.engine, 'before_cursor_execute', capture)
+    plans = []
+    with db.engine.connect() as connection:
+        for statement, parameters in statements:
+            rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)
+            plans.append([row[-1] for row in rows])
+print(json.dumps({'numbers': numbers, 'foreign_rejected': foreign_rejected, 'visible': visible,
+                  'sites_seen': sites_seen, 'daily_count': daily_count,
+                  'monthly_count': monthly['summary']['total_count'],
+                  'plans': plans, 'timings': timings}))
+'''
+
+
+def site_csv(source, path, prefix):
+    """Copy of the sample file for another site's operators and numbers"""
+    with open(source, newline='', encoding='utf-8') as f, \
+            open(path, 'w', newline='', encoding='utf-8') as out:
+        reader, writer = csv.reader(f), csv.writer(out)
+        writer.writerow(next(reader))
+        for row in reader:
+            if not row:
+                writer.writerow(row)
+                continue
+            row[0] = row[0].replace('LEGACY-', f'{prefix}OLD-')
+            row[4] = f'{prefix.lower()}-{row[4]}'
+            writer.writerow(row)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Multi-site benchmark')
+    parser.add_argument('--rows', type=int, default=50000, help='Historical receipts per site')
+    parser.add_argument('--receipts', type=int, default=20, help='Receipts issued per site')
+    args = parser.parse_args(argv)
+
+    failures = []
+    tmp_dir = tempfile.mkdtemp(prefix='swim-sites-')
+    try:
+        env = dict(os.environ, FLASK_ENV='production', PYTHONPATH=ROOT_DIR,
+                   DATABASE_URL='sqlite:///' + os.path.join(tmp_dir, 'sites.db'),
+                   KPI_COUNTERS_PATH=os.path.join(tmp_dir, 'kpi.bin'))
+        run_script(BOOTSTRAP_SCRIPT, env)
+        east = run_script(SETUP_SCRIPT, env)
+
+        source = os.path.join(tmp_dir, 'legacy.csv')
+        valid, _ = write_csv(source, args.rows)
+        east_source = os.path.join(tmp_dir, 'east.csv')
+        site_csv(source, east_source, 'EAST')
+        for path in (source, east_source):
+            subprocess.run(FLASK + ['import-receipts', path], cwd=ROOT_DIR, env=env, check=True,
+                           capture_output=True)
+        print(f'database: {valid:,} historical receipts in each of 2 sites')
+
+        per_site = {row[0]: row[1] for row in run_script(SQL_SCRIPT, env, (
+            "SELECT site_id, COUNT(*) FROM receipts WHERE created_at >= '2019-02-01' "
+            "AND created_at < '2019-03-01' GROUP BY site_id"))}
+        for site_id, prefix, username in ((1, 'SWIM', OPERATORS[0]),
+                                          (east, 'EAST', 'east-' + OPERATORS[0])):
+            print(f'\nsite {site_id} ({prefix})')
+            result = run_script(SITE_SCRIPT, env, str(site_id), username, str(args.receipts))
+            sequence = [int(number.rsplit('-', 1)[1]) for number in result['numbers']]
+            check(all(number.startswith(prefix + '-') for number in result['numbers'])
+                  and sequence == list(range(1, args.receipts + 1)),
+                  f'{args.receipts} receipts numbered {result["numbers"][0]} .. '
+                  f'{result["numbers"][-1]}', failures)
+            check(result['visible'] == valid + args.receipts and result['sites_seen'] == [site_id],
+                  f'{result["visible"]:,} receipts visible, all of site {result["sites_seen"]}',
+                  failures)
+            check(result['foreign_rejected'], "other site's fee item rejected", failures)
+            check(result['monthly_count'] == per_site[site_id],
+                  f'2019-02 report: {result["monthly_count"]:,} receipts '
+                  f'(site has {per_site[site_id]:,})', failures)
+            details = [detail for plan in result['plans'] for detail in plan
+                       if 'receipts' in detail and 'receipts_archive' not in detail]
+            unscoped = [d for d in details
+                        if 'ix_receipts_site_' not in d or 'created_at>' not in d]
+            check(details and not unscoped,
+                  f'{len(result["plans"])} report statement(s) use site-leading indexes '
+                  'on the date range'
+                  + (f': {unscoped}' if unscoped else ''), failures)
+            print(f"  daily report {result['timings']['daily'] * 1000:.1f} ms "
+                  f"({result['daily_count']} receipts), monthly summary "
+                  f"{result['timings']['monthly'] * 1000:.1f} ms")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    print('PASS' if not failures else f'{len(failures)} check(s) failed')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
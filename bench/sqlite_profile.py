@@ -0,0 +1,71 @@
+"""
+SQLite Engine Profile Benchmark - Compare SQLITE_PROFILE=default vs wal
+
+Runs the same create + report mix against a fresh SQLite database for each
+profile and prints throughput and latency side by side.
+
+Usage:
+    python -m bench.sqlite_profile --duration 30
+    python -m bench.sqlite_profile --profiles default,wal --json bench_output.json
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+from bench.loadtest import GunicornServer, run_load
+
+USERS = {'operator': 8, 'supervisor': 0, 'cashier': 0, 'reporter': 4}
+RATE = {'operator': 20.0, 'supervisor': 0, 'cashier': 0, 'reporter': 4.0}
+ACTIONS = ['create_receipt', 'daily_report', 'monthly_report']
+
+
+def run_profile(profile, args):
+    """Run one load test against a fresh database using the given profile"""
+    tmp_dir = tempfile.mkdtemp(prefix=f'swim-sqlite-{profile}-')
+    try:
+        database_url = 'sqlite:///' + os.path.join(tmp_dir, 'swim.db')
+        with GunicornServer(database_url, workers=args.workers,
+                            extra_env={'SQLITE_PROFILE': profile}) as server:
+            return run_load(server.base_url, USERS, RATE, args.duration)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='SQLite engine profile benchmark')
+    parser.add_argument('--profiles', default='default,wal')
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--json', dest='json_path')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for profile in args.profiles.split(','):
+        results[profile] = run_profile(profile.strip(), args)
+
+    print(f"\n{'profile':<10}{'action':<18}{'count':>8}{'err':>6}{'req/s':>9}"
+          f"{'p50':>9}{'p95':>9}{'p99':>9}")
+    print('-' * 78)
+    for profile, summary in results.items():
+        for action in ACTIONS:
+            s = summary['actions'].get(action)
+            if not s:
+                continue
+            print(f"{profile:<10}{action:<18}{s['count']:>8}{s['errors']:>6}"
+                  f"{s['throughput']:>9.2f}{s['p50_ms']:>9.1f}{s['p95_ms']:>9.1f}"
+                  f"{s['p99_ms']:>9.1f}")
+        print(f"{profile:<10}{'total':<18}{summary['requests']:>8}{summary['errors']:>6}"
+              f"{summary['throughput']:>9.2f}")
+        print('-' * 78)
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,205 @@
+"""
+Worker Startup Benchmark - Cold-start time budget and side-effect check
+
+Each measurement runs in a fresh interpreter, the way a gunicorn worker
+imports the WSGI module (`run:app`).
+
+Checks:
+    cold start  median time to `import run` must stay within --budget seconds
+    no writes   importing run must not execute any SQL nor create the database
+    lazy        ReportLab and openpyxl must not be imported by `import run`
+    RSS         worker RSS after import must stay within --rss-budget MB
+
+Also prints the slowest top-level packages from `python -X importtime` and
+the RSS once the PDF/spreadsheet engines have been loaded.
+
+Usage:
+    python -m bench.startup
+    python -m bench.startup --runs 10 --budget 1.5
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+TIMING_SCRIPT = '''
+import time
+start = time.perf_counter()
+import run
+print(time.perf_counter() - start)
+'''
+
+# Count every statement sent to any engine while the WSGI module is imported
+SIDE_EFFECT_SCRIPT = '''
+import json
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+statements = []
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def record(conn, cursor, statement, parameters, context, executemany):
+    statements.append(statement)
+
+@event.listens_for(Engine, 'connect')
+def record_connect(dbapi_connection, connection_record):
+    statements.append('<connect>')
+
+import run
+print(json.dumps(statements))
+'''
+
+HEAVY_MODULES = ['reportlab', 'openpyxl']
+
+# RSS of an idle worker, then after loading the PDF and spreadsheet engines
+MEMORY_SCRIPT = '''
+import json, sys
+
+def rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+import run
+idle = rss_mb()
+heavy = [name for name in %r if name in sys.modules]
+from app.services import preload_optional_modules
+preload_optional_modules()
+print(json.dumps({'idle_mb': idle, 'loaded_mb': rss_mb(), 'heavy_on_import': heavy}))
+''' % (HEAVY_MODULES,)
+
+
+def run_script(script, env):
+    """Run a Python snippet in a fresh interpreter and return its stdout"""
+    result = subprocess.run([sys.executable, '-c', script], cwd=ROOT_DIR, env=env,
+                            check=True, capture_output=True, text=True)
+    return result.stdout.strip().splitlines()[-1]
+
+
+def import_times(env, top=10):
+    """Return the slowest top-level packages as (name, self microseconds) from -X importtime"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import run'],
+                            cwd=ROOT_DIR, env=env, check=True, capture_output=True, text=True)
+    totals = {}
+    for line in result.stderr.splitlines():
+        # Format: "import time: <self us> | <cumulative us> | <indented module>"
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = [part.strip() for part in line[len('import time:'):].split('|')]
+        package = name.split('.')[0]
+        totals[package] = totals.get(package, 0) + int(self_us)
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top]
+
+
+def make_env(tmp_dir):
+    """Production settings against a database file that does not exist yet"""
+    db_path = os.path.join(tmp_dir, 'swim.db')
+    env = dict(os.environ, FLASK_ENV='production', DATABASE_URL='sqlite:///' + db_path)
+    return env, db_path
+
+
+def measure_cold_start(runs):
+    """Return import times (seconds) of the WSGI module over fresh interpreters"""
+    tmp_dir = tempfile.mkdtemp(prefix='swim-startup-')
+    try:
+        env, _ = make_env(tmp_dir)
+        return [float(run_script(TIMING_SCRIPT, env)) for _ in range(runs)]
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def check_side_effects():
+    """Return (statements executed, database file created) for one import"""
+    tmp_dir = tempfile.mkdtemp(prefix='swim-startup-')
+    try:
+        env, db_path = make_env(tmp_dir)
+        statements = json.loads(run_script(SIDE_EFFECT_SCRIPT, env))
+        return statements, os.path.exists(db_path)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def measure_memory():
+    """Return RSS figures and heavy modules imported by the WSGI module"""
+    tmp_dir = tempfile.mkdtemp(prefix='swim-startup-')
+    try:
+        env, _ = make_env(tmp_dir)
+        memory = json.loads(run_script(MEMORY_SCRIPT, env))
+        memory['import_times'] = import_times(env)
+        return memory
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Worker startup benchmark')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=2.0,
+                        help='Maximum median cold-start time in seconds')
+    parser.add_argument('--rss-budget', type=float, default=150,
+                        help='Maximum worker RSS after import in MB')
+    parser.add_argument('--json', dest='json_path')
+    args = parser.parse_args(argv)
+
+    timings = measure_cold_start(args.runs)
+    statements, db_created = check_side_effects()
+    memory = measure_memory()
+    median = statistics.median(timings)
+
+    print(f'cold start (import run): min {min(timings) * 1000:.0f} ms, '
+          f'median {median * 1000:.0f} ms, max {max(timings) * 1000:.0f} ms '
+          f'(budget {args.budget * 1000:.0f} ms)')
+    print(f'database statements on import: {len(statements)}, '
+          f'database file created: {"yes" if db_created else "no"}')
+    for statement in statements[:10]:
+        print(f'  {statement.splitlines()[0][:100]}')
+    print(f"worker RSS: {memory['idle_mb']:.1f} MB after import, "
+          f"{memory['loaded_mb']:.1f} MB with ReportLab/openpyxl loaded "
+          f"(budget {args.rss_budget:.0f} MB)")
+    print(f"heavy modules on import: {', '.join(memory['heavy_on_import']) or 'none'}")
+    print('slowest packages (-X importtime, self time):')
+    for package, self_us in memory['import_times']:
+        print(f'  {package:<24}{self_us / 1000:>8.1f} ms')
+
+    failures = []
+    if median > args.budget:
+        failures.append('cold start over budget')
+    if statements or db_created:
+        failures.append('import touched the database')
+    if memory['heavy_on_import']:
+        failures.append('heavy modules imported eagerly')
+    if memory['idle_mb'] > args.rss_budget:
+        failures.append('worker RSS over budget')
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'timings_s': timings,
+                'median_s': median,
+                'budget_s': args.budget,
+                'statements': statements,
+                'database_created': db_created,
+                'memory': memory,
+            }, f, indent=2)
+
+    if failures:
+        print('FAIL: ' + ', '.join(failures))
+        return 1
+    print('OK')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,236 @@
+"""
+Template Rendering Benchmark - Compile and render cost of report pages
+
+Measures, in-process and without a database:
+    compile    time to compile every template from source, and to load the
+               same templates from a warm bytecode cache (worker restart)
+    render     median render time of the row-heavy pages at each row count,
+               with synthetic receipts (plain objects with the receipt fields); streamed pages
+               (daily/monthly reports) also report the time to first chunk
+
+The receipt list is paginated (ITEMS_PER_PAGE rows) and is rendered at that
+size only.
+
+Usage:
+    python -m bench.templates
+    python -m bench.templates --rows 1000,10000 --runs 5 --json templates.json
+"""
+import argparse
+import json
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+
+from flask import render_template
+
+from app import create_app, DemoUser
+from app.templating import configure_templates, precompile_templates, stream_page
+
+
+def make_receipts(count):
+    """Synthetic receipts, newest first, ~3% voided"""
+    start = datetime(2025, 1, 31, 21, 0)
+    receipts = []
+    for i in range(count):
+        status = 'voided' if i % 33 == 0 else 'active'
+        receipts.append(SimpleNamespace(
+            id=i + 1,
+            receipt_no=f'SWIM20250131{i:05d}',
+            created_at=start - timedelta(seconds=30 * i),
+            item_name=('單次票', '十次票', '月票', '游泳課')[i % 4],
+            amount=Decimal(('100', '900', '1500', '2400')[i % 4]),
+            remark=None,
+            status=status,
+            status_display='正常' if status == 'active' else '已作廢',
+            operator_name='櫃台一',
+            is_verified=i % 2 == 0,
+        ))
+    return receipts
+
+
+def make_summary(receipts):
+    active = [r for r in receipts if r.status == 'active']
+    voided = [r for r in receipts if r.status == 'voided']
+    active_total = sum((r.amount for r in active), Decimal('0'))
+    return {
+        'total_count': len(receipts),
+        'active_count': len(active),
+        'active_total': active_total,
+        'voided_count': len(voided),
+        'voided_total': sum((r.amount for r in voided), Decimal('0')),
+        'net_total': active_total,
+        'net_total_chinese': '壹佰萬元整',
+    }
+
+
+def make_monthly_report(receipts):
+    summary = make_summary(receipts)
+    breakdown = {}
+    for r in receipts:
+        if r.status != 'active':
+            continue
+        entry = breakdown.setdefault(r.item_name, {'count': 0, 'total': Decimal('0')})
+        entry['count'] += 1
+        entry['total'] += r.amount
+    for entry in breakdown.values():
+        entry['percentage'] = float(entry['total']) / float(summary['active_total'] or 1) * 100
+    return {
+        'year': 2025, 'month': 1,
+        'period_start': date(2025, 1, 1), 'period_end': date(2025, 1, 31),
+        'receipts': receipts, 'summary': summary, 'item_breakdown': breakdown,
+    }
+
+
+def with_row_stream(context, receipts):
+    """Copy of a page context whose report rows are a one-shot iterator (cursor stand-in)"""
+    context = dict(context)
+    context['report'] = dict(context['report'], receipts=iter(receipts))
+    return context
+
+
+class Page:
+    """Minimal stand-in for a Flask-SQLAlchemy pagination object"""
+
+    def __init__(self, items):
+        self.items = items
+        self.page = 1
+        self.pages = 1
+        self.has_prev = False
+        self.has_next = False
+        self.prev_num = None
+        self.next_num = None
+
+    def iter_pages(self, **kwargs):
+        return iter([1])
+
+
+# Pages served with stream_page (rows consumed from an iterator)
+STREAMED = {'report/daily.html', 'report/monthly.html'}
+
+# Template name -> context builder taking the synthetic receipts
+PAGES = {
+    'report/daily.html': lambda receipts: {'report': {
+        'date': date(2025, 1, 31), 'receipts': receipts, 'summary': make_summary(receipts),
+    }},
+    'report/monthly.html': lambda receipts: {'report': make_monthly_report(receipts)},
+    'report/monthly_print.html': lambda receipts: {'report': make_monthly_report(receipts)},
+    'verify/operator_detail.html': lambda receipts: {
+        'operator': DemoUser(),
+        'summary': {
+            'period_start': date(2025, 1, 1), 'period_end': date(2025, 1, 31),
+            'unverified_count': len(receipts),
+            'unverified_amount': sum((r.amount for r in receipts), Decimal('0')),
+            'unverified_receipts': receipts,
+        },
+    },
+}
+
+
+def new_app(cache_dir=None):
+    app = create_app('testing')
+    app.config['TEMPLATE_CACHE_DIR'] = cache_dir
+    configure_templates(app)
+    return app
+
+
+def measure_compile():
+    """Return (seconds from source, seconds from warm bytecode cache, template count)"""
+    cache_dir = tempfile.mkdtemp(prefix='swim-templates-')
+    try:
+        start = time.perf_counter()
+        count = precompile_templates(new_app(cache_dir))
+        from_source = time.perf_counter() - start
+
+        start = time.perf_counter()
+        precompile_templates(new_app(cache_dir))
+        from_cache = time.perf_counter() - start
+        return from_source, from_cache, count
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def measure_render(app, name, context, runs):
+    """Return (median seconds, output size in bytes) of rendering a template"""
+    timings = []
+    with app.test_request_context('/'):
+        html = render_template(name, **context)  # Warm-up: compile and fill caches
+        for _ in range(runs):
+            start = time.perf_counter()
+            render_template(name, **context)
+            timings.append(time.perf_counter() - start)
+    return statistics.median(timings), len(html.encode('utf-8'))
+
+
+def measure_stream(app, name, context, receipts, runs):
+    """Return (median seconds to first chunk, median seconds to last chunk) of a streamed page"""
+    first, total = [], []
+    for _ in range(runs + 1):
+        with app.test_request_context('/'):
+            start = time.perf_counter()
+            chunks = iter(stream_page(name, **with_row_stream(context, receipts)).response)
+            next(chunks)
+            first_chunk = time.perf_counter() - start
+            for _ in chunks:
+                pass
+            first.append(first_chunk)
+            total.append(time.perf_counter() - start)
+    # Drop the warm-up run
+    return statistics.median(first[1:]), statistics.median(total[1:])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Template rendering benchmark')
+    parser.add_argument('--rows', default='1000,10000',
+                        help='Comma-separated row counts')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--json', dest='json_path')
+    args = parser.parse_args(argv)
+
+    row_counts = [int(n) for n in args.rows.split(',') if n]
+
+    from_source, from_cache, count = measure_compile()
+    print(f'compile {count} templates: {from_source * 1000:.1f} ms from source, '
+          f'{from_cache * 1000:.1f} ms from bytecode cache')
+
+    app = new_app()
+    results = []
+    page_rows = app.config['ITEMS_PER_PAGE']
+    page_receipts = make_receipts(page_rows)
+    cases = [('receipt/list.html', page_receipts, {'receipts': Page(page_receipts)})]
+    for rows in row_counts:
+        receipts = make_receipts(rows)
+        cases.extend((name, receipts, build(receipts)) for name, build in PAGES.items())
+
+    print(f"{'template':<30}{'rows':>8}{'median ms':>12}{'us/row':>10}{'KB':>10}"
+          f"{'first chunk ms':>16}")
+    for name, receipts, context in cases:
+        rows = len(receipts)
+        seconds, size = measure_render(app, name, context, args.runs)
+        result = {'template': name, 'rows': rows, 'median_s': seconds, 'bytes': size}
+        first_chunk = ''
+        if name in STREAMED:
+            result['stream_first_s'], result['stream_total_s'] = measure_stream(
+                app, name, context, receipts, args.runs
+            )
+            first_chunk = f"{result['stream_first_s'] * 1000:.1f}"
+        results.append(result)
+        print(f'{name:<30}{rows:>8}{seconds * 1000:>12.1f}'
+              f'{seconds * 1e6 / rows:>10.1f}{size / 1024:>10.0f}{first_chunk:>16}')
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'compile': {'templates': count, 'from_source_s': from_source,
+                            'from_cache_s': from_cache},
+                'render': results,
+            }, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
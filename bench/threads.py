@@ -0,0 +1,187 @@
+"""
+Thread-Safety Check - Counter, PDF and report traffic on one app, many threads
+
+Runs the application in-process (as one gthread worker would) and drives
+it from several threads at once through the Flask test client:
+
+    operator    create receipt -> download its PDF
+    reporter    daily report -> monthly report
+    cashier     monthly report PDF export
+
+Checks:
+    no errors       every request answers below 400 (create: 302)
+    unique numbers  no receipt number was issued twice
+    PDFs            every PDF is complete and uses the same font
+    reports         the daily report lists every receipt created
+
+Usage:
+    python -m bench.threads
+    python -m bench.threads --threads 16 --duration 20
+"""
+import argparse
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+
+PRINT_URL_RE = re.compile(r'/receipt/(\d+)/print')
+RECEIPT_NO_RE = re.compile(r'[A-Z]+-\d{8}-\d{4,}')
+FONT_RE = re.compile(rb'/BaseFont /([\w+-]+)')
+
+# Fee item ids created by init_default_data (admission and passes)
+FEE_ITEM_IDS = [1, 2, 3, 4, 5, 6, 7]
+
+
+class Results:
+    """Thread-safe collector"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = Counter()
+        self.errors = defaultdict(list)
+        self.receipt_ids = []
+        self.fonts = Counter()
+
+    def record(self, action, ok, detail=''):
+        with self._lock:
+            self.requests[action] += 1
+            if not ok:
+                self.errors[action].append(detail)
+
+    def add_pdf(self, data):
+        fonts = frozenset(f.decode() for f in FONT_RE.findall(data))
+        with self._lock:
+            self.fonts[fonts] += 1
+
+
+def operator(client, results):
+    response = client.post('/receipt/create', data={
+        'item_id': random.choice(FEE_ITEM_IDS),
+        'amount': random.choice([50, 80, 150, 800]),
+        'remark': 'threads',
+    })
+    match = PRINT_URL_RE.search(response.headers.get('Location', ''))
+    results.record('create_receipt', response.status_code == 302 and match is not None,
+                   f'{response.status_code}')
+    if not match:
+        return
+    receipt_id = int(match.group(1))
+    with results._lock:
+        results.receipt_ids.append(receipt_id)
+
+    response = client.get(f'/receipt/{receipt_id}/pdf')
+    ok = response.status_code == 200 and response.data.startswith(b'%PDF') \
+        and response.data.rstrip().endswith(b'%%EOF')
+    results.record('download_pdf', ok, f'{response.status_code}')
+    if ok:
+        results.add_pdf(response.data)
+
+
+def reporter(client, results):
+    for action, path in (('daily_report', '/report/daily'), ('monthly_report', '/report/monthly')):
+        response = client.get(path)
+        response.get_data()  # Consume streamed pages
+        results.record(action, response.status_code == 200, f'{response.status_code}')
+
+
+def cashier(app, results):
+    from app.services.export_service import ExportService
+    from app.timezone import today_tw
+
+    today = today_tw()
+    try:
+        with app.app_context():
+            _, _, buffer = ExportService.monthly_pdf(today.year, today.month)
+        data = buffer.getvalue()
+        ok = data.startswith(b'%PDF')
+        results.record('monthly_pdf', ok)
+        if ok:
+            results.add_pdf(data)
+    except Exception as e:  # Report every failure, keep the other threads going
+        results.record('monthly_pdf', False, repr(e))
+
+
+def run_thread(app, role, results, deadline):
+    client = app.test_client()
+    while time.monotonic() < deadline:
+        try:
+            if role == 'cashier':
+                cashier(app, results)
+            elif role == 'reporter':
+                reporter(client, results)
+            else:
+                operator(client, results)
+        except Exception as e:
+            results.record(role, False, repr(e))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Thread-safety check')
+    parser.add_argument('--threads', type=int, default=8, help='Concurrent threads')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds')
+    args = parser.parse_args(argv)
+
+    tmp_dir = tempfile.mkdtemp(prefix='swim-threads-')
+    os.environ.update(FLASK_ENV='production',
+                      DATABASE_URL='sqlite:///' + os.path.join(tmp_dir, 'threads.db'))
+    try:
+        from app import create_app, db
+        from app.commands import bootstrap_database
+
+        app = create_app('production')
+        with app.app_context():
+            bootstrap_database()
+
+        # Half operators, the rest split between reports and PDF exports
+        roles = ['operator'] * max(1, args.threads // 2)
+        roles += ['reporter', 'cashier'] * ((args.threads - len(roles) + 1) // 2)
+        results = Results()
+        deadline = time.monotonic() + args.duration
+        threads = [threading.Thread(target=run_thread, args=(app, role, results, deadline))
+                   for role in roles[:args.threads]]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - start
+
+        with app.app_context():
+            from app.models import Receipt
+            numbers = [no for (no,) in db.session.query(Receipt.receipt_no)]
+            daily = app.test_client().get('/report/daily').get_data(as_text=True)
+            db.engine.dispose()
+        listed = set(RECEIPT_NO_RE.findall(daily))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    print(f'{len(threads)} threads, {elapsed:.1f}s')
+    for action, count in sorted(results.requests.items()):
+        errors = results.errors.get(action, [])
+        print(f'  {action:<16}{count:>7} requests{len(errors):>6} errors'
+              f"  {', '.join(sorted(set(errors))[:3])}")
+
+    failures = []
+    if results.errors:
+        failures.append('requests failed')
+    duplicates = [no for no, count in Counter(numbers).items() if count > 1]
+    if duplicates:
+        failures.append(f'{len(duplicates)} duplicate receipt numbers')
+    if len(results.fonts) > 1:
+        failures.append(f'PDFs embed different fonts: {sorted(map(sorted, results.fonts))}')
+    missing = set(numbers) - listed
+    if missing:
+        failures.append(f'{len(missing)} receipts missing from the daily report')
+
+    print(f'  {len(numbers)} receipts, {len(results.fonts)} font set(s) in PDFs')
+    print('PASS' if not failures else 'FAIL: ' + '; '.join(failures))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -19,9 +19,21 @@ if env != 'production':
 app = create_app(env)
 
 if __name__ == '__main__':
+    debug = env == 'development'
+
+    # Local development: create tables and default data on first run
+    from app.commands import bootstrap_database
+    with app.app_context():
+        bootstrap_database()
+
+    # Local development: run background jobs in this process
+    # (the reloader parent does not serve requests, so skip it)
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        from app.services.job_service import start_worker_threads
+        start_worker_threads(app, 1)
+
     # Local development server
     port = int(os.environ.get('PORT', 8989))
-    debug = env == 'development'
 
     print('=' * 50)
     print('Swimming Pool Receipt System (Demo Mode)')